@@ -13,27 +13,16 @@ Original file is located at
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# 1) Load
-df = pd.read_csv('SBAnational.csv')
+from sba.clean import load_clean, load_typed
+
+# 1) Load only the used columns with an explicit schema.
+#    Currency and date columns are decoded here, and the target /
+#    LowDoc / RevLineCr / UrbanRural flags are derived from them.
+#    The typed frame is cached under .sba_cache/ keyed by the CSV content.
+df = load_typed('SBAnational.csv')
 df.head()
 print(df.dtypes)
 
-# Clean currency columns
-currency_cols = ['DisbursementGross', 'BalanceGross', 'GrAppv', 'SBA_Appv', 'ChgOffPrinGr']
-for col in currency_cols:
-    df[col] = pd.to_numeric(df[col].astype(str).str.replace('[\$,]', '', regex=True), errors='coerce')
-
-# Parse datetime columns
-df['ApprovalDate'] = pd.to_datetime(df['ApprovalDate'], errors='coerce')
-df['DisbursementDate'] = pd.to_datetime(df['DisbursementDate'], errors='coerce')
-df['ChgOffDate'] = pd.to_datetime(df['ChgOffDate'], errors='coerce')
-
-# Target variable
-df['MIS_Status_Binary'] = df['MIS_Status'].map({'P I F': 0, 'CHGOFF': 1})
-df['LowDoc_Binary'] = df['LowDoc'].map({'Y': 1, 'N': 0})
-df['RevLineCr_Binary'] = df['RevLineCr'].map({'Y': 1, 'N': 0})
-df['UrbanRural_Numeric'] = pd.to_numeric(df['UrbanRural'], errors='coerce')
-
 numeric_features = [
     'Term', 'NoEmp', 'CreateJob', 'RetainedJob',
     'FranchiseCode', 'DisbursementGross', 'BalanceGross',
@@ -98,7 +87,10 @@ plt.show()
 3. **Loans Backed by Real Estate**
 """
 
-df['RealEstate']=df['Term'].apply(lambda x: 1 if x >= 240 else 0)
+# RealEstate, Recession, NAICS2 and GuaranteeRatio are derived in one pass
+from sba.features import add_features
+
+df = add_features(df)
 df['RealEstate'].value_counts()
 
 grouped = df.groupby('RealEstate')['MIS_Status_Binary']
@@ -126,14 +118,10 @@ plt.show()
 4. **Economic Recession**
 """
 
-recession_start = pd.to_datetime('2007-12-01')
-recession_end   = pd.to_datetime('2009-06-30')
-
 # Make sure ApprovalDate is datetime and drop rows missing it
 df = df[df['ApprovalDate'].notna()]
 
-# Create Recession dummy:
-df['Recession'] = df['ApprovalDate'].between(recession_start, recession_end).astype(int)
+# Recession dummy (2007-12-01 .. 2009-06-30) comes from add_features above
 print(df['Recession'].value_counts())
 
 # Compute default and pay-in-full rates by Recession flag
@@ -214,8 +202,6 @@ plt.show()
 
 df.columns
 
-df['NAICS2'] = df['NAICS'].astype(int).astype(str).str[:2]
-
 # Compute counts and default rates by sector
 industry_stats = (
     df
@@ -277,9 +263,6 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.metrics import classification_report, roc_auc_score, confusion_matrix, make_scorer
 
-# Recompute engineered feature
-df['GuaranteeRatio'] = df['SBA_Appv'] / df['GrAppv']
-
 # Check for NoEmployee
 df['NoEmp'] = pd.to_numeric(df['NoEmp'], errors='coerce')
 
@@ -637,9 +620,10 @@ print("Maximum ApprovalFY:", df['ApprovalFY'].max())
 # Check initial number of rows
 initial_count = df.shape[0]
 
-# Drop rows with ApprovalFY > 2025
-df['ApprovalFY'] = pd.to_numeric(df['ApprovalFY'], errors='coerce')
-df_cleaned = df[df['ApprovalFY'] <= 2025]
+# Drop rows with ApprovalFY > 2025 and join the macro series
+# (InflationRate, GDPGrowth, InterestRate). The cleaned frame is cached
+# on disk too, so later runs re-open it instead of rebuilding it.
+df_cleaned = load_clean('SBAnational.csv')
 
 # Check new number of rows
 final_count = df_cleaned.shape[0]
@@ -658,149 +642,10 @@ print("Unique values in ApprovalFY:", df_cleaned['ApprovalFY'].unique())
 print("Minimum ApprovalFY:", df_cleaned['ApprovalFY'].min())
 print("Maximum ApprovalFY:", df_cleaned['ApprovalFY'].max())
 
-# Create InflationRate
-df['ApprovalFY_int'] = df['ApprovalFY'].astype(int)
-
-
 # Minimum ApprovalFY: 1962.0
 # Maximum ApprovalFY: 2014.0
 
-inflation_dict = {
-    1962: 1.30, 1963: 1.60, 1964: 1.00, 1965: 1.90, 1966: 3.50, 1967: 3.00, 1968: 4.70,
-    1969: 6.20, 1970: 5.60, 1971: 3.30, 1972: 3.40, 1973: 8.70, 1974: 12.30, 1975: 6.90,
-    1976: 4.90, 1977: 6.70, 1978: 9.00, 1979: 13.30, 1980: 12.50, 1981: 8.90, 1982: 3.80,
-    1983: 3.80, 1984: 3.90, 1985: 3.80, 1986: 1.10, 1987: 4.40, 1988: 4.40, 1989: 4.60,
-    1990: 6.10, 1991: 3.10, 1992: 2.90, 1993: 2.70, 1994: 2.70, 1995: 2.50, 1996: 3.30,
-    1997: 1.70, 1998: 1.60, 1999: 2.70, 2000: 3.40, 2001: 1.60, 2002: 2.40, 2003: 1.90,
-    2004: 3.30, 2005: 3.40, 2006: 2.50, 2007: 4.10, 2008: 0.10, 2009: 2.70, 2010: 1.50,
-    2011: 3.00, 2012: 1.70, 2013: 1.50, 2014: 0.80
-}
-
-
-
-df_cleaned['InflationRate'] = df_cleaned['ApprovalFY'].map(inflation_dict)
-
-print(df_cleaned[['ApprovalFY', 'InflationRate']].dropna().head())
-
-# GDP Growth
-gdp_growth = {
-    1962: 6.10,
-    1963: 4.40,
-    1964: 5.80,
-    1965: 6.40,
-    1966: 6.50,
-    1967: 2.50,
-    1968: 4.80,
-    1969: 3.10,
-    1970: 0.22,
-    1971: 3.29,
-    1972: 5.26,
-    1973: 5.65,
-    1974: -0.54,
-    1975: -0.21,
-    1976: 5.39,
-    1977: 4.62,
-    1978: 5.54,
-    1979: 3.17,
-    1980: -0.26,
-    1981: 2.54,
-    1982: -1.80,
-    1983: 4.58,
-    1984: 7.24,
-    1985: 4.17,
-    1986: 3.46,
-    1987: 3.45,
-    1988: 4.18,
-    1989: 3.67,
-    1990: 1.89,
-    1991: -0.11,
-    1992: 3.52,
-    1993: 2.75,
-    1994: 4.03,
-    1995: 2.68,
-    1996: 3.77,
-    1997: 4.45,
-    1998: 4.48,
-    1999: 4.79,
-    2000: 4.08,
-    2001: 0.96,
-    2002: 1.70,
-    2003: 2.80,
-    2004: 3.85,
-    2005: 3.48,
-    2006: 2.78,
-    2007: 2.00,
-    2008: 0.11,
-    2009: -2.58,
-    2010: 2.70,
-    2011: 1.56,
-    2012: 2.29,
-    2013: 2.12,
-    2014: 2.52,
-}
-
-df_cleaned['GDPGrowth'] = df_cleaned['ApprovalFY'].astype(int).map(gdp_growth)
-
-
-# Interest rate
-interest_rate = {
-    1961: 3.11,
-    1962: 3.22,
-    1963: 3.37,
-    1964: 2.95,
-    1965: 2.57,
-    1966: 2.65,
-    1967: 2.41,
-    1968: 1.86,
-    1969: 2.85,
-    1970: 2.51,
-    1971: 0.62,
-    1972: 0.88,
-    1973: 2.41,
-    1974: 1.65,
-    1975: -1.28,
-    1976: 1.27,
-    1977: 0.58,
-    1978: 1.89,
-    1979: 4.03,
-    1980: 5.72,
-    1981: 8.59,
-    1982: 8.18,
-    1983: 6.62,
-    1984: 8.14,
-    1985: 6.56,
-    1986: 6.19,
-    1987: 5.59,
-    1988: 5.59,
-    1989: 6.69,
-    1990: 6.04,
-    1991: 4.92,
-    1992: 3.88,
-    1993: 3.55,
-    1994: 4.90,
-    1995: 6.59,
-    1996: 6.32,
-    1997: 6.60,
-    1998: 7.15,
-    1999: 6.49,
-    2000: 6.81,
-    2001: 4.57,
-    2002: 3.07,
-    2003: 2.11,
-    2004: 1.61,
-    2005: 2.96,
-    2006: 4.73,
-    2007: 5.20,
-    2008: 3.10,
-    2009: 2.62,
-    2010: 2.01,
-    2011: 1.16,
-    2012: 1.36,
-    2013: 1.52,
-    2014: 1.48,
-}
-
-df_cleaned['InterestRate'] = df_cleaned['ApprovalFY'].astype(int).map(interest_rate)
+print(df_cleaned[['ApprovalFY', 'InflationRate', 'GDPGrowth', 'InterestRate']].dropna().head())
 
 # Define the final feature set (drop everything else)
 features = [
@@ -844,24 +689,6 @@ categorical_cols = [
 
 df_model[categorical_cols] = df_model[categorical_cols].astype(str)
 
-# One-hot encode categorical variables
-df_encoded = pd.get_dummies(df_model, columns=categorical_cols, drop_first=True)
-
-# Split into features (X) and target (y)
-X = df_encoded.drop(target, axis=1)
-y = df_encoded[target]
-disb = df_encoded['DisbursementGross'].values.copy()
-
-X_train, X_test, y_train, y_test, disb_train, disb_test = train_test_split(
-    X, y, disb,
-    test_size=0.90,
-    random_state=1,
-    stratify=y
-)
-
-print("X_train.shape:", X_train.shape)  
-print("X_test.shape: ", X_test.shape)  
-
 numeric_cols = [
     'Term',
     'DisbursementGross',
@@ -870,16 +697,41 @@ numeric_cols = [
     'InterestRate',
     'GDPGrowth']
 
-all_cols = X_train.columns.tolist()
-categorical_dummy_cols = [c for c in all_cols if c not in numeric_cols]
+# One-hot encode categorical variables into a sparse CSR design matrix:
+# numeric_cols first, then the same dummy columns pd.get_dummies(drop_first=True)
+# would create. The vocabulary is fixed by the encoder, and nothing is densified.
+# Set use_target_encoding = True to swap the dummies for out-of-fold target /
+# frequency encoding of FranchiseCode, State and NAICS2 (a few dozen columns).
+from sba.encoding import DummyEncoder, design_matrix, sparse_preprocessor, compact_preprocessor
+
+use_target_encoding = False
+
+if use_target_encoding:
+    X = df_model[numeric_cols + categorical_cols]
+    feature_names = list(X.columns)
+else:
+    encoder = DummyEncoder(categorical_cols).fit(df_model)
+    X, feature_names = design_matrix(df_model, encoder, numeric_cols)
+y = df_model[target]
+disb = df_model['DisbursementGross'].values.copy()
+row_index = df_model.index.values   # X rows -> df_model rows
+
+X_train, X_test, y_train, y_test, disb_train, disb_test, idx_train, idx_test = train_test_split(
+    X, y, disb, row_index,
+    test_size=0.90,
+    random_state=1,
+    stratify=y
+)
 
-from sklearn.compose import ColumnTransformer
+print("X_train.shape:", X_train.shape)  
+print("X_test.shape: ", X_test.shape)  
 
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', StandardScaler(), numeric_cols),
-        ('passthrough', 'passthrough', categorical_dummy_cols)],
-    remainder='drop')
+# Standardize the numeric block, pass the dummies through, output stays CSR
+# (target encoding is fitted inside each CV fold, out-of-fold on its train rows)
+if use_target_encoding:
+    preprocessor = compact_preprocessor(numeric_cols, categorical_cols)
+else:
+    preprocessor = sparse_preprocessor(len(numeric_cols))
 
 # -------------------------------
 # 8) Define Ridge and Lasso pipelines
@@ -917,23 +769,36 @@ lasso_pipe = Pipeline([
     ))
 ])
 
-# 9) Parameter distributions for RandomizedSearchCV
+# 9) Regularization grid: every C and class_weight. Each fold's C curve is
+#    one warm-started path costing about two cold saga fits, so the full
+#    20 x 2 grid is cheaper than the 20 sampled cold fits it replaces
+#    (nothing is sampled, hence no random_state)
 param_dist = {
     'clf__C': np.logspace(-4, 4, 20).tolist(),
     'clf__class_weight': [None, 'balanced']
 }
 
-# 10) RandomizedSearchCV for Ridge
-search_ridge = RandomizedSearchCV(
-    estimator=ridge_pipe,
-    param_distributions=param_dist,
-    n_iter=20,
+# 10) Regularization path search for Ridge
+#     For each fold and class_weight, C goes from strong to weak
+#     regularization and each fit starts from the previous coefficients;
+#     Lasso also screens features with the strong rule. Ridge and Lasso
+#     share the preprocessor and the 5 folds: the fold matrices are
+#     transformed once and reused by both searches.
+from sba.search import FoldCache
+from sba.path import LogisticPathCV
+
+fold_cache = FoldCache()
+
+search_ridge = LogisticPathCV(
+    ridge_pipe,
+    Cs=param_dist['clf__C'],
+    class_weights=param_dist['clf__class_weight'],
     scoring='roc_auc',
     cv=5,
     verbose=2,
-    random_state=42,
     n_jobs=-1,
-    refit=True
+    refit=True,
+    fold_cache=fold_cache
 )
 search_ridge.fit(X_train, y_train)
 best_ridge = search_ridge.best_estimator_
@@ -942,17 +807,17 @@ print("=== RIDGE (ℓ₂) LOGISTIC REGRESSION ===")
 print("Best hyperparameters:", search_ridge.best_params_)
 print("Best CV ROC AUC:   ", search_ridge.best_score_)
 
-# 11) RandomizedSearchCV for Lasso
-search_lasso = RandomizedSearchCV(
-    estimator=lasso_pipe,
-    param_distributions=param_dist,
-    n_iter=20,
+# 11) Regularization path search for Lasso
+search_lasso = LogisticPathCV(
+    lasso_pipe,
+    Cs=param_dist['clf__C'],
+    class_weights=param_dist['clf__class_weight'],
     scoring='roc_auc',
     cv=5,
     verbose=2,
-    random_state=42,
     n_jobs=-1,
-    refit=True
+    refit=True,
+    fold_cache=fold_cache
 )
 search_lasso.fit(X_train, y_train)
 best_lasso = search_lasso.best_estimator_
@@ -964,40 +829,19 @@ print("Best CV ROC AUC:   ", search_lasso.best_score_)
 # ==============================================
 # 12) Define net_profit & tune_threshold helpers
 # ==============================================
-def net_profit(y_true, y_pred, disbursement):
-    """
-    - y_true[i]: 0 = PIF, 1 = Default
-    - y_pred[i]: 0 = Grant loan, 1 = Deny loan
-    - disbursement[i]: DisbursementGross
-      grant + PIF     → +5% * amt
-      grant + Default → −25% * amt
-      deny            → 0
-    """
-    profit = 0.0
-    for truth, pred, amt in zip(y_true, y_pred, disbursement):
-        if pred == 0:
-            if truth == 0:
-                profit += 0.05 * amt
-            else:
-                profit -= 0.25 * amt
-        else:
-            if truth ==0:
-                profit -= 0.05*amt
-    return profit
+# net_profit applies the project cost matrix (sba.profit.DEFAULT_COSTS):
+# grant + PIF +5%, grant + Default -25%, deny + PIF -5% (opportunity cost)
+from sba.profit import net_profit, profit_curve
 
 def tune_threshold(y_true, prob_default, disbursement, plot=True):
-    thresholds = np.arange(0.00, 1.00, 0.01)
-    profits = []
-    for t in thresholds:
-        y_pred = (prob_default >= t).astype(int)
-        profits.append(net_profit(y_true, y_pred, disbursement))
-    profits = np.array(profits)
+    # exact profit at every distinct score (one sort), not a 0.01 grid
+    thresholds, profits = profit_curve(y_true, prob_default, disbursement)
     best_idx       = np.nanargmax(profits)
     best_threshold = thresholds[best_idx]
     max_profit     = profits[best_idx]
     if plot:
         plt.figure(figsize=(8,4))
-        plt.plot(thresholds, profits, marker='o', color='orange', label='Net Profit')
+        plt.plot(thresholds, profits, drawstyle='steps-pre', color='orange', label='Net Profit')
         plt.axvline(x=best_threshold, color='red', linestyle='--',
                     label=f'Best Threshold = {best_threshold:.2f}')
         plt.title("Threshold vs Net Profit")
@@ -1014,7 +858,11 @@ def tune_threshold(y_true, prob_default, disbursement, plot=True):
 # ==============================================
 print("\n=== EVALUATION ON TEST SET (RIDGE) ===")
 
+# Scores sorted once per model: ROC, AUC and confusion counts come from the same sums
+from sba.evaluate import ScoreCurve
+
 probs_default_ridge = best_ridge.predict_proba(X_test)[:, 1]
+curve_ridge = ScoreCurve(y_test.values, probs_default_ridge, disb_test)   # sorted once
 
 # 13.1) Classification report @ threshold = 0.5
 y_pred_05_ridge = (probs_default_ridge < 0.5).astype(int)  # 0=grant if P(Default)<0.5
@@ -1022,15 +870,15 @@ print("\n-- Classification Report (threshold = 0.5) --")
 print(classification_report(y_test, y_pred_05_ridge, digits=4))
 print("Confusion Matrix (threshold = 0.5):")
 print(confusion_matrix(y_test, y_pred_05_ridge))
-print("Test ROC AUC:", roc_auc_score(y_test, probs_default_ridge))
+print("Test ROC AUC:", curve_ridge.auc())
 
 # 13.2) Net Profit @ threshold = 0.5
 profit_05_ridge = net_profit(y_test.values, y_pred_05_ridge, disb_test)
 print(f"Net Profit (Ridge) at threshold = 0.5: ${profit_05_ridge:,.2f}")
 
 # 13.3) ROC Curve
-fpr_r, tpr_r, _ = roc_curve(y_test, probs_default_ridge)
-roc_auc_r = auc(fpr_r, tpr_r)
+fpr_r, tpr_r, _ = curve_ridge.roc()
+roc_auc_r = curve_ridge.auc()
 plt.figure(figsize=(6,4))
 plt.plot(fpr_r, tpr_r, color='blue', lw=2, label=f'AUC = {roc_auc_r:.4f}')
 plt.plot([0,1],[0,1],'k--')
@@ -1057,7 +905,7 @@ y_pred_opt_ridge = (probs_default_ridge >= best_thresh_ridge).astype(int)
 print("\n-- Classification Report (optimized threshold) --")
 print(classification_report(y_test, y_pred_opt_ridge, digits=4))
 print("Confusion Matrix (optimized threshold):")
-print(confusion_matrix(y_test, y_pred_opt_ridge))
+print(curve_ridge.confusion(best_thresh_ridge))
 
 # ==============================================
 # 14) Evaluate Lasso on the TEST set
@@ -1065,6 +913,7 @@ print(confusion_matrix(y_test, y_pred_opt_ridge))
 print("\n=== EVALUATION ON TEST SET (LASSO) ===")
 
 probs_default_lasso = best_lasso.predict_proba(X_test)[:, 1]
+curve_lasso = ScoreCurve(y_test.values, probs_default_lasso, disb_test)   # sorted once
 
 # 14.1) Classification report @ threshold = 0.5
 y_pred_05_lasso = (probs_default_lasso < 0.5).astype(int)
@@ -1072,15 +921,15 @@ print("\n-- Classification Report (threshold = 0.5) --")
 print(classification_report(y_test, y_pred_05_lasso, digits=4))
 print("Confusion Matrix (threshold = 0.5):")
 print(confusion_matrix(y_test, y_pred_05_lasso))
-print("Test ROC AUC:", roc_auc_score(y_test, probs_default_lasso))
+print("Test ROC AUC:", curve_lasso.auc())
 
 # 14.2) Net Profit @ threshold = 0.5
 profit_05_lasso = net_profit(y_test.values, y_pred_05_lasso, disb_test)
 print(f"Net Profit (Lasso) at threshold = 0.5: ${profit_05_lasso:,.2f}")
 
 # 14.3) ROC Curve
-fpr_l, tpr_l, _ = roc_curve(y_test, probs_default_lasso)
-roc_auc_l = auc(fpr_l, tpr_l)
+fpr_l, tpr_l, _ = curve_lasso.roc()
+roc_auc_l = curve_lasso.auc()
 plt.figure(figsize=(6,4))
 plt.plot(fpr_l, tpr_l, color='green', lw=2, label=f'AUC = {roc_auc_l:.4f}')
 plt.plot([0,1],[0,1],'k--')
@@ -1107,7 +956,7 @@ y_pred_opt_lasso = (probs_default_lasso >= best_thresh_lasso).astype(int)
 print("\n-- Classification Report (optimized threshold) --")
 print(classification_report(y_test, y_pred_opt_lasso, digits=4))
 print("Confusion Matrix (optimized threshold):")
-print(confusion_matrix(y_test, y_pred_opt_lasso))
+print(curve_lasso.confusion(best_thresh_lasso))
 
 # ==============================================
 # 15) Compute Rate of Return (ROI) for both models
@@ -1158,6 +1007,28 @@ print(f"ROI (Lasso) at optimal threshold = {best_thresh_lasso:.2f}: {roi_opt_las
 
 
 
+# ==============================================
+# 16) Ridge vs Lasso side by side
+# ==============================================
+# One pass over both score columns: optimal threshold, profit, ROI and
+# confusion counts per model. Add the KNN / RF / MLP P(Default) columns
+# here to compare every model on the same test loans.
+from sba.evaluate import compare_models
+
+comparison, profit_curves = compare_models(
+    {'Ridge': probs_default_ridge, 'Lasso': probs_default_lasso},
+    y_test.values, disb_test)
+print(comparison)
+
+# Committee view: profit, default rate and capital at fixed approval rates,
+# read off each model's approval / profit frontier (one sort per model).
+from sba.evaluate import approval_frontier, frontier_at
+
+for name, probs in [('Ridge', probs_default_ridge), ('Lasso', probs_default_lasso)]:
+    frontier = approval_frontier(y_test.values, probs, disb_test)
+    print(f"\n{name}: approval rate vs net profit ({frontier['pareto'].sum()} Pareto points)")
+    print(frontier_at(frontier, approval_rate=[0.6, 0.7, 0.8, 0.9]).round(4))
+
 import joblib
 
 ridge_filename = 'ridge_model.joblib'
@@ -13,27 +13,16 @@ Original file is located at
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# 1) Load
-df = pd.read_csv('SBAnational.csv')
+from sba.clean import load_clean, load_typed
+
+# 1) Load only the used columns with an explicit schema.
+#    Currency and date columns are decoded here, and the target /
+#    LowDoc / RevLineCr / UrbanRural flags are derived from them.
+#    The typed frame is cached under .sba_cache/ keyed by the CSV content.
+df = load_typed('SBAnational.csv')
 df.head()
 print(df.dtypes)
 
-# Clean currency columns
-currency_cols = ['DisbursementGross', 'BalanceGross', 'GrAppv', 'SBA_Appv', 'ChgOffPrinGr']
-for col in currency_cols:
-    df[col] = pd.to_numeric(df[col].astype(str).str.replace('[\$,]', '', regex=True), errors='coerce')
-
-# Parse datetime columns
-df['ApprovalDate'] = pd.to_datetime(df['ApprovalDate'], errors='coerce')
-df['DisbursementDate'] = pd.to_datetime(df['DisbursementDate'], errors='coerce')
-df['ChgOffDate'] = pd.to_datetime(df['ChgOffDate'], errors='coerce')
-
-# Target variable
-df['MIS_Status_Binary'] = df['MIS_Status'].map({'P I F': 0, 'CHGOFF': 1})
-df['LowDoc_Binary'] = df['LowDoc'].map({'Y': 1, 'N': 0})
-df['RevLineCr_Binary'] = df['RevLineCr'].map({'Y': 1, 'N': 0})
-df['UrbanRural_Numeric'] = pd.to_numeric(df['UrbanRural'], errors='coerce')
-
 numeric_features = [
     'Term', 'NoEmp', 'CreateJob', 'RetainedJob',
     'FranchiseCode', 'DisbursementGross', 'BalanceGross',
@@ -98,7 +87,10 @@ plt.show()
 3. **Loans Backed by Real Estate**
 """
 
-df['RealEstate']=df['Term'].apply(lambda x: 1 if x >= 240 else 0)
+# RealEstate, Recession, NAICS2 and GuaranteeRatio are derived in one pass
+from sba.features import add_features
+
+df = add_features(df)
 df['RealEstate'].value_counts()
 
 grouped = df.groupby('RealEstate')['MIS_Status_Binary']
@@ -126,14 +118,10 @@ plt.show()
 4. **Economic Recession**
 """
 
-recession_start = pd.to_datetime('2007-12-01')
-recession_end   = pd.to_datetime('2009-06-30')
-
 # Make sure ApprovalDate is datetime and drop rows missing it
 df = df[df['ApprovalDate'].notna()]
 
-# Create Recession dummy:
-df['Recession'] = df['ApprovalDate'].between(recession_start, recession_end).astype(int)
+# Recession dummy (2007-12-01 .. 2009-06-30) comes from add_features above
 print(df['Recession'].value_counts())
 
 # Compute default and pay-in-full rates by Recession flag
@@ -214,8 +202,6 @@ plt.show()
 
 df.columns
 
-df['NAICS2'] = df['NAICS'].astype(int).astype(str).str[:2]
-
 # Compute counts and default rates by sector
 industry_stats = (
     df
@@ -277,9 +263,6 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.metrics import classification_report, roc_auc_score, confusion_matrix, make_scorer
 
-# Recompute engineered feature
-df['GuaranteeRatio'] = df['SBA_Appv'] / df['GrAppv']
-
 # Check for NoEmployee
 df['NoEmp'] = pd.to_numeric(df['NoEmp'], errors='coerce')
 
@@ -637,9 +620,10 @@ print("Maximum ApprovalFY:", df['ApprovalFY'].max())
 # Check initial number of rows
 initial_count = df.shape[0]
 
-# Drop rows with ApprovalFY > 2025
-df['ApprovalFY'] = pd.to_numeric(df['ApprovalFY'], errors='coerce')
-df_cleaned = df[df['ApprovalFY'] <= 2025]
+# Drop rows with ApprovalFY > 2025 and join the macro series
+# (InflationRate, GDPGrowth, InterestRate). The cleaned frame is cached
+# on disk too, so later runs re-open it instead of rebuilding it.
+df_cleaned = load_clean('SBAnational.csv')
 
 # Check new number of rows
 final_count = df_cleaned.shape[0]
@@ -657,149 +641,11 @@ print(f"Dropped rows: {dropped}")
 print("Unique values in ApprovalFY:", df_cleaned['ApprovalFY'].unique())
 print("Minimum ApprovalFY:", df_cleaned['ApprovalFY'].min())
 print("Maximum ApprovalFY:", df_cleaned['ApprovalFY'].max())
+
 # Minimum ApprovalFY: 1962.0
 # Maximum ApprovalFY: 2014.0
-df = df[df['ApprovalFY'].notna()]
-df['ApprovalFY_int'] = df['ApprovalFY'].astype(int)
-
-# Create InflationRate
-
-inflation_dict = {
-    1962: 1.30, 1963: 1.60, 1964: 1.00, 1965: 1.90, 1966: 3.50, 1967: 3.00, 1968: 4.70,
-    1969: 6.20, 1970: 5.60, 1971: 3.30, 1972: 3.40, 1973: 8.70, 1974: 12.30, 1975: 6.90,
-    1976: 4.90, 1977: 6.70, 1978: 9.00, 1979: 13.30, 1980: 12.50, 1981: 8.90, 1982: 3.80,
-    1983: 3.80, 1984: 3.90, 1985: 3.80, 1986: 1.10, 1987: 4.40, 1988: 4.40, 1989: 4.60,
-    1990: 6.10, 1991: 3.10, 1992: 2.90, 1993: 2.70, 1994: 2.70, 1995: 2.50, 1996: 3.30,
-    1997: 1.70, 1998: 1.60, 1999: 2.70, 2000: 3.40, 2001: 1.60, 2002: 2.40, 2003: 1.90,
-    2004: 3.30, 2005: 3.40, 2006: 2.50, 2007: 4.10, 2008: 0.10, 2009: 2.70, 2010: 1.50,
-    2011: 3.00, 2012: 1.70, 2013: 1.50, 2014: 0.80
-}
-
-
-
-df_cleaned['InflationRate'] = df_cleaned['ApprovalFY'].map(inflation_dict)
-
-print(df_cleaned[['ApprovalFY', 'InflationRate']].dropna().head())
-
-# GDP Growth
-gdp_growth = {
-    1962: 6.10,
-    1963: 4.40,
-    1964: 5.80,
-    1965: 6.40,
-    1966: 6.50,
-    1967: 2.50,
-    1968: 4.80,
-    1969: 3.10,
-    1970: 0.22,
-    1971: 3.29,
-    1972: 5.26,
-    1973: 5.65,
-    1974: -0.54,
-    1975: -0.21,
-    1976: 5.39,
-    1977: 4.62,
-    1978: 5.54,
-    1979: 3.17,
-    1980: -0.26,
-    1981: 2.54,
-    1982: -1.80,
-    1983: 4.58,
-    1984: 7.24,
-    1985: 4.17,
-    1986: 3.46,
-    1987: 3.45,
-    1988: 4.18,
-    1989: 3.67,
-    1990: 1.89,
-    1991: -0.11,
-    1992: 3.52,
-    1993: 2.75,
-    1994: 4.03,
-    1995: 2.68,
-    1996: 3.77,
-    1997: 4.45,
-    1998: 4.48,
-    1999: 4.79,
-    2000: 4.08,
-    2001: 0.96,
-    2002: 1.70,
-    2003: 2.80,
-    2004: 3.85,
-    2005: 3.48,
-    2006: 2.78,
-    2007: 2.00,
-    2008: 0.11,
-    2009: -2.58,
-    2010: 2.70,
-    2011: 1.56,
-    2012: 2.29,
-    2013: 2.12,
-    2014: 2.52,
-}
 
-df_cleaned['GDPGrowth'] = df_cleaned['ApprovalFY'].astype(int).map(gdp_growth)
-
-
-# Interest rate
-interest_rate = {
-    1961: 3.11,
-    1962: 3.22,
-    1963: 3.37,
-    1964: 2.95,
-    1965: 2.57,
-    1966: 2.65,
-    1967: 2.41,
-    1968: 1.86,
-    1969: 2.85,
-    1970: 2.51,
-    1971: 0.62,
-    1972: 0.88,
-    1973: 2.41,
-    1974: 1.65,
-    1975: -1.28,
-    1976: 1.27,
-    1977: 0.58,
-    1978: 1.89,
-    1979: 4.03,
-    1980: 5.72,
-    1981: 8.59,
-    1982: 8.18,
-    1983: 6.62,
-    1984: 8.14,
-    1985: 6.56,
-    1986: 6.19,
-    1987: 5.59,
-    1988: 5.59,
-    1989: 6.69,
-    1990: 6.04,
-    1991: 4.92,
-    1992: 3.88,
-    1993: 3.55,
-    1994: 4.90,
-    1995: 6.59,
-    1996: 6.32,
-    1997: 6.60,
-    1998: 7.15,
-    1999: 6.49,
-    2000: 6.81,
-    2001: 4.57,
-    2002: 3.07,
-    2003: 2.11,
-    2004: 1.61,
-    2005: 2.96,
-    2006: 4.73,
-    2007: 5.20,
-    2008: 3.10,
-    2009: 2.62,
-    2010: 2.01,
-    2011: 1.16,
-    2012: 1.36,
-    2013: 1.52,
-    2014: 1.48,
-}
-
-df_cleaned['InterestRate'] = df_cleaned['ApprovalFY'].astype(int).map(interest_rate)
+print(df_cleaned[['ApprovalFY', 'InflationRate', 'GDPGrowth', 'InterestRate']].dropna().head())
 
 # Define the final feature set (drop everything else)
 features = [
@@ -843,21 +689,6 @@ categorical_cols = [
 
 df_model[categorical_cols] = df_model[categorical_cols].astype(str)
 
-# One-hot encode categorical variables
-df_encoded = pd.get_dummies(df_model, columns=categorical_cols, drop_first=True)
-
-# Split into features (X) and target (y)
-X = df_encoded.drop(target, axis=1)
-y = df_encoded[target]
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y,
-    test_size=0.9,
-    random_state=1)
-
-print("X_train.shape:", X_train.shape)  
-print("X_test.shape: ", X_test.shape)  
-
 numeric_cols = [
     'Term',
     'DisbursementGross',
@@ -866,16 +697,39 @@ numeric_cols = [
     'InterestRate',
     'GDPGrowth']
 
-all_cols = X_train.columns.tolist()
-categorical_dummy_cols = [c for c in all_cols if c not in numeric_cols]
+# One-hot encode categorical variables into a sparse CSR design matrix:
+# numeric_cols first, then the same dummy columns pd.get_dummies(drop_first=True)
+# would create. The vocabulary is fixed by the encoder, and nothing is densified.
+# Set use_target_encoding = True to swap the dummies for out-of-fold target /
+# frequency encoding of FranchiseCode, State and NAICS2 (a few dozen columns).
+from sba.encoding import DummyEncoder, design_matrix, sparse_preprocessor, compact_preprocessor
+
+use_target_encoding = False
+
+if use_target_encoding:
+    X = df_model[numeric_cols + categorical_cols]
+    feature_names = list(X.columns)
+else:
+    encoder = DummyEncoder(categorical_cols).fit(df_model)
+    X, feature_names = design_matrix(df_model, encoder, numeric_cols)
+y = df_model[target]
+disb = df_model['DisbursementGross'].values.copy()
+row_index = df_model.index.values   # X rows -> df_model rows
 
-from sklearn.compose import ColumnTransformer
+X_train, X_test, y_train, y_test, disb_train, disb_test, idx_train, idx_test = train_test_split(
+    X, y, disb, row_index,
+    test_size=0.9,
+    random_state=1)
 
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', StandardScaler(), numeric_cols),
-        ('passthrough', 'passthrough', categorical_dummy_cols)],
-    remainder='drop')
+print("X_train.shape:", X_train.shape)  
+print("X_test.shape: ", X_test.shape)  
+
+# Standardize the numeric block, pass the dummies through, output stays CSR
+# (target encoding is fitted inside each CV fold, out-of-fold on its train rows)
+if use_target_encoding:
+    preprocessor = compact_preprocessor(numeric_cols, categorical_cols)
+else:
+    preprocessor = sparse_preprocessor(len(numeric_cols))
 
 # -------------------------------
 # NEURAL NETWORK
@@ -917,10 +771,14 @@ X_train, X_test, y_train, y_test, disb_train, disb_test = train_test_split(
 )
 
 # 3) Build preprocessing pipeline (same as for LR)
-preprocessor = ColumnTransformer([
-    ('num', StandardScaler(), numeric_cols),
-    ('cat', OneHotEncoder(handle_unknown='ignore', sparse=False), categorical_cols)
-])
+#    One-hot output stays sparse all the way into the MLP.
+if use_target_encoding:
+    preprocessor = compact_preprocessor(numeric_cols, categorical_cols)
+else:
+    preprocessor = ColumnTransformer([
+        ('num', StandardScaler(), numeric_cols),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_cols)
+    ], sparse_threshold=1.0)
 
 mlp_pipe = Pipeline([
     ('preproc', preprocessor),
@@ -936,8 +794,10 @@ param_dist = {
     'mlp__learning_rate_init': list(np.logspace(-4, -2, num=10))
 }
 
-# 6) Randomized search
-search = RandomizedSearchCV(
+# 6) Randomized search (preprocessing fitted once per fold, shared by all candidates)
+from sba.search import ParallelSearchCV
+
+search = ParallelSearchCV(
     estimator=mlp_pipe,
     param_distributions=param_dist,
     n_iter=20,
@@ -961,19 +821,21 @@ print("Best CV ROC AUC:", search.best_score_)
 probs_def = best_mlp.predict_proba(X_test)[:,1]
 y_pred_05 = (probs_def >= 0.5).astype(int)
 
+# Scores sorted once: ROC, AUC and confusion counts come from the same sums
+from sba.evaluate import ScoreCurve
+
+curve_mlp = ScoreCurve(y_test.values, probs_def, disb_test)
+
 print("\n--- Classification Report (threshold=0.5) ---")
 print(classification_report(y_test, y_pred_05, digits=4))
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred_05))
-roc_auc = roc_auc_score(y_test, probs_def)
+print("Confusion Matrix:\n", curve_mlp.confusion(0.5))
+roc_auc = curve_mlp.auc()
 print(f"Test ROC AUC: {roc_auc:.4f}")
 
 # 8) Net profit & ROI functions
-def net_profit(y_true, y_pred, disb_amt):
-    return np.where(
-        y_pred==0,
-        np.where(y_true==0, 0.05*disb_amt, -0.25*disb_amt),
-        0.0
-    ).sum()
+# net_profit applies the project cost matrix (sba.profit.DEFAULT_COSTS):
+# grant + PIF +5%, grant + Default -25%, deny + PIF -5% (opportunity cost)
+from sba.profit import net_profit, profit_curve
 
 def roi(net_prof, y_pred, disb_amt):
     granted = disb_amt[y_pred==0].sum()
@@ -985,12 +847,8 @@ print(f"\nNet Profit at t=0.5: ${profit_05:,.2f}")
 print(f"Rate of Return at t=0.5: {roi_05:.2%}")
 
 # 9) Tune threshold
-thresholds = np.arange(0,1,0.01)
-profits    = []
-for t in thresholds:
-    y_pred_t = (probs_def >= t).astype(int)
-    profits.append(net_profit(y_test.values, y_pred_t, disb_test))
-profits = np.array(profits)
+# exact profit at every distinct P(Default) cutoff (one sort), not a 0.01 grid
+thresholds, profits = profit_curve(y_test.values, probs_def, disb_test)
 
 best_idx = np.argmax(profits)
 best_t   = thresholds[best_idx]
@@ -1003,7 +861,7 @@ print(f"Max Net Profit:    ${best_p:,.2f}")
 y_pred_opt = (probs_def >= best_t).astype(int)
 print("\n--- Classification Report (optimal threshold) ---")
 print(classification_report(y_test, y_pred_opt, digits=4))
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred_opt))
+print("Confusion Matrix:\n", curve_mlp.confusion(best_t))
 
 profit_opt = net_profit(y_test.values, y_pred_opt, disb_test)
 roi_opt    = roi(profit_opt, y_pred_opt, disb_test)
@@ -1011,7 +869,7 @@ print(f"\nNet Profit at t={best_t:.2f}: ${profit_opt:,.2f}")
 print(f"Rate of Return at t={best_t:.2f}: {roi_opt:.2%}")
 
 
-fpr, tpr, thresholds = roc_curve(y_test, probs_def)
+fpr, tpr, thresholds = curve_mlp.roc()
 
 # Plot ROC curve
 plt.figure(figsize=(8, 6))
@@ -1039,44 +897,30 @@ print("Model saved to best_mlp_model.joblib")
 probs_default = best_mlp.predict_proba(X_test)[:, 1]   # P(Default)
 probs_pif     = 1.0 - probs_default                    # P(PIF)
 
-# 2) Build validation DataFrame sorted by least‐risky first
-df_val = pd.DataFrame({
-    'P_PIF': probs_pif,
-    'y_true': y_test.values,  # 0 = PIF, 1 = Default
-    'disb': disb_test
-})
-df_val.sort_values('P_PIF', ascending=False, inplace=True)
-df_val.reset_index(drop=True, inplace=True)
-
-# 3) Compute per‐loan net profit if granted
-df_val['profit_if_granted'] = np.where(
-    df_val['y_true'] == 0,
-    0.05 * df_val['disb'],    # grant & PIF → +5% of disb
-    -0.25 * df_val['disb']    # grant & Default → -25% of disb
-)
+# 2)-4) Gains straight from the arrays: loans granted least-risky first,
+#    profit if granted = +5% (PIF) / -25% (Default) of disb, downsampled to
+#    ~1,000 points for the charts
+from sba.evaluate import gains_lift
 
-# 4) Cumulative profit and % granted
-df_val['cum_profit'] = df_val['profit_if_granted'].cumsum()
-n = len(df_val)
-df_val['pct_granted'] = (np.arange(n) + 1) / n
+gains_mlp, funding_mlp = gains_lift(y_test.values, probs_default, disb_test)
+n = len(probs_default)
 
 # 5a) Find how far to go for max net profit
-best_idx    = df_val['cum_profit'].idxmax()
-best_profit = df_val.loc[best_idx, 'cum_profit']
-best_pct     = df_val.loc[best_idx, 'pct_granted'] * 100
-best_count   = best_idx + 1
+best_profit = funding_mlp['max_profit']
+best_pct    = funding_mlp['best_fraction'] * 100
+best_count  = funding_mlp['best_count']
 
 print(f"(a) To achieve MAX NET PROFIT = ${best_profit:,.2f},")
 print(f"    grant loans to {best_pct:.2f}% of the validation set")
 print(f"    (i.e. {best_count} out of {n} applications)")
 
 # 5b) Determine the P(PIF) cut-off for future applicants
-cutoff_pif = df_val.loc[best_idx, 'P_PIF']
+cutoff_pif = funding_mlp['p_pif_cutoff']
 print(f"(b) For future applicants, grant the loan if P(PIF) ≥ {cutoff_pif:.4f}")
 
 # 6) Plot Gains Chart (Cumulative Profit vs % Granted)
 plt.figure(figsize=(8,5))
-plt.plot(df_val['pct_granted']*100, df_val['cum_profit'], label='Cumulative Profit', lw=2)
+plt.plot(gains_mlp['fraction']*100, gains_mlp['cum_profit'], label='Cumulative Profit', lw=2)
 plt.axvline(best_pct, color='red', linestyle='--', label=f'Max @ {best_pct:.2f}%')
 plt.xlabel('% of Applicants Granted')
 plt.ylabel('Cumulative Net Profit (USD)')
@@ -1087,12 +931,9 @@ plt.tight_layout()
 plt.show()
 
 # 7) Plot Lift Chart vs Random Baseline
-mean_profit = df_val['profit_if_granted'].mean()
-df_val['random_profit'] = df_val['pct_granted'] * (mean_profit * n)
-
 plt.figure(figsize=(8,5))
-plt.plot(df_val['pct_granted']*100, df_val['cum_profit'], lw=2, label='Model')
-plt.plot(df_val['pct_granted']*100, df_val['random_profit'], lw=2, linestyle='--', label='Random')
+plt.plot(gains_mlp['fraction']*100, gains_mlp['cum_profit'], lw=2, label='Model')
+plt.plot(gains_mlp['fraction']*100, gains_mlp['random_profit'], lw=2, linestyle='--', label='Random')
 plt.axvline(best_pct, color='red', linestyle='--')
 plt.xlabel('% of Applicants Granted')
 plt.ylabel('Cumulative Net Profit (USD)')
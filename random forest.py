@@ -13,27 +13,16 @@ Original file is located at
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# 1) Load
-df = pd.read_csv('SBAnational.csv')
+from sba.clean import load_clean, load_typed
+
+# 1) Load only the used columns with an explicit schema.
+#    Currency and date columns are decoded here, and the target /
+#    LowDoc / RevLineCr / UrbanRural flags are derived from them.
+#    The typed frame is cached under .sba_cache/ keyed by the CSV content.
+df = load_typed('SBAnational.csv')
 df.head()
 print(df.dtypes)
 
-# Clean currency columns
-currency_cols = ['DisbursementGross', 'BalanceGross', 'GrAppv', 'SBA_Appv', 'ChgOffPrinGr']
-for col in currency_cols:
-    df[col] = pd.to_numeric(df[col].astype(str).str.replace('[\$,]', '', regex=True), errors='coerce')
-
-# Parse datetime columns
-df['ApprovalDate'] = pd.to_datetime(df['ApprovalDate'], errors='coerce')
-df['DisbursementDate'] = pd.to_datetime(df['DisbursementDate'], errors='coerce')
-df['ChgOffDate'] = pd.to_datetime(df['ChgOffDate'], errors='coerce')
-
-# Target variable
-df['MIS_Status_Binary'] = df['MIS_Status'].map({'P I F': 0, 'CHGOFF': 1})
-df['LowDoc_Binary'] = df['LowDoc'].map({'Y': 1, 'N': 0})
-df['RevLineCr_Binary'] = df['RevLineCr'].map({'Y': 1, 'N': 0})
-df['UrbanRural_Numeric'] = pd.to_numeric(df['UrbanRural'], errors='coerce')
-
 numeric_features = [
     'Term', 'NoEmp', 'CreateJob', 'RetainedJob',
     'FranchiseCode', 'DisbursementGross', 'BalanceGross',
@@ -98,7 +87,10 @@ plt.show()
 3. **Loans Backed by Real Estate**
 """
 
-df['RealEstate']=df['Term'].apply(lambda x: 1 if x >= 240 else 0)
+# RealEstate, Recession, NAICS2 and GuaranteeRatio are derived in one pass
+from sba.features import add_features
+
+df = add_features(df)
 df['RealEstate'].value_counts()
 
 grouped = df.groupby('RealEstate')['MIS_Status_Binary']
@@ -126,14 +118,10 @@ plt.show()
 4. **Economic Recession**
 """
 
-recession_start = pd.to_datetime('2007-12-01')
-recession_end   = pd.to_datetime('2009-06-30')
-
 # Make sure ApprovalDate is datetime and drop rows missing it
 df = df[df['ApprovalDate'].notna()]
 
-# Create Recession dummy:
-df['Recession'] = df['ApprovalDate'].between(recession_start, recession_end).astype(int)
+# Recession dummy (2007-12-01 .. 2009-06-30) comes from add_features above
 print(df['Recession'].value_counts())
 
 # Compute default and pay-in-full rates by Recession flag
@@ -214,8 +202,6 @@ plt.show()
 
 df.columns
 
-df['NAICS2'] = df['NAICS'].astype(int).astype(str).str[:2]
-
 # Compute counts and default rates by sector
 industry_stats = (
     df
@@ -277,9 +263,6 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.metrics import classification_report, roc_auc_score, confusion_matrix, make_scorer
 
-# Recompute engineered feature
-df['GuaranteeRatio'] = df['SBA_Appv'] / df['GrAppv']
-
 # Check for NoEmployee
 df['NoEmp'] = pd.to_numeric(df['NoEmp'], errors='coerce')
 
@@ -637,9 +620,10 @@ print("Maximum ApprovalFY:", df['ApprovalFY'].max())
 # Check initial number of rows
 initial_count = df.shape[0]
 
-# Drop rows with ApprovalFY > 2025
-df['ApprovalFY'] = pd.to_numeric(df['ApprovalFY'], errors='coerce')
-df_cleaned = df[df['ApprovalFY'] <= 2025]
+# Drop rows with ApprovalFY > 2025 and join the macro series
+# (InflationRate, GDPGrowth, InterestRate). The cleaned frame is cached
+# on disk too, so later runs re-open it instead of rebuilding it.
+df_cleaned = load_clean('SBAnational.csv')
 
 # Check new number of rows
 final_count = df_cleaned.shape[0]
@@ -658,149 +642,10 @@ print("Unique values in ApprovalFY:", df_cleaned['ApprovalFY'].unique())
 print("Minimum ApprovalFY:", df_cleaned['ApprovalFY'].min())
 print("Maximum ApprovalFY:", df_cleaned['ApprovalFY'].max())
 
-# Create InflationRate
-df['ApprovalFY_int'] = df['ApprovalFY'].astype(int)
-
-
 # Minimum ApprovalFY: 1962.0
 # Maximum ApprovalFY: 2014.0
 
-inflation_dict = {
-    1962: 1.30, 1963: 1.60, 1964: 1.00, 1965: 1.90, 1966: 3.50, 1967: 3.00, 1968: 4.70,
-    1969: 6.20, 1970: 5.60, 1971: 3.30, 1972: 3.40, 1973: 8.70, 1974: 12.30, 1975: 6.90,
-    1976: 4.90, 1977: 6.70, 1978: 9.00, 1979: 13.30, 1980: 12.50, 1981: 8.90, 1982: 3.80,
-    1983: 3.80, 1984: 3.90, 1985: 3.80, 1986: 1.10, 1987: 4.40, 1988: 4.40, 1989: 4.60,
-    1990: 6.10, 1991: 3.10, 1992: 2.90, 1993: 2.70, 1994: 2.70, 1995: 2.50, 1996: 3.30,
-    1997: 1.70, 1998: 1.60, 1999: 2.70, 2000: 3.40, 2001: 1.60, 2002: 2.40, 2003: 1.90,
-    2004: 3.30, 2005: 3.40, 2006: 2.50, 2007: 4.10, 2008: 0.10, 2009: 2.70, 2010: 1.50,
-    2011: 3.00, 2012: 1.70, 2013: 1.50, 2014: 0.80
-}
-
-
-
-df_cleaned['InflationRate'] = df_cleaned['ApprovalFY'].map(inflation_dict)
-
-print(df_cleaned[['ApprovalFY', 'InflationRate']].dropna().head())
-
-# GDP Growth
-gdp_growth = {
-    1962: 6.10,
-    1963: 4.40,
-    1964: 5.80,
-    1965: 6.40,
-    1966: 6.50,
-    1967: 2.50,
-    1968: 4.80,
-    1969: 3.10,
-    1970: 0.22,
-    1971: 3.29,
-    1972: 5.26,
-    1973: 5.65,
-    1974: -0.54,
-    1975: -0.21,
-    1976: 5.39,
-    1977: 4.62,
-    1978: 5.54,
-    1979: 3.17,
-    1980: -0.26,
-    1981: 2.54,
-    1982: -1.80,
-    1983: 4.58,
-    1984: 7.24,
-    1985: 4.17,
-    1986: 3.46,
-    1987: 3.45,
-    1988: 4.18,
-    1989: 3.67,
-    1990: 1.89,
-    1991: -0.11,
-    1992: 3.52,
-    1993: 2.75,
-    1994: 4.03,
-    1995: 2.68,
-    1996: 3.77,
-    1997: 4.45,
-    1998: 4.48,
-    1999: 4.79,
-    2000: 4.08,
-    2001: 0.96,
-    2002: 1.70,
-    2003: 2.80,
-    2004: 3.85,
-    2005: 3.48,
-    2006: 2.78,
-    2007: 2.00,
-    2008: 0.11,
-    2009: -2.58,
-    2010: 2.70,
-    2011: 1.56,
-    2012: 2.29,
-    2013: 2.12,
-    2014: 2.52,
-}
-
-df_cleaned['GDPGrowth'] = df_cleaned['ApprovalFY'].astype(int).map(gdp_growth)
-
-
-# Interest rate
-interest_rate = {
-    1961: 3.11,
-    1962: 3.22,
-    1963: 3.37,
-    1964: 2.95,
-    1965: 2.57,
-    1966: 2.65,
-    1967: 2.41,
-    1968: 1.86,
-    1969: 2.85,
-    1970: 2.51,
-    1971: 0.62,
-    1972: 0.88,
-    1973: 2.41,
-    1974: 1.65,
-    1975: -1.28,
-    1976: 1.27,
-    1977: 0.58,
-    1978: 1.89,
-    1979: 4.03,
-    1980: 5.72,
-    1981: 8.59,
-    1982: 8.18,
-    1983: 6.62,
-    1984: 8.14,
-    1985: 6.56,
-    1986: 6.19,
-    1987: 5.59,
-    1988: 5.59,
-    1989: 6.69,
-    1990: 6.04,
-    1991: 4.92,
-    1992: 3.88,
-    1993: 3.55,
-    1994: 4.90,
-    1995: 6.59,
-    1996: 6.32,
-    1997: 6.60,
-    1998: 7.15,
-    1999: 6.49,
-    2000: 6.81,
-    2001: 4.57,
-    2002: 3.07,
-    2003: 2.11,
-    2004: 1.61,
-    2005: 2.96,
-    2006: 4.73,
-    2007: 5.20,
-    2008: 3.10,
-    2009: 2.62,
-    2010: 2.01,
-    2011: 1.16,
-    2012: 1.36,
-    2013: 1.52,
-    2014: 1.48,
-}
-
-df_cleaned['InterestRate'] = df_cleaned['ApprovalFY'].astype(int).map(interest_rate)
+print(df_cleaned[['ApprovalFY', 'InflationRate', 'GDPGrowth', 'InterestRate']].dropna().head())
 
 # Define the final feature set (drop everything else)
 features = [
@@ -844,21 +689,6 @@ categorical_cols = [
 
 df_model[categorical_cols] = df_model[categorical_cols].astype(str)
 
-# One-hot encode categorical variables
-df_encoded = pd.get_dummies(df_model, columns=categorical_cols, drop_first=True)
-
-# Split into features (X) and target (y)
-X = df_encoded.drop(target, axis=1)
-y = df_encoded[target]
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y,
-    test_size=0.9,
-    random_state=1)
-
-print("X_train.shape:", X_train.shape)  
-print("X_test.shape: ", X_test.shape)  
-
 numeric_cols = [
     'Term',
     'DisbursementGross',
@@ -867,16 +697,39 @@ numeric_cols = [
     'InterestRate',
     'GDPGrowth']
 
-all_cols = X_train.columns.tolist()
-categorical_dummy_cols = [c for c in all_cols if c not in numeric_cols]
+# One-hot encode categorical variables into a sparse CSR design matrix:
+# numeric_cols first, then the same dummy columns pd.get_dummies(drop_first=True)
+# would create. The vocabulary is fixed by the encoder, and nothing is densified.
+# Set use_target_encoding = True to swap the dummies for out-of-fold target /
+# frequency encoding of FranchiseCode, State and NAICS2 (a few dozen columns).
+from sba.encoding import DummyEncoder, design_matrix, sparse_preprocessor, compact_preprocessor
+
+use_target_encoding = False
+
+if use_target_encoding:
+    X = df_model[numeric_cols + categorical_cols]
+    feature_names = list(X.columns)
+else:
+    encoder = DummyEncoder(categorical_cols).fit(df_model)
+    X, feature_names = design_matrix(df_model, encoder, numeric_cols)
+y = df_model[target]
+disb = df_model['DisbursementGross'].values.copy()
+row_index = df_model.index.values   # X rows -> df_model rows
+
+X_train, X_test, y_train, y_test, disb_train, disb_test, idx_train, idx_test = train_test_split(
+    X, y, disb, row_index,
+    test_size=0.9,
+    random_state=1)
 
-from sklearn.compose import ColumnTransformer
+print("X_train.shape:", X_train.shape)  
+print("X_test.shape: ", X_test.shape)  
 
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', StandardScaler(), numeric_cols),
-        ('passthrough', 'passthrough', categorical_dummy_cols)],
-    remainder='drop')
+# Standardize the numeric block, pass the dummies through, output stays CSR
+# (target encoding is fitted inside each CV fold, out-of-fold on its train rows)
+if use_target_encoding:
+    preprocessor = compact_preprocessor(numeric_cols, categorical_cols)
+else:
+    preprocessor = sparse_preprocessor(len(numeric_cols))
 
 # -------------------------------
 # RANDOM FOREST
@@ -911,7 +764,11 @@ param_dist_rf = {
 # ------------------------------------------------------------------------------------------------
 # 5) CONFIGURE RandomizedSearchCV (using ROC‐AUC as the scoring metric)
 # ------------------------------------------------------------------------------------------------
-search_rf = RandomizedSearchCV(
+# Same sampling as RandomizedSearchCV, but X_train / y_train are shared
+# with the workers through memory maps instead of being pickled per fit.
+from sba.search import ParallelSearchCV
+
+search_rf = ParallelSearchCV(
     estimator=rf_pipe,
     param_distributions=param_dist_rf,
     n_iter=50,           # 50 random combinations
@@ -919,7 +776,7 @@ search_rf = RandomizedSearchCV(
     cv=5,
     verbose=2,
     random_state=42,
-    n_jobs=1,            # set to 1 to avoid parallel‐processing pickling issues
+    n_jobs=-1,           # all cores
     refit=True
 )
 
@@ -943,16 +800,21 @@ print("Best CV ROC AUC: ", search_rf.best_score_)
 y_pred_rf_default = best_rf.predict(X_test)
 probs_rf_default  = best_rf.predict_proba(X_test)[:, 1]  # probability of class=1 = Default
 
+# Scores sorted once: ROC, AUC and confusion counts come from the same sums
+from sba.evaluate import ScoreCurve
+
+curve_rf = ScoreCurve(y_test.values, probs_rf_default, disb_test)
+
 print("\n--- Classification Report (Random Forest, threshold=0.5) ---")
 print(classification_report(y_test, y_pred_rf_default, digits=4))
 print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred_rf_default))
-print("Test ROC AUC: ", roc_auc_score(y_test, probs_rf_default))
+print("Test ROC AUC: ", curve_rf.auc())
 
 # 7.2) Plot ROC curve
-fpr_rf, tpr_rf, _ = roc_curve(y_test, probs_rf_default)
+fpr_rf, tpr_rf, _ = curve_rf.roc()
 plt.figure(figsize=(6,4))
 plt.plot(fpr_rf, tpr_rf, color='navy',
-         label=f'Random Forest (AUC = {roc_auc_score(y_test, probs_rf_default):.4f})')
+         label=f'Random Forest (AUC = {curve_rf.auc():.4f})')
 plt.plot([0,1], [0,1], 'k--', linewidth=1)
 plt.xlabel('False Positive Rate')
 plt.ylabel('True Positive Rate')
@@ -965,54 +827,27 @@ plt.show()
 # ------------------------------------------------------------------------------------------------
 # 8) DEFINE NET PROFIT FUNCTION AND THRESHOLD‐TUNING FUNCTION
 # ------------------------------------------------------------------------------------------------
-def net_profit(y_true, y_pred, disbursement):
-    """
-    y_true[i]:       0 = Paid in Full (PIF), 1 = Default (CHGOFF)
-    y_pred[i]:       0 = Grant loan, 1 = Deny loan
-    disbursement[i]: raw DisbursementGross amount
-
-    Profit logic:
-      • If we GRANT (y_pred = 0) and truth = 0 (PIF) → +5% * amt
-      • If we GRANT (y_pred = 0) and truth = 1 (Default) → −25% * amt
-      • If we DENY  (y_pred = 1) → 0 (no gain/loss)
-    """
-    profit = 0.0
-    for truth, pred, amt in zip(y_true, y_pred, disbursement):
-        if pred == 0:  # Grant loan
-            if truth == 0:
-                profit += 0.05 * amt
-            else:
-                profit -= 0.25 * amt
-        else:  # pred == 1 (Deny)
-            if truth == 0:
-                profit -= 0.05 * amt   # chi phí cơ hội: lẽ ra có +5% thì bây giờ mất đi
-            # nếu truth == 1 và pred == 1, profit += 0 (đúng vừa tránh lỗ)
-    return profit
+# net_profit applies the project cost matrix (sba.profit.DEFAULT_COSTS):
+# grant + PIF +5%, grant + Default -25%, deny + PIF -5% (opportunity cost)
+from sba.profit import net_profit, profit_curve
 
 def tune_threshold(y_true, prob_default, disbursement, plot=True):
     """
-    Scan thresholds from 0.00 to 0.99 (step 0.01), compute net profit at each, and return 
-    the threshold that maximizes net profit.
+    Compute net profit at every distinct P(Default) cutoff (we DENY when
+    P(Default) >= threshold) and return the threshold that maximizes it.
 
     Returns:
       best_threshold (float), max_profit (float)
     """
-    thresholds = np.arange(0.00, 1.00, 0.01)
-    profits = []
-
-    for t in thresholds:
-        # If P(Default) >= t → we DENY (pred = 1); else we GRANT (pred = 0)
-        y_pred = (prob_default >= t).astype(int)
-        profits.append(net_profit(y_true, y_pred, disbursement))
-
-    profits = np.array(profits)
+    # exact profit at every distinct score (one sort), not a 0.01 grid
+    thresholds, profits = profit_curve(y_true, prob_default, disbursement)
     best_idx = np.nanargmax(profits)
     best_threshold = thresholds[best_idx]
     max_profit = profits[best_idx]
 
     if plot:
         plt.figure(figsize=(8,4))
-        plt.plot(thresholds, profits, marker='o', label="Net Profit")
+        plt.plot(thresholds, profits, drawstyle='steps-pre', label="Net Profit")
         plt.axvline(x=best_threshold, color='r', linestyle='--',
                     label=f'Best Threshold = {best_threshold:.2f}')
         plt.title("Threshold vs Net Profit (Random Forest)")
@@ -1028,9 +863,8 @@ def tune_threshold(y_true, prob_default, disbursement, plot=True):
 # ------------------------------------------------------------------------------------------------
 # 9) EXTRACT RAW disbursement AMOUNTS FOR THE TEST SET
 # ------------------------------------------------------------------------------------------------
-# X_test is the ONE-HOT–ENCODED & SCALED matrix, so we need the original 'DisbursementGross' from df_model.
-# Since train_test_split preserved the index, we can do:
-disb_test = df_model.loc[X_test.index, 'DisbursementGross'].values
+# X_test is the sparse design matrix; the raw 'DisbursementGross' amounts were
+# split alongside it into disb_test.
 
 # ------------------------------------------------------------------------------------------------
 # 10) COMPUTE NET PROFIT AT THRESHOLD = 0.5
@@ -1051,6 +885,39 @@ best_thresh_rf, best_profit_rf = tune_threshold(
 print(f"\nOptimal Threshold for Random Forest: {best_thresh_rf:.2f}")
 print(f"Maximum Expected Net Profit (Random Forest): ${best_profit_rf:,.2f}")
 
+# How stable is that cutoff? Resample the test loans (bootstrap) and get
+# 95% intervals for the optimal threshold, max net profit and ROI.
+from sba.bootstrap import bootstrap_threshold
+
+boot_summary_rf, boot_reps_rf = bootstrap_threshold(
+    y_test.values, probs_rf_default, disb_test, n_boot=2000)
+print(boot_summary_rf)
+
+# And how sensitive is it to the cost assumptions? Optimal threshold for a
+# grid of default losses (rows) and denial opportunity costs (columns).
+from sba.profit import cost_sensitivity
+
+sensitivity_rf = cost_sensitivity(
+    y_test.values, probs_rf_default, disb_test,
+    grant_pif=0.05,
+    grant_default=[-0.15, -0.20, -0.25, -0.30, -0.35],
+    deny_pif=[0.0, -0.025, -0.05, -0.075, -0.10])
+print(sensitivity_rf.pivot(index='grant_default', columns='deny_pif', values='threshold').round(3))
+
+# Does one cutoff fit every State / sector? Profit-optimal threshold per
+# segment; segments with fewer than 500 test loans keep the global cutoff.
+from sba.segments import segment_thresholds, apply_segment_thresholds
+
+segment_cols = ['State', 'NAICS2']   # or ['RealEstate'], ['State'], ...
+segments_test = df_model.loc[idx_test, segment_cols]
+seg_table_rf = segment_thresholds(
+    segments_test, y_test.values, probs_rf_default, disb_test, min_loans=500)
+y_pred_rf_seg = apply_segment_thresholds(segments_test, probs_rf_default, seg_table_rf)
+print(seg_table_rf.sort_values('uplift', ascending=False).head(15))
+print(f"Net Profit with segment thresholds: "
+      f"${net_profit(y_test.values, y_pred_rf_seg, disb_test):,.2f} "
+      f"(global threshold: ${best_profit_rf:,.2f})")
+
 # ------------------------------------------------------------------------------------------------
 # 12) EVALUATE FINAL CLASSIFICATION AT THE OPTIMAL THRESHOLD
 # ------------------------------------------------------------------------------------------------
@@ -1058,7 +925,7 @@ y_pred_rf_opt = (probs_rf_default >= best_thresh_rf).astype(int)
 
 print("\n--- Classification Report with Optimized Threshold (Random Forest) ---")
 print(classification_report(y_test, y_pred_rf_opt, digits=4))
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred_rf_opt))
+print("Confusion Matrix:\n", curve_rf.confusion(best_thresh_rf))
 
 # Compute the overall rate of return:
 total_disb_test = disb_test.sum()
@@ -1094,51 +961,20 @@ print('Loaded model accuracy: ', (y_hat_load == y_test).mean())
 # -------------------
 probs_default_val = best_rf.predict_proba(X_test)[:, 1]  # Xác suất default
 
-df_val = pd.DataFrame({
-    'y_true':        y_test.values,
-    'p_default':     probs_default_val,
-    'disbursement':  df_model.loc[X_test.index, 'DisbursementGross'].values
-})
-
-
-# 3) TÍNH XÁC SUẤT THÀNH CÔNG (P(success) = 1 - P(default))
-df_val['p_success'] = 1.0 - df_val['p_default']
+# 3)-8) GAINS / LIFT TỪ MẢNG: cấp vốn theo p_success = 1 - p_default giảm dần
+#    (ít rủi ro nhất trước); lợi nhuận nếu cấp vốn = +5% (PIF) / -25% (Default)
+#    * disbursement, deny = 0. Đường cong được rút gọn còn ~1.000 điểm để vẽ.
+from sba.evaluate import gains_lift
 
-# 4) TÍNH “LỢI NHUẬN NẾU CẤP VỐN” CHO MỖI LOAN
-#    • Nếu grant (cấp vốn) mà loan PIF (y_true = 0) → +5% * disbursement
-#    • Nếu grant mà loan Default (y_true = 1) → -25% * disbursement
-#    (Nếu deny, lợi nhuận = 0)
-df_val['profit_if_funded'] = df_val.apply(
-    lambda row: 0.05 * row['disbursement'] if row['y_true'] == 0 else -0.25 * row['disbursement'],
-    axis=1
-)
-
-# 5) SẮP XẾP CÁC LOAN THEO p_success GIẢM DẦN (ÍT RỦI RO NHẤT TRƯỚC)
-df_val_sorted = df_val.sort_values(by='p_success', ascending=False).reset_index(drop=True)
-
-# 6) TÍNH CÁC CHỈ SỐ TÍCH LŨY
-#    • cumulative_profit: lợi nhuận cộng dồn khi cấp vốn theo thứ tự
-#    • index: thứ tự (1, 2, 3, …)
-#    • cumulative_fraction: tỉ lệ (%) đã cấp vốn = index / tổng loan
-df_val_sorted['cumulative_profit'] = df_val_sorted['profit_if_funded'].cumsum()
-df_val_sorted['index'] = np.arange(1, len(df_val_sorted) + 1)
-df_val_sorted['cumulative_fraction'] = df_val_sorted['index'] / len(df_val_sorted)
-
-# 7) XÁC ĐỊNH ĐIỂM ĐẠT LỢI NHUẬN TỐI ĐA
-best_idx = df_val_sorted['cumulative_profit'].idxmax()
-best_fraction = df_val_sorted.loc[best_idx, 'cumulative_fraction']
-best_cumulative_profit = df_val_sorted.loc[best_idx, 'cumulative_profit']
-best_p_success_cutoff = df_val_sorted.loc[best_idx, 'p_success']
-
-# 8) TÍNH LIFT: CUMULATIVE AVERAGE PROFIT / BASELINE AVERAGE PROFIT
-baseline_avg_profit = df_val_sorted['profit_if_funded'].mean()
-df_val_sorted['cumulative_avg_profit'] = df_val_sorted['cumulative_profit'] / df_val_sorted['index']
-df_val_sorted['profit_lift'] = df_val_sorted['cumulative_avg_profit'] / baseline_avg_profit
+gains_rf, funding_rf = gains_lift(y_test.values, probs_default_val, disb_test)
+best_fraction = funding_rf['best_fraction']
+best_cumulative_profit = funding_rf['max_profit']
+best_p_success_cutoff = funding_rf['p_pif_cutoff']
 
 # 9) VẼ GAINS CHART: CUMULATIVE PROFIT vs CUMULATIVE FRACTION
 plt.figure(figsize=(8, 5))
-plt.plot(df_val_sorted['cumulative_fraction'], df_val_sorted['cumulative_profit'],
-         marker='o', linewidth=1, label='Cumulative Profit')
+plt.plot(gains_rf['fraction'], gains_rf['cum_profit'],
+         linewidth=1, label='Cumulative Profit')
 plt.axvline(x=best_fraction, color='r', linestyle='--',
             label=f'Best Fraction ≈ {best_fraction:.2f}')
 plt.title('Gains Chart: Cumulative Net Profit vs Fraction of Loans Funded')
@@ -1151,8 +987,8 @@ plt.show()
 
 # 10) VẼ LIFT CHART: PROFIT LIFT vs CUMULATIVE FRACTION
 plt.figure(figsize=(8, 5))
-plt.plot(df_val_sorted['cumulative_fraction'], df_val_sorted['profit_lift'],
-         marker='o', linewidth=1, label='Profit Lift')
+plt.plot(gains_rf['fraction'], gains_rf['lift'],
+         linewidth=1, label='Profit Lift')
 plt.axvline(x=best_fraction, color='r', linestyle='--',
             label=f'Best Fraction ≈ {best_fraction:.2f}')
 plt.title('Lift Chart: Profit Lift vs Fraction of Loans Funded')
@@ -1213,3 +1049,30 @@ print(result_summary.to_string(index=False))
 
 
 
+
+# 12) GIỚI HẠN NGÂN SÁCH: chọn khoản vay tối đa lợi nhuận kỳ vọng khi tổng
+#     DisbursementGross không vượt quá ngân sách (có thể thêm trần theo State).
+#     budget_curve: lợi nhuận kỳ vọng và lợi nhuận biên trên mỗi USD cho các
+#     mức ngân sách từ $1M đến toàn bộ danh mục.
+from sba.budget import select_loans, budget_curve
+
+budget_rf = budget_curve(probs_default_val, disb_test, y_true=y_test.values)
+print(budget_rf.to_string(index=False))
+
+selected_rf, selection_rf = select_loans(
+    probs_default_val, disb_test, budget=0.5 * disb_test.sum(),
+    states=df_model.loc[idx_test, 'State'], state_caps={'CA': 0.1 * disb_test.sum()},
+    y_true=y_test.values)
+print(selection_rf)
+
+plt.figure(figsize=(8, 5))
+plt.plot(budget_rf['budget'], budget_rf['expected_profit'], label='Expected Profit')
+plt.plot(budget_rf['budget'], budget_rf['realized_profit'], label='Realized Profit (test)')
+plt.xscale('log')
+plt.title('Net Profit vs Disbursement Budget')
+plt.xlabel('Budget (USD)')
+plt.ylabel('Net Profit (USD)')
+plt.legend()
+plt.grid(True)
+plt.tight_layout()
+plt.show()
@@ -0,0 +1 @@
+"""Shared data and evaluation helpers for the SBA loan default scripts."""
@@ -0,0 +1,110 @@
+"""Bootstrap confidence intervals for the profit-optimal threshold.
+
+tune_threshold / optimal_threshold give one cutoff from one test split.
+Here the loans are resampled with replacement n_boot times and the
+optimal threshold, maximum profit and ROI are recomputed per replicate.
+
+The loans are sorted by score once. A replicate is a vector of
+multinomial counts (how often each loan was drawn), so its profit curve
+is just the cumulative sum of count-weighted grant-minus-deny profit in
+that fixed order: no re-sorting and no copy of the resampled data.
+Replicates are split into chunks that run in a process pool; each chunk
+gets its own seed from one SeedSequence, so results do not depend on
+the number of workers.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from sba.profit import DEFAULT_COSTS, loan_values
+
+
+def _sorted_arrays(y_true, prob_default, disbursement, costs):
+    """Scores sorted once plus the per-loan values the replicates reweight."""
+    grant, deny = loan_values(y_true, disbursement, costs)
+    scores = np.asarray(prob_default, dtype=np.float64).ravel()
+    if len(scores) != len(grant):
+        raise ValueError(f'length mismatch: prob_default {len(scores)}, y_true {len(grant)}')
+    order = np.argsort(scores)
+    scores = scores[order]
+    return {
+        'scores': scores,
+        'diff': (grant - deny)[order],
+        'deny': deny[order],
+        'disb': np.asarray(disbursement, dtype=np.float64).ravel()[order],
+        # last sorted position of every distinct score: a cutoff can only
+        # fall right after one of them (or before the first loan)
+        'ends': np.append(np.flatnonzero(scores[1:] != scores[:-1]), len(scores) - 1),
+    }
+
+
+def _replicate_stats(arrays, weights):
+    """(threshold, profit, roi) for one vector of resampling counts."""
+    scores, ends = arrays['scores'], arrays['ends']
+    cum_gain = np.cumsum(weights * arrays['diff'])
+    if len(ends) < len(cum_gain):
+        cum_gain = cum_gain[ends]   # tied scores: only group ends are cutoffs
+    # profits[0]: deny everything; profits[j]: grant up to ends[j - 1]
+    profits = weights @ arrays['deny'] + np.append(0.0, cum_gain)
+    best = int(np.argmax(profits))
+    if best == 0:
+        threshold, granted = scores[0], 0.0   # deny everything
+    else:
+        k = ends[best - 1]
+        threshold = scores[k + 1] if k + 1 < len(scores) else np.nextafter(scores[-1], np.inf)
+        granted = weights[:k + 1] @ arrays['disb'][:k + 1]
+    roi = profits[best] / granted if granted > 0 else np.nan
+    return threshold, profits[best], roi
+
+
+def _run_chunk(seed, n_reps, arrays):
+    rng = np.random.default_rng(seed)
+    n = len(arrays['scores'])
+    out = np.empty((n_reps, 3))
+    for r in range(n_reps):
+        weights = np.bincount(rng.integers(0, n, n), minlength=n).astype(np.float64)
+        out[r] = _replicate_stats(arrays, weights)
+    return out
+
+
+def bootstrap_threshold(y_true, prob_default, disbursement, n_boot=10_000, alpha=0.05,
+                        n_jobs=None, seed=0, chunk_size=250, costs=DEFAULT_COSTS):
+    """
+    Percentile bootstrap of the optimal threshold, maximum net profit and ROI.
+
+    n_jobs: worker processes (None / -1 = all CPUs, 1 = run in this
+    process). Workers are joblib (loky) processes; the sorted arrays reach
+    them as read-only memory maps, not copies.
+
+    Returns (summary, replicates):
+      summary     one row per statistic: estimate on the full sample,
+                  bootstrap mean, std and the (alpha/2, 1 - alpha/2)
+                  percentile interval
+      replicates  DataFrame with threshold, profit and roi per replicate
+    """
+    arrays = _sorted_arrays(y_true, prob_default, disbursement, costs)
+    estimate = _replicate_stats(arrays, np.ones(len(arrays['scores'])))
+
+    sizes = [min(chunk_size, n_boot - start) for start in range(0, n_boot, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+
+    if n_jobs == 1 or len(sizes) == 1:
+        parts = [_run_chunk(s, k, arrays) for s, k in zip(seeds, sizes)]
+    else:
+        parts = Parallel(n_jobs=min(n_jobs, len(sizes)))(
+            delayed(_run_chunk)(s, k, arrays) for s, k in zip(seeds, sizes))
+
+    replicates = pd.DataFrame(np.vstack(parts), columns=['threshold', 'profit', 'roi'])
+    lo, hi = alpha / 2, 1 - alpha / 2
+    summary = pd.DataFrame({
+        'estimate': estimate,
+        'mean': replicates.mean(),
+        'std': replicates.std(),
+        f'ci_{lo:g}': replicates.quantile(lo),
+        f'ci_{hi:g}': replicates.quantile(hi),
+    }, index=replicates.columns)
+    return summary, replicates
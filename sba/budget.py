@@ -0,0 +1,223 @@
+"""Loan selection under a disbursement budget.
+
+The gains charts fund loans from least to most risky until cumulative
+profit peaks. With a cap on total DisbursementGross (and optionally on
+each State) the question becomes a knapsack: which loans maximize
+expected profit without exceeding the budget?
+
+The expected value of granting loan i instead of denying it is
+
+    gain_i = d_i * ((1 - p_i) * (grant_pif - deny_pif) + p_i * (grant_default - deny_default))
+
+so profit per dollar, gain_i / d_i, only depends on p_i = P(Default):
+the greedy ratio order is the least-risky-first order of the gains
+chart. select_loans takes that greedy solution (skipping loans that no
+longer fit) and then solves the loans around the point where the budget
+runs out exactly with a small dynamic program (the "core" of the
+knapsack); everything safer than the core stays in, everything riskier
+stays out unless it still fits afterwards.
+
+    selected, summary = select_loans(probs_rf_default, disb_test, budget=500e6)
+    curve = budget_curve(probs_rf_default, disb_test)   # $1M .. full portfolio
+"""
+
+import numpy as np
+import pandas as pd
+
+from sba.profit import DEFAULT_COSTS, loan_values, net_profit
+from sba.segments import segment_codes
+
+
+def expected_values(prob_default, disbursement, costs=DEFAULT_COSTS):
+    """(expected profit if denied, expected gain of granting instead) per loan."""
+    p = np.asarray(prob_default, dtype=np.float64).ravel()
+    d = np.asarray(disbursement, dtype=np.float64).ravel()
+    if len(p) != len(d):
+        raise ValueError(f'length mismatch: prob_default {len(p)}, disbursement {len(d)}')
+    deny = d * ((1 - p) * costs.deny_pif + p * costs.deny_default)
+    gain = d * ((1 - p) * (costs.grant_pif - costs.deny_pif)
+                + p * (costs.grant_default - costs.deny_default))
+    return deny, gain
+
+
+def _ratio_order(prob_default, disbursement, gain):
+    """Loans worth granting, best profit per dollar first (smaller loans first on ties)."""
+    p = np.asarray(prob_default, dtype=np.float64).ravel()
+    d = np.asarray(disbursement, dtype=np.float64).ravel()
+    order = np.lexsort((d, p))
+    return order[gain[order] > 0]
+
+
+def _greedy(order, d, budget, state_codes=None, state_room=None):
+    """
+    Take loans in order while they fit; loans that do not fit are skipped
+    and later (riskier, smaller) ones may still be taken. Returns the taken
+    positions in `order`.
+    """
+    weights = d[order]
+    # everything before the first loan that breaks a cap is taken as a block
+    fits = np.cumsum(weights) <= budget
+    if state_codes is not None:
+        s = state_codes[order]
+        per_state = np.zeros(len(order))
+        by_state = np.argsort(s, kind='stable')
+        cum = np.cumsum(weights[by_state])
+        starts = np.searchsorted(s[by_state], s[by_state], side='left')
+        per_state[by_state] = cum - np.concatenate([[0.0], cum])[starts]
+        fits &= per_state <= state_room[s]
+    block = int(np.argmin(fits)) if not fits.all() else len(order)
+    taken = list(range(block))
+
+    room = budget - weights[:block].sum()
+    if state_codes is not None:
+        state_room = state_room - np.bincount(s[:block], weights=weights[:block],
+                                              minlength=len(state_room))
+    rest = block + np.flatnonzero(weights[block:] <= room)
+    for j, w in zip(rest.tolist(), weights[rest].tolist()):
+        if w > room:
+            continue
+        if state_codes is not None:
+            k = s[j]
+            if w > state_room[k]:
+                continue
+            state_room[k] -= w
+        taken.append(j)
+        room -= w
+    return np.asarray(taken, dtype=np.int64)
+
+
+def _knapsack(values, weights, capacity):
+    """Exact 0/1 knapsack on small integer weights; boolean mask of the items taken."""
+    n = len(values)
+    best = np.zeros(capacity + 1)
+    keep = np.zeros((n, capacity + 1), dtype=bool)
+    for i in range(n):
+        w = weights[i]
+        if w > capacity:
+            continue
+        candidate = best[:capacity + 1 - w] + values[i]
+        better = candidate > best[w:]
+        keep[i, w:] = better
+        best[w:] = np.where(better, candidate, best[w:])
+    take = np.zeros(n, dtype=bool)
+    c = int(np.argmax(best))
+    for i in range(n - 1, -1, -1):
+        if keep[i, c]:
+            take[i] = True
+            c -= weights[i]
+    return take
+
+
+def select_loans(prob_default, disbursement, budget, states=None, state_caps=None,
+                 y_true=None, core_size=200, resolution=1000.0, costs=DEFAULT_COSTS):
+    """
+    Loans to grant so that expected profit is maximal and the granted
+    DisbursementGross stays within budget.
+
+    states / state_caps: optional State of every loan and a dict (or
+    Series) {state: maximum disbursement}; states without a cap are only
+    limited by the budget. With state caps the greedy solution is
+    returned as is (the exact refinement only handles the single budget).
+
+    core_size loans around the budget cutoff are re-optimized exactly,
+    with disbursement rounded up to multiples of `resolution` dollars (so
+    the refined set never exceeds the budget); the refinement is kept only
+    if it beats the greedy solution.
+
+    Returns (selected, summary): a boolean mask over the loans (True =
+    grant) and a dict with budget, loans, disbursed, expected_profit
+    (whole portfolio, denied loans included), marginal_profit_per_dollar
+    (expected gain per dollar of the best loan left out) and, when y_true
+    is given, realized_profit from net_profit.
+    """
+    d = np.asarray(disbursement, dtype=np.float64).ravel()
+    deny, gain = expected_values(prob_default, d, costs)
+    order = _ratio_order(prob_default, d, gain)
+
+    state_codes = state_room = None
+    if state_caps is not None:
+        if states is None:
+            raise ValueError('state_caps needs states')
+        state_codes, labels = segment_codes(states)
+        caps = pd.Series(state_caps, dtype=np.float64).reindex(labels)
+        state_room = caps.fillna(np.inf).to_numpy()
+
+    taken = _greedy(order, d, budget, state_codes, state_room)
+
+    if state_caps is None and len(taken) < len(order) and core_size > 0:
+        # first loan the greedy pass had to skip = where the budget ran out
+        skipped = np.ones(len(order), dtype=bool)
+        skipped[taken] = False
+        cut = int(np.argmax(skipped))
+        lo, hi = max(cut - core_size // 2, 0), min(cut + core_size // 2, len(order))
+        fixed = d[order[:lo]].sum()
+        core = order[lo:hi]
+        # keep the DP table small: at most ~100k capacity units
+        resolution = max(resolution, d[core].sum() / 100_000)
+        units = np.ceil(d[core] / resolution).astype(np.int64)
+        capacity = int(min((budget - fixed) // resolution, units.sum()))
+        if capacity >= 0:
+            in_core = _knapsack(gain[core], units, capacity)
+            refined = np.concatenate([np.arange(lo), lo + np.flatnonzero(in_core)])
+            room = budget - d[order[refined]].sum()
+            tail = _greedy(order[hi:], d, room)
+            refined = np.concatenate([refined, hi + tail])
+            if gain[order[refined]].sum() > gain[order[taken]].sum():
+                taken = refined
+
+    selected = np.zeros(len(d), dtype=bool)
+    selected[order[taken]] = True
+    left_out = order[~np.isin(np.arange(len(order)), taken)]
+    summary = {
+        'budget': float(budget),
+        'loans': int(selected.sum()),
+        'disbursed': float(d[selected].sum()),
+        'expected_profit': float(deny.sum() + gain[selected].sum()),
+        'marginal_profit_per_dollar': float(gain[left_out[0]] / d[left_out[0]])
+                                      if len(left_out) else 0.0,
+    }
+    if y_true is not None:
+        summary['realized_profit'] = net_profit(y_true, (~selected).astype(int), d, costs)
+    return selected, summary
+
+
+def budget_curve(prob_default, disbursement, budgets=None, n_points=50, y_true=None,
+                 costs=DEFAULT_COSTS):
+    """
+    Greedy expected profit for a range of budgets, all from one sort.
+
+    budgets defaults to n_points values spaced geometrically from $1M to
+    the disbursement of every loan worth granting. For each budget the
+    loans are funded least risky first until the next one no longer fits.
+    Returns one row per budget: loans, disbursed, expected_profit,
+    upper_bound (the fractional / LP bound: no selection can do better),
+    marginal_profit_per_dollar at the cutoff and, with y_true,
+    realized_profit.
+    """
+    d = np.asarray(disbursement, dtype=np.float64).ravel()
+    deny, gain = expected_values(prob_default, d, costs)
+    order = _ratio_order(prob_default, d, gain)
+    weights, values = d[order], gain[order]
+    cum_w = np.concatenate([[0.0], np.cumsum(weights)])
+    cum_v = np.concatenate([[0.0], np.cumsum(values)])
+
+    if budgets is None:
+        budgets = np.geomspace(1e6, max(cum_w[-1], 1e6), n_points)
+    budgets = np.asarray(budgets, dtype=np.float64)
+
+    k = np.searchsorted(cum_w, budgets, side='right') - 1   # loans that fit as a prefix
+    ratio = np.append(values / weights, 0.0)[k]             # profit per dollar of the next loan
+    base = deny.sum()
+    table = pd.DataFrame({
+        'budget': budgets,
+        'loans': k,
+        'disbursed': cum_w[k],
+        'expected_profit': base + cum_v[k],
+        'upper_bound': base + cum_v[k] + ratio * (budgets - cum_w[k]).clip(0),
+        'marginal_profit_per_dollar': ratio,
+    })
+    if y_true is not None:
+        grant_real, deny_real = loan_values(y_true, d, costs)
+        cum_real = np.concatenate([[0.0], np.cumsum((grant_real - deny_real)[order])])
+        table['realized_profit'] = deny_real.sum() + cum_real[k]
+    return table
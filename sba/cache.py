@@ -0,0 +1,131 @@
+"""Columnar on-disk cache for typed / cleaned loan frames.
+
+A frame is stored as one `.npy` file per column plus a `manifest.json`
+describing dtypes and categories. Numeric and datetime columns are
+re-opened with `np.load(mmap_mode='r')`, so a cache hit costs a few
+file opens instead of a CSV parse. Categorical and string columns are
+stored as integer codes with their categories in the manifest; nullable
+(Int8, Float64, boolean) columns as their values plus a missing mask.
+`df.attrs` (e.g. the loader's 'malformed' positions) goes in the manifest
+too, so it must be JSON-serialisable.
+
+Entries are keyed by the source file's content hash plus a caller-supplied
+version string, and written to a temp directory first so a crashed run
+never leaves a half-written entry behind.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_dtype, is_numeric_dtype
+
+# Masked array type of each nullable dtype kind ('i'nteger, 'u'nsigned, ...)
+_MASKED = {'i': pd.arrays.IntegerArray, 'u': pd.arrays.IntegerArray,
+           'f': pd.arrays.FloatingArray, 'b': pd.arrays.BooleanArray}
+
+
+def source_fingerprint(path, chunk_size=1 << 20):
+    """blake2b hex digest of the file's contents."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _to_jsonable(values):
+    return [None if pd.isna(v) else (v.item() if hasattr(v, 'item') else v) for v in values]
+
+
+def write_frame(df, directory):
+    """Write df column by column into `directory` (created if needed)."""
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for i, col in enumerate(df.columns):
+        s = df[col]
+        fname = f'{i:03d}.npy'
+        entry = {'name': col, 'file': fname}
+        plain = (isinstance(s.dtype, np.dtype)
+                 and (is_numeric_dtype(s.dtype) or is_datetime64_dtype(s.dtype)))
+        masked = isinstance(s.dtype, pd.api.extensions.ExtensionDtype) and s.dtype.kind in _MASKED
+        if masked:
+            entry['kind'] = 'masked'
+            entry['dtype'] = str(s.dtype)
+            entry['mask'] = f'{i:03d}_mask.npy'
+            np.save(os.path.join(directory, entry['mask']), s.isna().to_numpy(), allow_pickle=False)
+            arr = s.to_numpy(dtype=s.dtype.numpy_dtype, na_value=0)
+        elif not plain:
+            cat = pd.Categorical(s)
+            entry['kind'] = 'category' if isinstance(s.dtype, pd.CategoricalDtype) else 'string'
+            entry['categories'] = _to_jsonable(cat.categories)
+            arr = cat.codes
+        else:
+            entry['kind'] = 'array'
+            arr = s.to_numpy()
+        np.save(os.path.join(directory, fname), arr, allow_pickle=False)
+        columns.append(entry)
+
+    np.save(os.path.join(directory, 'index.npy'), df.index.to_numpy(), allow_pickle=False)
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump({'nrows': len(df), 'columns': columns, 'attrs': df.attrs}, f)
+
+
+def read_frame(directory, mmap=True):
+    """Inverse of write_frame. Numeric columns are memory-mapped when mmap=True."""
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    mode = 'r' if mmap else None
+
+    data = {}
+    for entry in manifest['columns']:
+        arr = np.load(os.path.join(directory, entry['file']), mmap_mode=mode)
+        if entry['kind'] == 'array':
+            data[entry['name']] = arr
+            continue
+        if entry['kind'] == 'masked':
+            mask = np.load(os.path.join(directory, entry['mask']))
+            data[entry['name']] = _MASKED[pd.api.types.pandas_dtype(entry['dtype']).kind](np.asarray(arr), mask)
+            continue
+        cat = pd.Categorical.from_codes(np.asarray(arr), categories=entry['categories'])
+        data[entry['name']] = cat if entry['kind'] == 'category' else np.asarray(cat, dtype=object)
+
+    index = pd.Index(np.load(os.path.join(directory, 'index.npy')))
+    df = pd.DataFrame(data, index=index, copy=False)
+    df.attrs.update(manifest.get('attrs', {}))
+    return df
+
+
+def cached_frame(path, build, name, version, cache_dir='.sba_cache'):
+    """
+    Return build(path), reusing an on-disk copy when one exists for this
+    exact file content and version.
+
+    path:      source CSV
+    build:     callable path -> DataFrame, only called on a cache miss
+    name:      logical name of the frame ('typed', 'cleaned', ...)
+    version:   code version of `build`; part of the cache key
+    """
+    key = f'{name}-{source_fingerprint(path)}-v{version}'
+    target = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(target, 'manifest.json')):
+        return read_frame(target)
+
+    df = build(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f'.{key}-', dir=cache_dir)
+    try:
+        write_frame(df, tmp)
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # another run finished the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return read_frame(target)
@@ -0,0 +1,106 @@
+"""Cleaned modelling frame shared by the four model scripts.
+
+Applies the derived features the EDA also uses (sba.features: RealEstate,
+Recession, NAICS2, GuaranteeRatio), the ApprovalFY <= 2025 filter and the
+macroeconomic join, so the result is the same `df_cleaned` the scripts
+used to build by hand.
+"""
+
+import numpy as np
+
+from sba.cache import cached_frame
+from sba.features import add_features
+from sba.loader import SCHEMA_VERSION, load_sba
+from sba.macro import add_macro, default_registry
+
+
+# Bump whenever the output of clean_loans changes, so cached frames
+# built by older code are not picked up.
+FEATURE_VERSION = 2
+
+# Final feature set used by every model script
+FEATURES = [
+    'Term',
+    'DisbursementGross',
+    'GuaranteeRatio',
+    'FranchiseCode',
+    'RevLineCr_Binary',
+    'LowDoc_Binary',
+    'UrbanRural_Numeric',
+    'RealEstate',
+    'Recession',
+    'NAICS2',
+    'State',
+    'ApprovalFY',
+    'InterestRate',
+    'GDPGrowth',
+    'InflationRate']
+
+TARGET = 'MIS_Status_Binary'
+
+# Columns that get one-hot encoded
+CATEGORICAL_COLS = [
+    'FranchiseCode',
+    'RevLineCr_Binary',
+    'LowDoc_Binary',
+    'UrbanRural_Numeric',
+    'RealEstate',
+    'Recession',
+    'NAICS2',
+    'State',
+    'ApprovalFY']
+
+# Columns that get standardized
+NUMERIC_COLS = [
+    'Term',
+    'DisbursementGross',
+    'GuaranteeRatio',
+    'InflationRate',
+    'InterestRate',
+    'GDPGrowth']
+
+
+def clean_loans(df):
+    """Typed frame from load_sba -> df_cleaned."""
+    df = df[df['ApprovalDate'].notna()].copy()
+    add_features(df)
+    df = df[df['ApprovalFY'] <= 2025].copy()
+    return add_macro(df)
+
+
+def model_frame(df_cleaned):
+    """
+    df_cleaned -> df_model: FEATURES + TARGET only, rows with NA/inf dropped,
+    categorical columns cast to str (ready for pd.get_dummies).
+    """
+    df_model = df_cleaned[FEATURES + [TARGET]].copy()
+    df_model.replace([np.inf, -np.inf], np.nan, inplace=True)
+    df_model.dropna(inplace=True)
+    df_model[CATEGORICAL_COLS] = df_model[CATEGORICAL_COLS].astype(str)
+    return df_model
+
+
+def load_typed(path='SBAnational.csv', cache_dir='.sba_cache', use_cache=True):
+    """load_sba(path), cached on disk keyed by the CSV content hash and SCHEMA_VERSION."""
+    if not use_cache:
+        return load_sba(path)
+    return cached_frame(path, load_sba, name='typed', version=SCHEMA_VERSION,
+                        cache_dir=cache_dir)
+
+
+def load_clean(path='SBAnational.csv', cache_dir='.sba_cache', use_cache=True):
+    """
+    Build (or re-open from the on-disk cache) the cleaned frame for `path`.
+
+    The cache key is the CSV content hash plus SCHEMA_VERSION,
+    FEATURE_VERSION and the macro data's fingerprint, so an edited file,
+    changed feature code or updated macro series rebuilds it.
+    """
+    def build(p):
+        return clean_loans(load_sba(p))
+
+    if not use_cache:
+        return build(path)
+    return cached_frame(path, build, name='cleaned',
+                        version=f'{SCHEMA_VERSION}.{FEATURE_VERSION}.{default_registry().fingerprint()}',
+                        cache_dir=cache_dir)
@@ -0,0 +1,240 @@
+"""Bulk decoders for the raw text columns of SBAnational.csv.
+
+Currency strings such as '$60,000.00 ' are parsed straight from their
+character codes: each block of rows becomes a padded (rows x width) integer
+matrix and the digits are combined with positional weights, so no Python
+string object is created when the input is Arrow-backed (the loader's
+default when pyarrow is installed). Without pyarrow the column goes
+through numpy's fixed-width unicode arrays instead.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: only used for the zero-copy input path
+    pa = None
+
+
+_MAX_INT_DIGITS = 15   # $999 trillion; keeps the int64 cents and float64 exact
+
+# Character classes, looked up by character code (codes >= 128 are OTHER)
+OTHER, BLANK, DIGIT, DOT, MINUS, DOLLAR, COMMA = range(7)
+_CHAR_CLASS = np.full(256, OTHER, dtype=np.uint8)
+_CHAR_CLASS[[0, ord(' '), ord('\t')]] = BLANK    # 0 is block padding
+_CHAR_CLASS[ord(',')] = COMMA
+_CHAR_CLASS[ord('0'):ord('9') + 1] = DIGIT
+_CHAR_CLASS[ord('.')] = DOT
+_CHAR_CLASS[ord('-')] = MINUS
+_CHAR_CLASS[ord('$')] = DOLLAR
+
+
+def _arrow_blocks(arr, block_size):
+    """Yield (start, chars, null) blocks from a pyarrow (large_)string array."""
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if pa.types.is_large_string(arr.type):
+        off_type = np.int64
+    elif pa.types.is_string(arr.type):
+        off_type = np.int32
+    else:
+        arr = arr.cast(pa.large_string())
+        off_type = np.int64
+
+    n = len(arr)
+    _, off_buf, data_buf = arr.buffers()
+    offsets = np.frombuffer(off_buf, dtype=off_type)[arr.offset:arr.offset + n + 1].astype(np.int64)
+    data = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.zeros(0, np.uint8)
+    data = np.append(data, np.uint8(0))   # index target for padding cells
+    pad = len(data) - 1
+    null = arr.is_null().to_numpy(zero_copy_only=False)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        starts = offsets[start:stop]
+        ends = offsets[start + 1:stop + 1]
+        width = int((ends - starts).max()) if stop > start else 0
+        idx = starts + np.arange(width)[:, None]
+        idx[idx >= ends] = pad
+        yield start, data[idx], null[start:stop]
+
+
+def _fixed_width_blocks(chars, null, block_size):
+    """Yield (start, chars, null) blocks from a numpy 'S' / 'U' array."""
+    code = np.uint8 if chars.dtype.kind == 'S' else np.uint32
+    if chars.itemsize == 0:
+        chars = chars.astype(chars.dtype.kind + '1')
+    matrix = chars.view(code).reshape(len(chars), -1)
+    for start in range(0, len(chars), block_size):
+        stop = start + block_size
+        yield start, np.ascontiguousarray(matrix[start:stop].T), null[start:stop]
+
+
+def char_blocks(values, block_size=1 << 13):
+    """
+    Split a string column into blocks of padded character-code matrices.
+
+    Yields (start_row, chars, null) where chars is (width x rows), one row
+    per character position so each position is a contiguous vector, with 0
+    as padding; null flags missing entries.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'SU':
+        return _fixed_width_blocks(values, np.zeros(len(values), dtype=bool), block_size)
+
+    if pa is not None:
+        arr = values.array if isinstance(values, pd.Series) else values
+        if isinstance(arr, (pa.Array, pa.ChunkedArray)):
+            return _arrow_blocks(arr, block_size)
+        if hasattr(arr, '__arrow_array__'):
+            return _arrow_blocks(pa.array(arr), block_size)
+        try:
+            return _arrow_blocks(pa.array(np.asarray(arr, dtype=object), from_pandas=True), block_size)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass   # mixed str / number cells: go through numpy below
+
+    s = pd.Series(values, copy=False)
+    null = s.isna().to_numpy()
+    text = np.asarray(s.where(~null, '').astype(str).to_numpy(), dtype=str)
+    return _fixed_width_blocks(text, null, block_size)
+
+
+def _shift(mask, k):
+    """mask[pos + k] at every position pos (False past either end)."""
+    out = np.zeros_like(mask)
+    if k > 0:
+        out[:-k] = mask[k:]
+    elif k < 0:
+        out[-k:] = mask[:k]
+    return out
+
+
+def _parse_currency_block(chars):
+    """(width x rows) character codes -> (cents, has_digits, malformed)."""
+    if chars.dtype != np.uint8:
+        chars = np.minimum(chars, 255).astype(np.uint8)
+    cls = _CHAR_CLASS[chars]
+    is_digit = cls == DIGIT
+    is_dot = cls == DOT
+    is_minus = cls == MINUS
+    width, n = chars.shape
+
+    # Horner over character positions: every digit (integer or fraction
+    # part) shifts the running value one decimal place to the left
+    digits = chars.astype(np.int64) - ord('0')
+    value = np.zeros(n, dtype=np.int64)
+    n_frac = np.zeros(n, dtype=np.int32)
+    seen_dot = np.zeros(n, dtype=bool)
+    for pos in range(width):
+        d = is_digit[pos]
+        value = np.where(d, value * 10 + digits[pos], value)
+        n_frac += d & seen_dot
+        seen_dot |= is_dot[pos]
+
+    n_digits = is_digit.sum(axis=0)
+    has_digits = n_digits > 0
+    has_minus = is_minus.any(axis=0)
+    is_dollar = cls == DOLLAR
+    is_comma = cls == COMMA
+    malformed = ((cls == OTHER).any(axis=0)
+                 | (is_dot.sum(axis=0) > 1)
+                 | (is_minus.sum(axis=0) > 1)
+                 | (is_dollar.sum(axis=0) > 1)
+                 | (n_frac > 2)
+                 | (n_digits - n_frac > _MAX_INT_DIGITS))
+    # '-' and '$' are only allowed in front of the number
+    first_digit = is_digit.argmax(axis=0)
+    last_minus = width - 1 - is_minus[::-1].argmax(axis=0)
+    malformed |= has_minus & has_digits & (last_minus > first_digit)
+    last_dollar = width - 1 - is_dollar[::-1].argmax(axis=0)
+    malformed |= is_dollar.any(axis=0) & has_digits & (last_dollar > first_digit)
+    # blanks only around the text, not inside it
+    text = ~(cls == BLANK)
+    pos = np.arange(width)[:, None]
+    first_text = text.argmax(axis=0)
+    last_text = width - 1 - text[::-1].argmax(axis=0)
+    malformed |= text.any(axis=0) & (~text & (pos > first_text) & (pos < last_text)).any(axis=0)
+    # ',' only between 3-digit groups of the integer part: digit before,
+    # exactly three digits after, and at most three digits before the first
+    grouped = (_shift(is_digit, -1) & _shift(is_digit, 1) & _shift(is_digit, 2)
+               & _shift(is_digit, 3) & ~_shift(is_digit, 4))
+    after_dot = np.cumsum(is_dot, axis=0) > 0
+    malformed |= (is_comma & (~grouped | after_dot)).any(axis=0)
+    lead = np.cumsum(is_digit, axis=0)[is_comma.argmax(axis=0), np.arange(n)]
+    malformed |= is_comma.any(axis=0) & (lead > 3)
+    # '$' or '.' with no digits at all is not an empty cell
+    malformed |= ~has_digits & (seen_dot | is_dollar.any(axis=0) | is_comma.any(axis=0))
+
+    cents = value * np.array([100, 10, 1], dtype=np.int64)[np.minimum(n_frac, 2)]
+    cents[has_minus] *= -1
+    return cents, has_digits, malformed
+
+
+def parse_currency(values, block_size=1 << 13):
+    """
+    Parse currency strings ('$60,000.00 ', '1,250', '-12.5') to integer cents.
+
+    Returns (cents, valid, malformed):
+      cents:     int64, 0 wherever valid is False
+      valid:     True where a number was decoded
+      malformed: True where the cell had text that is not a currency amount
+                 (missing / blank cells are neither valid nor malformed)
+
+    Accepted: blanks only before and after the amount, one '-' and one '$'
+    before the first digit, ',' only between 3-digit groups of the integer
+    part, at most two decimals.
+    """
+    n = len(values)
+    cents = np.zeros(n, dtype=np.int64)
+    valid = np.zeros(n, dtype=bool)
+    malformed = np.zeros(n, dtype=bool)
+    for start, chars, null in char_blocks(values, block_size):
+        stop = start + len(null)
+        if chars.shape[0] == 0:
+            continue   # all cells empty or missing
+        c, has_digits, bad = _parse_currency_block(chars)
+        bad &= ~null
+        ok = has_digits & ~bad & ~null
+        cents[start:stop] = np.where(ok, c, 0)
+        valid[start:stop] = ok
+        malformed[start:stop] = bad
+    return cents, valid, malformed
+
+
+def decode_currency(values, block_size=1 << 13):
+    """
+    Currency strings -> (float64 dollars, malformed mask).
+
+    Missing and malformed cells both come back as NaN; use the mask to tell
+    them apart.
+    """
+    cents, valid, malformed = parse_currency(values, block_size)
+    dollars = cents / 100.0
+    dollars[~valid] = np.nan
+    return dollars, malformed
+
+
+def decode_dates(values, fmt='%d-%b-%y', max_year=None):
+    """
+    Date strings in one fixed format -> datetime64 array (NaT if missing/bad).
+
+    SBA files hold only a few thousand distinct dates, so each distinct
+    string is parsed once and the result is broadcast back through the
+    factorized codes. '%y' maps 00-68 to 2000-2068; with max_year given,
+    any date that lands after it is moved back a century, so '28-Feb-66'
+    is 1966 rather than 2066. max_year=None keeps the plain '%y' rule.
+    """
+    if isinstance(values, pd.Categorical) or isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        cat = pd.Categorical(values)
+        codes, uniques = cat.codes, cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+
+    parsed = pd.to_datetime(pd.Index(uniques, dtype=object), format=fmt, errors='coerce')
+    if max_year is not None:
+        future = parsed.year > max_year
+        if future.any():
+            parsed = parsed.where(~future, parsed - pd.DateOffset(years=100))
+
+    lookup = np.append(parsed.to_numpy(), np.datetime64('NaT'))
+    return lookup[codes]   # code -1 (missing) picks the trailing NaT
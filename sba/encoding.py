@@ -0,0 +1,318 @@
+"""Categorical encoders with a vocabulary that is fixed once fitted.
+
+pd.get_dummies derives its columns from whatever rows it is given, so two
+chunks (or a train and a scoring file) can end up with different layouts.
+The encoders here learn the levels first and then always emit the same
+columns, which is what chunked / streaming processing needs.
+
+DummyEncoder / design_matrix reproduce the one-hot layout as sparse CSR;
+HashingEncoder maps levels into a fixed number of hashed columns instead,
+so its layout never depends on the data; TargetEncoder /
+compact_preprocessor replace the high-cardinality dummies with a few
+out-of-fold target and frequency columns.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+from sklearn.utils import murmurhash3_32
+
+
+# str() of a whole-number float, e.g. '1997.0' or '-1.0'
+_WHOLE_FLOAT = re.compile(r'^(-?\d+)\.0\Z')
+
+
+class DummyEncoder:
+    """
+    One-hot encoding laid out exactly like
+    pd.get_dummies(df, columns=columns, drop_first=True): levels sorted as
+    strings, the first level of each column dropped, columns named
+    '<column>_<level>'. Levels not seen while fitting encode as all zeros.
+    """
+
+    def __init__(self, columns, drop_first=True):
+        self.columns = list(columns)
+        self.drop_first = drop_first
+        self.levels_ = {col: set() for col in self.columns}
+
+    def partial_fit(self, df):
+        """Add the levels present in df (str-cast) to the vocabulary."""
+        for col in self.columns:
+            self.levels_[col].update(pd.unique(df[col].astype(str)))
+        return self
+
+    def fit(self, df):
+        self.levels_ = {col: set() for col in self.columns}
+        return self.partial_fit(df)
+
+    def vocabulary(self, col):
+        """Sorted levels of col that get an output column."""
+        levels = sorted(self.levels_[col])
+        return levels[1:] if self.drop_first else levels
+
+    @property
+    def feature_names_(self):
+        return [f'{col}_{level}' for col in self.columns for level in self.vocabulary(col)]
+
+    def transform_codes(self, df):
+        """
+        Column index (into feature_names_) of the active dummy for each
+        categorical column: (n_rows x n_columns) int64, -1 where no dummy
+        is active (dropped first level or unseen level).
+        """
+        out = np.empty((len(df), len(self.columns)), dtype=np.int64)
+        offset = 0
+        for j, col in enumerate(self.columns):
+            vocab = self.vocabulary(col)
+            codes = pd.Categorical(df[col].astype(str), categories=vocab).codes.astype(np.int64)
+            out[:, j] = np.where(codes >= 0, codes + offset, -1)
+            offset += len(vocab)
+        return out
+
+    def transform(self, df):
+        """Dense bool dummy frame with columns feature_names_, index of df."""
+        names = self.feature_names_
+        codes = self.transform_codes(df)
+        dummies = np.zeros((len(df), len(names)), dtype=bool)
+        rows, cols = np.nonzero(codes >= 0)
+        dummies[rows, codes[rows, cols]] = True
+        return pd.DataFrame(dummies, index=df.index, columns=names)
+
+    def transform_sparse(self, df, dtype=np.float64):
+        """Same as transform, as an (n_rows x n_features) CSR matrix."""
+        codes = self.transform_codes(df)
+        active = codes >= 0
+        indptr = np.concatenate([[0], np.cumsum(active.sum(axis=1))])
+        # codes of one row are increasing (column offsets grow), so the CSR is sorted
+        return sp.csr_matrix((np.ones(indptr[-1], dtype=dtype), codes[active], indptr),
+                             shape=(len(df), len(self.feature_names_)))
+
+    def encode(self, df):
+        """Drop-in for pd.get_dummies(df, columns=self.columns, drop_first=True)."""
+        rest = df.drop(columns=self.columns)
+        return pd.concat([rest, self.transform(df)], axis=1)
+
+
+class HashingEncoder:
+    """
+    Feature hashing alternative to DummyEncoder for online / streaming
+    scoring. Every '<column>=<level>' token (str-cast, like DummyEncoder,
+    but with whole-number floats written as integers so a level hashes the
+    same from an int64 and a float64 chunk: '1997.0' -> '1997') lands in
+    one of n_features columns chosen by a seeded murmurhash3, so
+    the layout is fixed before any data is seen: new franchise codes,
+    NAICS sectors or fiscal years never need a refit or shift columns, and
+    memory does not grow with the number of levels.
+
+    Tokens that collide add up in the same column; with alternate_sign=True
+    half the tokens count -1 so collisions cancel out on average (as in
+    sklearn's FeatureHasher). Low-cardinality columns can be hashed along
+    with the rest; at the default width they almost never collide.
+
+    Has the same fit / feature_names_ / transform_sparse interface as
+    DummyEncoder, so it works with design_matrix and sba.stream.
+    """
+
+    def __init__(self, columns, n_features=1 << 12, seed=0, alternate_sign=False):
+        self.columns = list(columns)
+        self.n_features = n_features
+        self.seed = seed
+        self.alternate_sign = alternate_sign
+
+    def partial_fit(self, df):
+        """Nothing to learn; kept so fit_encoder / write_shards accept it."""
+        return self
+
+    def fit(self, df):
+        return self
+
+    @property
+    def feature_names_(self):
+        width = len(str(self.n_features - 1))
+        return [f'hash_{i:0{width}d}' for i in range(self.n_features)]
+
+    def _buckets(self, col, levels):
+        """(column index, sign) of each level of col."""
+        levels = [_WHOLE_FLOAT.sub(r'\1', level) for level in levels]
+        h = np.array([murmurhash3_32(f'{col}={level}', seed=self.seed) for level in levels],
+                     dtype=np.int64)
+        sign = np.where(h < 0, -1.0, 1.0) if self.alternate_sign else np.ones(len(h))
+        return np.abs(h) % self.n_features, sign
+
+    def transform_sparse(self, df, dtype=np.float64):
+        """(n_rows x n_features) CSR; every row has one token per column."""
+        n = len(df)
+        rows = np.tile(np.arange(n), len(self.columns))
+        cols = np.empty(n * len(self.columns), dtype=np.int64)
+        vals = np.empty(n * len(self.columns), dtype=dtype)
+        for j, col in enumerate(self.columns):
+            # hash each distinct level once, then broadcast through the codes
+            codes, uniques = pd.factorize(df[col].astype(str))
+            bucket, sign = self._buckets(col, uniques)
+            cols[j * n:(j + 1) * n] = bucket[codes]
+            vals[j * n:(j + 1) * n] = sign[codes]
+        # coo -> csr sums colliding tokens and sorts the column indices
+        return sp.coo_matrix((vals, (rows, cols)), shape=(n, self.n_features)).tocsr()
+
+
+def design_matrix(df_model, encoder, numeric_cols):
+    """
+    Sparse replacement for pd.get_dummies(...).drop(target, axis=1).
+
+    Returns (X, feature_names): X is CSR float64 with numeric_cols first
+    (in that order) followed by encoder's dummy columns.
+    """
+    dense = sp.csr_matrix(df_model[numeric_cols].to_numpy(dtype=np.float64))
+    X = sp.hstack([dense, encoder.transform_sparse(df_model)], format='csr')
+    return X, list(numeric_cols) + encoder.feature_names_
+
+
+def to_dense(X):
+    """Sparse -> ndarray; module-level so pipelines using it stay picklable."""
+    return X.toarray() if sp.issparse(X) else np.asarray(X)
+
+
+def sparse_preprocessor(n_numeric):
+    """
+    ColumnTransformer for design_matrix output: standardize the first
+    n_numeric columns, pass the dummies through, and keep the result CSR.
+    """
+    scale = Pipeline([('dense', FunctionTransformer(to_dense)), ('scale', StandardScaler())])
+    return ColumnTransformer(
+        transformers=[
+            ('num', scale, list(range(n_numeric))),
+            ('passthrough', 'passthrough', slice(n_numeric, None))],
+        remainder='drop',
+        sparse_threshold=1.0)
+
+
+class TargetEncoder(BaseEstimator, TransformerMixin):
+    """
+    Leakage-safe encoding of high-cardinality columns (FranchiseCode, State,
+    NAICS2) into two numbers each: the smoothed default rate of the level
+    and its frequency.
+
+    - levels with fewer than min_count training rows, and levels never seen
+      in training, share one 'rare' bucket
+    - target means are shrunk towards the prior:
+          (defaults + smoothing * prior) / (loans + smoothing)
+    - fit_transform encodes every training row with statistics from the
+      other n_splits - 1 folds only (out-of-fold), so a row never sees its
+      own label; transform uses the full training statistics
+
+    Works on DataFrames or 2-D arrays, so it can sit inside a
+    ColumnTransformer / Pipeline in place of one-hot encoding.
+    """
+
+    def __init__(self, smoothing=20.0, min_count=50, n_splits=5, frequency=True, random_state=0):
+        self.smoothing = smoothing
+        self.min_count = min_count
+        self.n_splits = n_splits
+        self.frequency = frequency
+        self.random_state = random_state
+
+    @staticmethod
+    def _column(X, j):
+        col = X.iloc[:, j] if isinstance(X, pd.DataFrame) else pd.Series(np.asarray(X)[:, j])
+        return col.astype(str)
+
+    def _codes(self, X, j):
+        """Level index of every row; the rare bucket is len(levels_[j])."""
+        levels = self.levels_[j]
+        codes = pd.Categorical(self._column(X, j), categories=levels).codes.astype(np.int64)
+        codes[codes < 0] = len(levels)
+        return codes
+
+    def fit(self, X, y):
+        y = np.asarray(y, dtype=np.float64)
+        self.n_features_in_ = X.shape[1]
+        self.feature_names_in_ = (np.asarray(X.columns, dtype=object) if isinstance(X, pd.DataFrame)
+                                  else np.array([f'x{j}' for j in range(X.shape[1])], dtype=object))
+        self.prior_ = y.mean()
+        self.levels_, self.sums_, self.counts_ = [], [], []
+        for j in range(self.n_features_in_):
+            codes, uniques = pd.factorize(self._column(X, j), sort=True)
+            counts = np.bincount(codes, minlength=len(uniques))
+            self.levels_.append(pd.Index(uniques[counts >= self.min_count]))
+            codes = self._codes(X, j)
+            k = len(self.levels_[j]) + 1
+            self.sums_.append(np.bincount(codes, weights=y, minlength=k))
+            self.counts_.append(np.bincount(codes, minlength=k).astype(np.float64))
+        self.n_rows_ = len(y)
+        return self
+
+    def _encode(self, sums, counts, prior, codes, n_rows):
+        m = self.smoothing
+        out = [(sums[codes] + m * prior) / (counts[codes] + m)]
+        if self.frequency:
+            out.append(counts[codes] / n_rows)
+        return out
+
+    def transform(self, X):
+        cols = []
+        for j in range(self.n_features_in_):
+            codes = self._codes(X, j)
+            cols += self._encode(self.sums_[j], self.counts_[j], self.prior_, codes, self.n_rows_)
+        return np.column_stack(cols)
+
+    def fit_transform(self, X, y):
+        self.fit(X, y)
+        y = np.asarray(y, dtype=np.float64)
+        n, k_folds = len(y), self.n_splits
+        fold = np.empty(n, dtype=np.int64)
+        fold[np.random.default_rng(self.random_state).permutation(n)] = np.arange(n) % k_folds
+
+        # prior of the rows outside each fold
+        fold_n = np.bincount(fold, minlength=k_folds)
+        fold_y = np.bincount(fold, weights=y, minlength=k_folds)
+        oof_prior = (y.sum() - fold_y) / (n - fold_n)
+
+        cols = []
+        for j in range(self.n_features_in_):
+            codes = self._codes(X, j)
+            k = len(self.sums_[j])
+            key = fold * k + codes
+            in_sums = np.bincount(key, weights=y, minlength=k_folds * k).reshape(k_folds, k)
+            in_counts = np.bincount(key, minlength=k_folds * k).reshape(k_folds, k)
+            oof_sums = self.sums_[j][None, :] - in_sums
+            oof_counts = self.counts_[j][None, :] - in_counts
+            m = self.smoothing
+            cols.append((oof_sums[fold, codes] + m * oof_prior[fold]) / (oof_counts[fold, codes] + m))
+            if self.frequency:
+                # frequency does not use the label, so full-training counts are safe
+                cols.append(self.counts_[j][codes] / self.n_rows_)
+        return np.column_stack(cols)
+
+    def get_feature_names_out(self, input_features=None):
+        names = self.feature_names_in_ if input_features is None else input_features
+        suffixes = ['_te', '_freq'] if self.frequency else ['_te']
+        return np.array([f'{c}{s}' for c in names for s in suffixes], dtype=object)
+
+
+# High-cardinality columns that get target / frequency encoded by default
+HIGH_CARDINALITY_COLS = ['FranchiseCode', 'State', 'NAICS2']
+
+
+def compact_preprocessor(numeric_cols, categorical_cols, high_card_cols=HIGH_CARDINALITY_COLS, **te_params):
+    """
+    Drop-in replacement for one-hot preprocessing on df_model[features]:
+    numeric_cols standardized, high_card_cols target/frequency encoded
+    (out-of-fold while fitting) and standardized, the remaining
+    categorical_cols one-hot encoded. Feature width goes from thousands of
+    dummies to a few dozen columns.
+    """
+    low_card_cols = [c for c in categorical_cols if c not in high_card_cols]
+    return ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), list(numeric_cols)),
+            ('te', Pipeline([('enc', TargetEncoder(**te_params)), ('scale', StandardScaler())]),
+             list(high_card_cols)),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), low_card_cols)],
+        remainder='drop',
+        sparse_threshold=0)
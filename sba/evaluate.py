@@ -0,0 +1,370 @@
+"""Evaluation of P(Default) scores on the test loans.
+
+ScoreCurve sorts one model's scores once and keeps cumulative sums of
+defaults and per-loan profit in that order; ROC / AUC, confusion counts
+at any threshold, profit, gains, lift and decile tables are all read off
+those sums instead of re-sorting or rescanning the scores per metric.
+
+    curve = ScoreCurve(y_test.values, probs_rf_default, disb_test)
+    fpr, tpr, thresholds = curve.roc()
+    curve.auc(), curve.confusion(0.5), curve.deciles()
+
+gains_lift wraps the gains / lift part for the charts: a downsampled
+curve plus the best fraction to fund, its profit and the P(PIF) cutoff.
+
+compare_models does the same for several models side by side:
+
+    probs = {'Ridge': p_ridge, 'Lasso': p_lasso, 'KNN': p_knn, 'RF': p_rf, 'MLP': p_mlp}
+    table, curves = compare_models(probs, y_test.values, disb_test)
+
+Every model's column is sorted once (one argsort over the whole score
+matrix) and the profit, default count and disbursement of the granted
+loans are cumulative sums down the sorted columns, so the optimal
+threshold, ROI and confusion matrix of every model come from the same
+arrays, with no per-model or per-threshold loop.
+
+approval_frontier lists every operating point of one model (approval
+rate, profit, capital, default rates) with its Pareto flag, and
+frontier_at interpolates it at given approval rates or capital amounts:
+
+    frontier = approval_frontier(y_test.values, probs_rf_default, disb_test)
+    frontier_at(frontier, approval_rate=[0.6, 0.7, 0.8])
+"""
+
+import numpy as np
+import pandas as pd
+
+from sba.profit import DEFAULT_COSTS, loan_values
+
+
+class ScoreCurve:
+    """
+    One model's scores sorted from least to most risky, with cumulative
+    counts and profit. Thresholds follow the scripts' rule: deny (predict
+    default) when P(Default) >= threshold, grant otherwise.
+    """
+
+    def __init__(self, y_true, prob_default, disbursement=None, costs=DEFAULT_COSTS):
+        scores = np.asarray(prob_default, dtype=np.float64).ravel()
+        truth = np.asarray(y_true).astype(np.int64, copy=False).ravel()
+        if len(truth) != len(scores):
+            raise ValueError(f'length mismatch: y_true {len(truth)}, prob_default {len(scores)}')
+        if len(truth) == 0:
+            raise ValueError('ScoreCurve needs at least one loan')
+        order = np.argsort(scores, kind='stable')
+        self.scores = scores[order]
+        self.n = len(scores)
+        self.n_default = int(truth.sum())
+
+        # element k of every cum_* array covers the k least risky loans
+        self.cum_default = np.concatenate([[0], np.cumsum(truth[order])])
+        if disbursement is not None:
+            grant, deny = loan_values(truth, disbursement, costs)
+            self.cum_grant = np.concatenate([[0.0], np.cumsum(grant[order])])
+            self.cum_deny = np.concatenate([[0.0], np.cumsum(deny[order])])
+        else:
+            self.cum_grant = self.cum_deny = None
+
+        # first sorted position of every distinct score
+        self.starts = np.flatnonzero(np.concatenate([[True], self.scores[1:] != self.scores[:-1]]))
+
+    def n_granted(self, thresholds):
+        """Number of loans with P(Default) < threshold."""
+        return np.searchsorted(self.scores, thresholds, side='left')
+
+    def confusion(self, thresholds):
+        """
+        Confusion matrix [[tn, fp], [fn, tp]] (positive = default) at each
+        threshold: shape (2, 2) for a scalar, (len(thresholds), 2, 2) otherwise.
+        """
+        k = self.n_granted(thresholds)
+        fn = self.cum_default[k]
+        tn = k - fn
+        tp = self.n_default - fn
+        fp = (self.n - k) - tp
+        return np.stack([np.stack([tn, fp], -1), np.stack([fn, tp], -1)], -2)
+
+    def roc(self):
+        """
+        (fpr, tpr, thresholds) with thresholds decreasing from inf, one
+        point per distinct score, like sklearn's roc_curve with
+        drop_intermediate=False.
+        """
+        k = np.append(self.n, self.starts[::-1])
+        tp = self.n_default - self.cum_default[k]
+        fp = (self.n - k) - tp
+        thresholds = np.append(np.inf, self.scores[self.starts[::-1]])
+        return fp / (self.n - self.n_default), tp / self.n_default, thresholds
+
+    def auc(self):
+        """Area under the ROC curve (trapezoids, so ties count one half)."""
+        fpr, tpr, _ = self.roc()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1])) / 2)
+
+    def _require_profit(self):
+        if self.cum_grant is None:
+            raise ValueError('ScoreCurve was built without disbursement')
+
+    def profit(self, thresholds):
+        """Net profit (grant and deny cells) at each threshold."""
+        self._require_profit()
+        k = self.n_granted(thresholds)
+        return self.cum_deny[-1] + (self.cum_grant - self.cum_deny)[k]
+
+    def gains(self):
+        """
+        (fraction funded, cumulative profit of the funded loans) when loans
+        are funded from least to most risky, one point per loan; denied
+        loans count zero, as in the scripts' gains charts.
+        """
+        self._require_profit()
+        return np.arange(1, self.n + 1) / self.n, self.cum_grant[1:]
+
+    def lift(self):
+        """(fraction funded, cumulative average profit / average profit of all loans)."""
+        fraction, cum_profit = self.gains()
+        baseline = self.cum_grant[-1] / self.n
+        return fraction, cum_profit / np.arange(1, self.n + 1) / baseline
+
+    def best_funding(self):
+        """
+        Where the gains curve peaks: best_count loans funded (least risky
+        first), best_fraction of all loans, max_profit, and the P(PIF)
+        cutoff, i.e. fund applicants with P(PIF) >= p_pif_cutoff.
+        """
+        fraction, cum_profit = self.gains()
+        best = int(np.argmax(cum_profit))
+        return {'best_count': best + 1,
+                'best_fraction': float(fraction[best]),
+                'max_profit': float(cum_profit[best]),
+                'p_pif_cutoff': float(1.0 - self.scores[best])}
+
+    def gains_curve(self, n_points=1000):
+        """
+        Gains and lift downsampled to about n_points rows for plotting
+        (the peak is always kept): fraction funded, loans funded, P(PIF)
+        of the last funded loan, cumulative profit, lift, and the
+        cumulative profit of funding the same share at random.
+        """
+        fraction, cum_profit = self.gains()
+        keep = np.round(np.linspace(0, self.n - 1, min(n_points, self.n))).astype(np.int64)
+        keep = np.union1d(keep, np.argmax(cum_profit))
+        count = keep + 1
+        baseline = self.cum_grant[-1] / self.n
+        return pd.DataFrame({
+            'fraction': fraction[keep],
+            'n_funded': count,
+            'p_pif': 1.0 - self.scores[keep],
+            'cum_profit': cum_profit[keep],
+            'lift': cum_profit[keep] / count / baseline,
+            'random_profit': baseline * count,
+        })
+
+    def deciles(self, n_bins=10):
+        """
+        Loans split into n_bins equal-count bins from least to most risky:
+        score range, loans, defaults, default rate, cumulative share of
+        all defaults and, with disbursement, profit if funded, cumulative
+        profit and lift.
+        """
+        edges = np.round(np.linspace(0, self.n, n_bins + 1)).astype(np.int64)
+        lo, hi = edges[:-1], edges[1:]
+        loans = hi - lo
+        defaults = self.cum_default[hi] - self.cum_default[lo]
+        last = np.maximum(hi - 1, lo)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table = pd.DataFrame({
+                'min_p_default': self.scores[np.minimum(lo, self.n - 1)],
+                'max_p_default': self.scores[np.minimum(last, self.n - 1)],
+                'loans': loans,
+                'defaults': defaults,
+                'default_rate': defaults / loans,
+                'cum_default_share': self.cum_default[hi] / self.n_default,
+            }, index=pd.RangeIndex(1, n_bins + 1, name='bin'))
+            if self.cum_grant is not None:
+                table['profit_if_funded'] = self.cum_grant[hi] - self.cum_grant[lo]
+                table['cum_profit'] = self.cum_grant[hi]
+                table['lift'] = (self.cum_grant[hi] / hi) / (self.cum_grant[-1] / self.n)
+        return table
+
+
+def gains_lift(y_true, prob_default, disbursement, n_points=1000, costs=DEFAULT_COSTS):
+    """
+    Gains / lift of funding loans from least to most risky, on raw arrays.
+    Returns (curve, summary): ScoreCurve.gains_curve(n_points) and
+    ScoreCurve.best_funding().
+    """
+    curve = ScoreCurve(y_true, prob_default, disbursement, costs)
+    return curve.gains_curve(n_points), curve.best_funding()
+
+
+def score_matrix(probs):
+    """dict / DataFrame / 2-D array of P(Default) -> (names, (n_loans x n_models) array)."""
+    if isinstance(probs, dict):
+        names = list(probs)
+        matrix = np.column_stack([np.asarray(probs[k], dtype=np.float64).ravel() for k in names])
+    elif isinstance(probs, pd.DataFrame):
+        names = [str(c) for c in probs.columns]
+        matrix = probs.to_numpy(dtype=np.float64)
+    else:
+        matrix = np.asarray(probs, dtype=np.float64)
+        if matrix.ndim == 1:
+            matrix = matrix[:, None]
+        names = [f'model_{j}' for j in range(matrix.shape[1])]
+    return names, matrix
+
+
+def compare_models(probs, y_true, disbursement, costs=DEFAULT_COSTS):
+    """
+    Profit-optimal threshold of every model under one cost matrix.
+
+    Returns (table, curves):
+      table   one row per model: threshold (deny when P(Default) >=
+              threshold), profit, granted_disbursement, roi, approval_rate,
+              confusion counts tn / fp / fn / tp (positive = default,
+              predicted positive = deny), default_precision, default_recall
+      curves  {model: (thresholds, profits)}, the exact profit curve at
+              every distinct score, as sba.profit.profit_curve returns it
+    """
+    names, P = score_matrix(probs)
+    n, m = P.shape
+    truth = np.asarray(y_true).astype(np.int64, copy=False).ravel()
+    disbursement = np.asarray(disbursement, dtype=np.float64).ravel()
+    if not len(truth) == len(disbursement) == n:
+        raise ValueError(f'length mismatch: probs {n}, y_true {len(truth)}, '
+                         f'disbursement {len(disbursement)}')
+    grant, deny = loan_values(truth, disbursement, costs)
+
+    order = np.argsort(P, axis=0)
+    S = np.take_along_axis(P, order, axis=0)
+
+    # row k of each cumulative array = totals over the k lowest-risk loans,
+    # i.e. the loans granted when the cutoff sits just above them
+    def granted_totals(values):
+        out = np.zeros((n + 1, m))
+        np.cumsum(values[order], axis=0, out=out[1:])
+        return out
+
+    profit = deny.sum() + granted_totals(grant - deny)
+    granted_defaults = granted_totals(truth.astype(np.float64))
+    granted_disb = granted_totals(disbursement)
+
+    # a cutoff can only fall between two different scores (or at either end)
+    breakpoint_ = np.ones((n + 1, m), dtype=bool)
+    breakpoint_[1:n] = S[1:] != S[:-1]
+    best = np.argmax(np.where(breakpoint_, profit, -np.inf), axis=0)
+
+    cols = np.arange(m)
+    above_max = np.nextafter(S[-1], np.inf)
+    threshold = np.where(best < n, S[np.minimum(best, n - 1), cols], above_max)
+    best_profit = profit[best, cols]
+    best_granted = granted_disb[best, cols]
+
+    total_defaults = truth.sum()
+    fn = granted_defaults[best, cols].astype(np.int64)
+    tn = best - fn
+    tp = total_defaults - fn
+    fp = (n - best) - tp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = pd.DataFrame({
+            'threshold': threshold,
+            'profit': best_profit,
+            'granted_disbursement': best_granted,
+            'roi': np.where(best_granted > 0, best_profit / best_granted, np.nan),
+            'approval_rate': best / n,
+            'tn': tn, 'fp': fp, 'fn': fn, 'tp': tp,
+            'default_precision': tp / (tp + fp),
+            'default_recall': tp / (tp + fn),
+        }, index=pd.Index(names, name='model'))
+
+    curves = {}
+    for j, name in enumerate(names):
+        ks = np.flatnonzero(breakpoint_[:, j])
+        curves[name] = (np.append(S[ks[:-1], j], above_max[j]), profit[ks, j])
+    return table.sort_values('profit', ascending=False), curves
+
+
+FRONTIER_COLS = ['approval_rate', 'loans_granted', 'profit', 'capital', 'roi',
+                 'expected_default_rate', 'default_rate']
+
+
+def approval_frontier(y_true, prob_default, disbursement, costs=DEFAULT_COSTS):
+    """
+    Every operating point of the rule "deny when P(Default) >= threshold",
+    from one sort: one row per distinct score plus "grant everything".
+
+    Columns: threshold, approval_rate, loans_granted, profit (net profit,
+    denied loans included), capital (disbursement granted), roi,
+    expected_default_rate (mean P(Default) of the granted loans),
+    default_rate (observed, granted loans) and pareto: True where no
+    higher approval rate earns at least as much profit, i.e. the points a
+    committee trading approval against profit would pick from.
+    """
+    scores = np.asarray(prob_default, dtype=np.float64).ravel()
+    truth = np.asarray(y_true).astype(np.int64, copy=False).ravel()
+    disbursement = np.asarray(disbursement, dtype=np.float64).ravel()
+    if not len(truth) == len(scores) == len(disbursement):
+        raise ValueError(f'length mismatch: y_true {len(truth)}, prob_default {len(scores)}, '
+                         f'disbursement {len(disbursement)}')
+    if len(truth) == 0:
+        raise ValueError('approval_frontier needs at least one loan')
+    grant, deny = loan_values(truth, disbursement, costs)
+    n = len(scores)
+
+    order = np.argsort(scores)
+    sorted_scores = scores[order]
+
+    def cumulative(values):
+        return np.concatenate([[0.0], np.cumsum(values[order])])
+
+    # k = loans granted at each breakpoint: before every distinct score, and all
+    starts = np.flatnonzero(np.concatenate([[True], sorted_scores[1:] != sorted_scores[:-1]]))
+    k = np.append(starts, n)
+    profit = deny.sum() + cumulative(grant - deny)[k]
+    capital = cumulative(disbursement)[k]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = pd.DataFrame({
+            'threshold': np.append(sorted_scores[starts], np.nextafter(sorted_scores[-1], np.inf)),
+            'approval_rate': k / n,
+            'loans_granted': k,
+            'profit': profit,
+            'capital': capital,
+            'roi': np.where(capital > 0, profit / capital, np.nan),
+            'expected_default_rate': cumulative(scores)[k] / k,
+            'default_rate': cumulative(truth.astype(np.float64))[k] / k,
+        })
+    # best profit among all higher approval rates (reverse running max)
+    better_later = np.append(np.maximum.accumulate(profit[::-1])[::-1][1:], -np.inf)
+    table['pareto'] = profit > better_later
+    return table
+
+
+def frontier_at(frontier, approval_rate=None, capital=None):
+    """
+    Frontier values at the given approval rates (or capital amounts),
+    linearly interpolated between neighbouring operating points, e.g.
+    frontier_at(table, approval_rate=[0.6, 0.7, 0.8]). threshold is the
+    one of the nearest point that approves at least that much.
+
+    Ratios undefined at the "grant nothing" row (roi and the default rates,
+    0 / 0) are interpolated over the defined rows only, so rates below the
+    first granted loan take the value of the first granted point.
+    """
+    if (approval_rate is None) == (capital is None):
+        raise ValueError('pass exactly one of approval_rate, capital')
+    key, query = ('approval_rate', approval_rate) if capital is None else ('capital', capital)
+    query = np.atleast_1d(np.asarray(query, dtype=np.float64))
+    x = frontier[key].to_numpy()
+
+    def interp(values):
+        defined = np.isfinite(values)
+        if not defined.any():
+            return np.full(len(query), np.nan)
+        return np.interp(query, x[defined], values[defined])
+
+    out = pd.DataFrame({col: interp(frontier[col].to_numpy(dtype=np.float64))
+                        for col in FRONTIER_COLS if col != key})
+    out.insert(0, key, query)
+    at_least = np.minimum(np.searchsorted(x, query, side='left'), len(x) - 1)
+    out.insert(0, 'threshold', frontier['threshold'].to_numpy()[at_least])
+    return out
@@ -0,0 +1,76 @@
+"""Derived loan features, computed in one columnar pass.
+
+    RealEstate      Term >= 240 months (loans that long are real-estate backed)
+    Recession       ApprovalDate within the 2007-12 .. 2009-06 recession
+    NAICS2          first two digits of NAICS, as a string ('0' when unknown)
+    GuaranteeRatio  SBA_Appv / GrAppv, NaN instead of inf when GrAppv is 0
+
+Everything works on the underlying NumPy arrays: integer comparisons and
+divisions, one datetime comparison and a per-distinct-code lookup for
+NAICS2, so no Python-level apply or string round-trip over the rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+REAL_ESTATE_TERM = 240
+RECESSION_START = pd.Timestamp('2007-12-01')
+RECESSION_END = pd.Timestamp('2009-06-30')
+
+# '0'..'99' as Python strings, indexed by the two-digit sector number
+_SECTOR_LABELS = np.array([str(i) for i in range(100)], dtype=object)
+_POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+
+
+def naics_sector(naics):
+    """
+    Leading two digits of each NAICS code as a string, the same as
+    naics.astype(int).astype(str).str[:2] for non-negative codes. Missing
+    codes give NaN.
+    """
+    if isinstance(getattr(naics, 'dtype', None), pd.CategoricalDtype):
+        # categories are the few thousand distinct codes: compute per code
+        cat = pd.Categorical(naics)
+        per_code = np.append(naics_sector(np.asarray(cat.categories)), np.nan)
+        return per_code[cat.codes]
+
+    values = np.asarray(naics, dtype=np.float64)
+    missing = np.isnan(values)
+    n = np.where(missing, 0, values).astype(np.int64)
+    # number of digits - 2, then drop that many trailing digits
+    shift = np.maximum(np.searchsorted(_POWERS_OF_TEN, n, side='right') - 2, 0)
+    sector = n // _POWERS_OF_TEN[shift]
+    out = _SECTOR_LABELS[sector]
+    out[missing] = np.nan
+    return out
+
+
+def derive_features(df):
+    """{column: array} of the derived features for df (df is not modified)."""
+    term = df['Term'].to_numpy()
+    approved = np.asarray(df['ApprovalDate'], dtype='datetime64[ns]')
+    sba_appv = df['SBA_Appv'].to_numpy(dtype=np.float64)
+    gr_appv = df['GrAppv'].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = sba_appv / gr_appv
+    ratio[gr_appv == 0] = np.nan
+
+    # NaT compares False on both sides, so missing dates are outside
+    recession = ((approved >= RECESSION_START.to_datetime64())
+                 & (approved <= RECESSION_END.to_datetime64()))
+
+    return {
+        'RealEstate': (term >= REAL_ESTATE_TERM).astype(np.int64),
+        'Recession': recession.astype(np.int64),
+        'NAICS2': naics_sector(df['NAICS']),
+        'GuaranteeRatio': ratio,
+    }
+
+
+def add_features(df):
+    """Add RealEstate, Recession, NAICS2 and GuaranteeRatio to df, in place."""
+    for col, values in derive_features(df).items():
+        df[col] = values
+    return df
@@ -0,0 +1,121 @@
+"""Typed, column-projected loader for SBAnational.csv.
+
+Only the columns the scripts actually use are read, each with an explicit
+dtype, and the currency / date / Y-N flag columns are decoded right after
+the read so every script starts from the same typed frame.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from sba.decoders import decode_currency, decode_dates, pa
+
+
+# Bump whenever SCHEMA or the decoding below changes (invalidates caches)
+SCHEMA_VERSION = 8
+
+# Raw text columns stay Arrow-backed when pyarrow is available, so the
+# decoders can read their bytes without building Python strings.
+RAW_STR = 'string[pyarrow]' if pa is not None else 'str'
+
+# Raw column -> dtype used by read_csv. Columns not listed here
+# (LoanNr_ChkDgt, Name, City, Zip, Bank, BankState) are never read.
+SCHEMA = {
+    'State':             'category',
+    'NAICS':             'int32',
+    'ApprovalDate':      RAW_STR,
+    'ApprovalFY':        'str',      # contains values like '1976A'
+    'Term':              'int32',
+    'NoEmp':             'int32',
+    'NewExist':          'Int8',     # has missing values
+    'CreateJob':         'int32',
+    'RetainedJob':       'int32',
+    'FranchiseCode':     'int32',
+    'UrbanRural':        'int8',
+    'RevLineCr':         'category',
+    'LowDoc':            'category',
+    'ChgOffDate':        RAW_STR,
+    'DisbursementDate':  RAW_STR,
+    'DisbursementGross': RAW_STR,
+    'BalanceGross':      RAW_STR,
+    'MIS_Status':        'category',
+    'ChgOffPrinGr':      RAW_STR,
+    'GrAppv':            RAW_STR,
+    'SBA_Appv':          RAW_STR,
+}
+
+CURRENCY_COLS = ['DisbursementGross', 'BalanceGross', 'GrAppv', 'SBA_Appv', 'ChgOffPrinGr']
+DATE_COLS = ['ApprovalDate', 'DisbursementDate', 'ChgOffDate']
+DATE_FORMAT = '%d-%b-%y'   # e.g. 28-Feb-97
+# Two-digit-year pivot: the file runs from the 1960s to the mid 2010s, so
+# years after DATE_MAX_YEAR belong to the previous century. Fixed (not the
+# current year) so the decoded frame, and its cache, never depend on the clock.
+DATE_MAX_YEAR = 2020
+
+# Binary flags derived from the categorical columns: raw value -> 0/1
+FLAG_MAPS = {
+    'MIS_Status_Binary': ('MIS_Status', {'P I F': 0, 'CHGOFF': 1}),
+    'LowDoc_Binary':     ('LowDoc',     {'Y': 1, 'N': 0}),
+    'RevLineCr_Binary':  ('RevLineCr',  {'Y': 1, 'N': 0}),
+}
+
+
+def decode_flag(cat, mapping):
+    """
+    Map a categorical column to a nullable Int8 0/1 flag through its
+    category codes. Integer (not float) so str-cast levels read '1', not
+    '1.0', whether or not a chunk has missing values.
+    """
+    cat = pd.Categorical(cat)
+    lut = np.array([mapping.get(c, np.nan) for c in cat.categories] + [np.nan], dtype='float64')
+    # code -1 (missing) picks the trailing NaN
+    return pd.array(lut[cat.codes], dtype='Int8')
+
+
+def decode_frame(df):
+    """
+    Decode the raw string columns of a frame read with SCHEMA, in place.
+
+    Malformed currency cells become NaN like missing ones; their row
+    positions are kept in df.attrs['malformed'][column].
+    """
+    for col in CURRENCY_COLS:
+        if col in df:
+            df[col], malformed = decode_currency(df[col])
+            if malformed.any():
+                rows = np.flatnonzero(malformed)
+                warnings.warn(f"{col}: {len(rows)} malformed value(s) set to NaN "
+                              f"(first rows: {rows[:5].tolist()})")
+                df.attrs.setdefault('malformed', {})[col] = rows.tolist()
+    for col in DATE_COLS:
+        if col in df:
+            df[col] = decode_dates(df[col], DATE_FORMAT, max_year=DATE_MAX_YEAR)
+    if 'ApprovalFY' in df:
+        # always float64: to_numeric gives int64 for a chunk with no '1976A'
+        # rows, and the str-cast levels would then read '1997' vs '1997.0'
+        df['ApprovalFY'] = pd.to_numeric(df['ApprovalFY'], errors='coerce').astype('float64')
+    if 'NAICS' in df:
+        df['NAICS'] = df['NAICS'].astype('category')
+
+    for flag, (col, mapping) in FLAG_MAPS.items():
+        if col in df:
+            df[flag] = decode_flag(df[col], mapping)
+    if 'UrbanRural' in df:
+        df['UrbanRural_Numeric'] = df['UrbanRural'].astype('Int8')
+    return df
+
+
+def load_sba(path='SBAnational.csv', usecols=None, nrows=None):
+    """
+    Read SBAnational.csv with an explicit schema and decode it in one go.
+
+    usecols: subset of SCHEMA keys to read (default: all of them)
+    nrows:   optional row limit, handy for quick experiments
+    """
+    usecols = list(SCHEMA) if usecols is None else list(usecols)
+    dtypes = {c: SCHEMA[c] for c in usecols}
+    df = pd.read_csv(path, usecols=usecols, dtype=dtypes, nrows=nrows,
+                     keep_default_na=True, low_memory=False)
+    return decode_frame(df)
@@ -0,0 +1,160 @@
+"""Macroeconomic series joined onto loans by approval year or month.
+
+Series live in CSV files (sba/data/macro_annual.csv ships the CPI
+inflation, real GDP growth and real interest rate used by the scripts).
+The first column is the key, `year` (e.g. 1987) or `month` ('1987-03');
+every other column is one series. Each series is held as a dense array
+offset by its first key, so joining it onto a frame is a single gather:
+
+    values[key - start]      (NaN outside the covered range / for gaps)
+
+Annual series are keyed on ApprovalFY, monthly ones on ApprovalDate.
+
+    registry = MacroRegistry.from_csv('sba/data/macro_annual.csv')
+    registry.load_csv('fed_funds_monthly.csv')    # month,FedFunds
+    registry.join(df_cleaned)
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+ANNUAL_FILE = os.path.join(DATA_DIR, 'macro_annual.csv')
+
+# Key column of each resolution in the frames being joined
+KEY_COLS = {'annual': 'ApprovalFY', 'monthly': 'ApprovalDate'}
+
+
+def year_keys(values):
+    """Fiscal years (int or float, NaN allowed) -> (int64 keys, valid mask)."""
+    years = np.asarray(values)
+    if years.dtype.kind in 'iu':
+        return years.astype(np.int64, copy=False), np.ones(len(years), dtype=bool)
+    if years.dtype.kind != 'f':
+        years = pd.to_numeric(pd.Series(years), errors='coerce').to_numpy()
+    years = years.astype(np.float64, copy=False)
+    valid = np.isfinite(years) & (years == np.floor(years))
+    return np.where(valid, years, 0).astype(np.int64), valid
+
+
+def month_keys(values):
+    """Dates -> (months since 1970-01 as int64, valid mask)."""
+    months = np.asarray(values)
+    if months.dtype.kind != 'M':
+        months = pd.to_datetime(pd.Series(months), errors='coerce').to_numpy()
+    months = months.astype('datetime64[M]')
+    valid = ~np.isnat(months)
+    return np.where(valid, months.astype(np.int64), 0), valid
+
+
+class MacroSeries:
+    """One series as a dense array: values[i] belongs to key start + i."""
+
+    def __init__(self, name, start, values, freq='annual'):
+        if freq not in KEY_COLS:
+            raise ValueError(f"freq must be one of {list(KEY_COLS)}, got {freq!r}")
+        self.name = name
+        self.start = int(start)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.freq = freq
+
+    @classmethod
+    def from_mapping(cls, name, mapping, freq='annual'):
+        """Build from a {key: value} dict (years, or month numbers since 1970-01)."""
+        keys = np.fromiter(mapping.keys(), dtype=np.int64)
+        start = keys.min()
+        values = np.full(keys.max() - start + 1, np.nan)
+        values[keys - start] = np.fromiter(mapping.values(), dtype=np.float64)
+        return cls(name, start, values, freq)
+
+    def keys(self, values):
+        return year_keys(values) if self.freq == 'annual' else month_keys(values)
+
+    def lookup(self, values):
+        """Gather the series for an array of years / dates; NaN where not covered."""
+        return self.gather(*self.keys(values))
+
+    def gather(self, keys, valid):
+        """values[keys - start] for already-computed keys (see year_keys / month_keys)."""
+        n = len(self.values)
+        idx = keys - self.start
+        # anything uncovered points at the NaN appended after the last value
+        idx = np.where(valid & (idx >= 0) & (idx < n), idx, n)
+        return np.append(self.values, np.nan).take(idx)
+
+
+class MacroRegistry:
+    """Named MacroSeries, joined onto loan frames in registration order."""
+
+    def __init__(self):
+        self.series = {}
+
+    def register(self, series):
+        self.series[series.name] = series
+        return self
+
+    def load_csv(self, path):
+        """Register every column of a `year,...` or `month,...` CSV file."""
+        table = pd.read_csv(path)
+        key_col = table.columns[0]
+        if key_col == 'year':
+            freq, keys = 'annual', table[key_col].to_numpy(dtype=np.int64)
+        elif key_col == 'month':
+            freq = 'monthly'
+            keys = pd.to_datetime(table[key_col], format='%Y-%m').to_numpy().astype('datetime64[M]')
+            keys = keys.astype(np.int64)
+        else:
+            raise ValueError(f"{path}: first column must be 'year' or 'month', got {key_col!r}")
+
+        start = keys.min()
+        for name in table.columns[1:]:
+            values = np.full(keys.max() - start + 1, np.nan)
+            values[keys - start] = table[name].to_numpy(dtype=np.float64)
+            self.register(MacroSeries(name, start, values, freq))
+        return self
+
+    @classmethod
+    def from_csv(cls, *paths):
+        registry = cls()
+        for path in paths:
+            registry.load_csv(path)
+        return registry
+
+    def join(self, df, key_cols=None):
+        """Add one column per registered series to df, in place."""
+        key_cols = {**KEY_COLS, **(key_cols or {})}
+        keys = {}   # freq -> (keys, valid), computed once per key column
+        for name, series in self.series.items():
+            if series.freq not in keys:
+                keys[series.freq] = series.keys(df[key_cols[series.freq]].to_numpy())
+            df[name] = series.gather(*keys[series.freq])
+        return df
+
+    def fingerprint(self):
+        """Digest of every series, for cache keys that depend on the macro data."""
+        h = hashlib.blake2b(digest_size=8)
+        for name, s in self.series.items():
+            h.update(f'{name}:{s.freq}:{s.start}:'.encode())
+            h.update(s.values.tobytes())
+        return h.hexdigest()
+
+
+_default_registry = None
+
+
+def default_registry():
+    """Registry with the series shipped in sba/data (loaded once)."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = MacroRegistry.from_csv(ANNUAL_FILE)
+    return _default_registry
+
+
+def add_macro(df, registry=None):
+    """Join the macro series (default: default_registry()) onto df, in place."""
+    registry = default_registry() if registry is None else registry
+    return registry.join(df)
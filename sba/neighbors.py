@@ -0,0 +1,333 @@
+"""Nearest-neighbour helpers for the KNN model.
+
+KNNGraphSearchCV runs the KNN grid (n_neighbors x weights x p) without
+recomputing neighbours per candidate: for every fold and every distinct
+neighbour search (p / metric / algorithm) the max(n_neighbors) nearest
+training loans of each validation loan are found once, and the
+probabilities of every n_neighbors / weights pair are read off those
+sorted (distance, label) arrays with cumulative sums.
+
+    grid_knn = KNNGraphSearchCV(pipe_knn, param_grid=param_grid_knn, cv=5, scoring='roc_auc')
+    grid_knn.fit(X_train, y_train)
+
+For the 64-candidate grid that is 2 neighbour searches per fold instead
+of 64. Loans tied at the same distance may be ordered differently than
+in a separate KNeighborsClassifier fit with a smaller n_neighbors, so
+scores can differ from GridSearchCV in the last digits on heavily tied
+(one-hot) data.
+
+ApproximateKNNClassifier scores the fitted model on large query sets
+(the whole test portfolio): neighbours are searched in a k-means
+partition of a truncated-SVD projection of the encoded matrix, re-ranked
+by exact distance, in chunks on several threads.
+
+    ann = ApproximateKNNClassifier(n_neighbors=31, n_components=32, n_probe=8)
+    ann.fit(X_train_enc, y_train).predict_proba(X_test_enc)
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, ClassifierMixin, clone, is_classifier
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import check_cv
+from sklearn.neighbors import NearestNeighbors
+from sklearn.pipeline import Pipeline
+
+from sba.search import FoldCache, ParallelSearchCV
+
+
+def neighbor_probas(distances, labels, n_classes, ks, weights='uniform'):
+    """
+    Class probabilities of k-NN votes for every k in ks, from one sorted
+    neighbour list: distances and labels (integer class codes) of shape
+    (n_queries, max_k). Returns {k: (n_queries, n_classes) array}.
+
+    weights='distance' follows KNeighborsClassifier: votes weigh 1 /
+    distance, and a query with a zero-distance neighbour among its k
+    only counts its zero-distance neighbours.
+    """
+    onehot = np.eye(n_classes)[labels]                      # (n, max_k, n_classes)
+    if weights == 'uniform':
+        votes = np.cumsum(onehot, axis=1)
+        return {k: votes[:, k - 1] / k for k in ks}
+    if weights != 'distance':
+        raise ValueError(f"weights must be 'uniform' or 'distance', got {weights!r}")
+
+    zero = distances == 0
+    with np.errstate(divide='ignore'):
+        inverse = np.where(zero, 0.0, 1.0 / distances)
+    votes = np.cumsum(onehot * inverse[:, :, None], axis=1)
+    zero_votes = np.cumsum(onehot * zero[:, :, None], axis=1)
+    out = {}
+    for k in ks:
+        v = np.where(zero_votes[:, k - 1].sum(axis=1, keepdims=True) > 0,
+                     zero_votes[:, k - 1], votes[:, k - 1])
+        out[k] = v / v.sum(axis=1, keepdims=True)
+    return out
+
+
+class _FixedProba(ClassifierMixin, BaseEstimator):
+    """Stand-in classifier returning precomputed probabilities, for the scorers."""
+
+    def __init__(self, classes, proba):
+        self.classes = classes
+        self.proba = proba
+        self.classes_ = classes
+
+    def predict_proba(self, X):
+        return self.proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.proba, axis=1)]
+
+
+class KNNGraphSearchCV(ParallelSearchCV):
+    """
+    Grid search for a KNeighborsClassifier (or a Pipeline ending in one)
+    that computes the neighbours once per fold and neighbour search.
+
+    Candidates are grouped by every parameter except n_neighbors and
+    weights; each group fits NearestNeighbors with those parameters and
+    the largest n_neighbors of the group on the fold's training rows.
+    Preprocessing steps are fitted once per fold through fold_cache;
+    searching their parameters is not supported here (use
+    ParallelSearchCV). Group x fold searches run on n_jobs threads.
+    Fitted attributes are those of ParallelSearchCV.
+    """
+
+    def __init__(self, estimator, param_grid, scoring=None, cv=5, n_jobs=None, refit=True,
+                 fold_cache=None, verbose=0):
+        super().__init__(estimator, param_grid=param_grid, scoring=scoring, cv=cv,
+                         n_jobs=n_jobs, refit=refit, fold_cache=fold_cache, verbose=verbose)
+
+    def fit(self, X, y):
+        y = y.to_numpy() if hasattr(y, 'to_numpy') else np.asarray(y)
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        folds = list(cv.split(X, y))
+        candidates = self._candidates()
+        if isinstance(self.estimator, Pipeline):
+            knn = self.estimator.steps[-1][1]
+            prefix = self.estimator.steps[-1][0] + '__'
+            if not all(key.startswith(prefix) for params in candidates for key in params):
+                raise ValueError('KNNGraphSearchCV only searches the KNeighborsClassifier step')
+            fold_cache = self.fold_cache if self.fold_cache is not None else FoldCache()
+            matrices = fold_cache.transformed(self.estimator[:-1], X, y, folds)
+        else:
+            knn, prefix = self.estimator, ''
+            matrices = [(X[train], X[test]) for train, test in folds]
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+
+        # group candidates by the neighbour search they need
+        groups = {}
+        for c, params in enumerate(candidates):
+            own = {key[len(prefix):]: value for key, value in params.items()}
+            search = {key: value for key, value in own.items() if key not in ('n_neighbors', 'weights')}
+            key = repr(sorted(search.items()))
+            groups.setdefault(key, (search, []))[1].append(
+                (c, own.get('n_neighbors', knn.n_neighbors), own.get('weights', knn.weights)))
+        classes, codes = np.unique(y, return_inverse=True)
+        tasks = [(g, f) for g in groups for f in range(len(folds))]
+        if self.verbose:
+            print(f'Fitting {len(folds)} folds for each of {len(candidates)} candidates from '
+                  f'{len(tasks)} neighbour searches')
+
+        def run(task):
+            g, f = task
+            search, members = groups[g]
+            (train, test), (X_train, X_test) = folds[f], matrices[f]
+            max_k = max(k for _, k, _ in members)
+            nn_params = {key: value for key, value in clone(knn).set_params(**search).get_params().items()
+                         if key in NearestNeighbors().get_params()}
+            start = time.perf_counter()
+            nn = NearestNeighbors(**dict(nn_params, n_neighbors=max_k)).fit(X_train)
+            distances, indices = nn.kneighbors(X_test)
+            labels = codes[train][indices]
+            per_fit = (time.perf_counter() - start) / len(members)
+            out = {}
+            for weights in {w for _, _, w in members}:
+                ks = sorted({k for _, k, w in members if w == weights})
+                probas = neighbor_probas(distances, labels, len(classes), ks, weights)
+                for c, k, w in members:
+                    if w == weights:
+                        stand_in = _FixedProba(classes, probas[k])
+                        out[c, f] = (float(scorer(stand_in, X_test, y[test])), per_fit, None)
+            return out
+
+        n_jobs = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(tasks)))) as pool:
+            for part in pool.map(run, tasks):
+                results.update(part)
+
+        self._collect(candidates, len(folds), results)
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y)
+        return self
+
+
+def _sq_distances(A, B, B_sq):
+    """Squared Euclidean distances between the rows of A and B (B_sq: row norms of B)."""
+    return np.maximum((A * A).sum(axis=1)[:, None] + B_sq[None, :] - 2 * (A @ B.T), 0)
+
+
+class ApproximateKNNClassifier(ClassifierMixin, BaseEstimator):
+    """
+    k-NN classifier that searches neighbours through an approximate index
+    instead of comparing each query with every training loan.
+
+    fit projects the encoded training matrix on n_components truncated-SVD
+    components and partitions the projection into n_cells k-means cells
+    (default sqrt(n_train)): a one-level k-means tree, built in process.
+    A query is projected the same way, probes its n_probe nearest cells,
+    and takes the n_neighbors * oversample loans of those cells closest to
+    it in the projection (Euclidean, which the SVD preserves best). The
+    candidates are re-ranked by their exact Minkowski-p distance in the
+    original space and the n_neighbors closest are kept, so returned
+    distances are exact.
+
+    Recall against exact search rises with n_probe, n_components and
+    oversample, and so does latency; recall() measures it on a sample.
+    Queries run in chunks of chunk_size rows on n_jobs threads (the
+    matrix products release the GIL). Probabilities use the same uniform /
+    distance votes as KNeighborsClassifier.
+    """
+
+    def __init__(self, n_neighbors=5, weights='uniform', p=2, n_components=32, n_cells=None,
+                 n_probe=16, oversample=4, chunk_size=10_000, n_jobs=None, random_state=0):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.p = p
+        self.n_components = n_components
+        self.n_cells = n_cells
+        self.n_probe = n_probe
+        self.oversample = oversample
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        y = y.to_numpy() if hasattr(y, 'to_numpy') else np.asarray(y)
+        X = X.tocsr() if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+        self.classes_, self._codes = np.unique(y, return_inverse=True)
+        self.n_features_in_ = X.shape[1]
+        if self.n_components < X.shape[1]:
+            self.svd_ = TruncatedSVD(n_components=self.n_components,
+                                     random_state=self.random_state).fit(X)
+        else:
+            self.svd_ = None                    # already low-dimensional: index X itself
+        Z = self._project(X)
+        n_cells = self.n_cells or max(1, int(np.sqrt(X.shape[0])))
+        self.kmeans_ = MiniBatchKMeans(n_clusters=min(n_cells, X.shape[0]), batch_size=4096,
+                                       n_init=3, random_state=self.random_state).fit(Z)
+        # cell members stored contiguously: members_[starts_[c]:starts_[c + 1]]
+        cells = self.kmeans_.labels_
+        self.members_ = np.argsort(cells, kind='stable')
+        self.starts_ = np.searchsorted(cells[self.members_], np.arange(self.kmeans_.n_clusters + 1))
+        self._Z = Z[self.members_]
+        self._Z_sq = (self._Z ** 2).sum(axis=1)
+        self._X = X
+        return self
+
+    def _project(self, X):
+        if self.svd_ is not None:
+            return self.svd_.transform(X)
+        return X.toarray() if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+
+    def _exact_distances(self, X, indices):
+        """Minkowski-p distances between each row of X and its candidate rows."""
+        n, m = indices.shape
+        diff = X[np.repeat(np.arange(n), m)] - self._X[indices.ravel()]
+        if sp.issparse(diff):
+            dist = np.asarray(abs(diff).power(self.p).sum(axis=1)).ravel()
+        else:
+            dist = (np.abs(diff) ** self.p).sum(axis=1)
+        return (dist ** (1.0 / self.p)).reshape(n, m)
+
+    def _candidates(self, Zq, m):
+        """Up to m nearest training rows (projection space) of each query, -1 padded."""
+        n = len(Zq)
+        centers = self.kmeans_.cluster_centers_
+        n_probe = min(self.n_probe, len(centers))
+        cell_dist = _sq_distances(Zq, centers, (centers ** 2).sum(axis=1))
+        probes = np.argpartition(cell_dist, n_probe - 1, axis=1)[:, :n_probe].ravel()
+        # running top-m per query, merged after every probed cell, so the
+        # buffers stay (n, m) however many cells are probed
+        best_d = np.full((n, m), np.inf)
+        best_i = np.full((n, m), -1)
+        # one matrix product per probed cell, over the queries probing it
+        order = np.argsort(probes, kind='stable')
+        bounds = np.searchsorted(probes[order], np.arange(len(centers) + 1))
+        for c in np.flatnonzero(np.diff(bounds)):
+            rows = order[bounds[c]:bounds[c + 1]] // n_probe
+            lo, hi = self.starts_[c], self.starts_[c + 1]
+            d = _sq_distances(Zq[rows], self._Z[lo:hi], self._Z_sq[lo:hi])
+            take = min(m, hi - lo)
+            if take < hi - lo:
+                top = np.argpartition(d, take - 1, axis=1)[:, :take]
+                d = np.take_along_axis(d, top, axis=1)
+            else:
+                top = np.broadcast_to(np.arange(take), d.shape)
+            # at most (rows, 2m) at a time
+            merged_d = np.hstack([best_d[rows], d])
+            merged_i = np.hstack([best_i[rows], self.members_[lo + top]])
+            keep = np.argpartition(merged_d, m - 1, axis=1)[:, :m]
+            best_d[rows] = np.take_along_axis(merged_d, keep, axis=1)
+            best_i[rows] = np.take_along_axis(merged_i, keep, axis=1)
+        keep = np.argsort(best_d, axis=1, kind='stable')[:, :m]
+        return np.take_along_axis(best_i, keep, axis=1)
+
+    def _query(self, X):
+        n_train = self._X.shape[0]
+        k = min(self.n_neighbors, n_train)
+        m = min(max(k, int(np.ceil(k * self.oversample))), n_train)
+        indices = self._candidates(self._project(X), m)
+        distances = np.where(indices >= 0, self._exact_distances(X, np.maximum(indices, 0)), np.inf)
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        # probed cells holding fewer than k loans: exact search for those queries
+        short = np.flatnonzero((indices < 0).any(axis=1))
+        if len(short):
+            nn = NearestNeighbors(n_neighbors=k, p=self.p, algorithm='brute').fit(self._X)
+            distances[short], indices[short] = nn.kneighbors(X[short])
+        return distances, indices
+
+    def kneighbors(self, X):
+        """(distances, indices) of the n_neighbors approximate nearest training rows."""
+        X = X.tocsr() if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+        chunks = [X[start:start + self.chunk_size] for start in range(0, X.shape[0], self.chunk_size)]
+        n_jobs = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+        with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(chunks)))) as pool:
+            parts = list(pool.map(self._query, chunks))
+        return np.vstack([d for d, _ in parts]), np.vstack([i for _, i in parts])
+
+    def predict_proba(self, X):
+        distances, indices = self.kneighbors(X)
+        k = distances.shape[1]
+        return neighbor_probas(distances, self._codes[indices], len(self.classes_),
+                               [k], self.weights)[k]
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def recall(self, X, n_samples=1000, random_state=0):
+        """
+        Share of the neighbours returned by kneighbors that are among the
+        exact n_neighbors nearest training rows (brute force, Minkowski-p in
+        the original space), on a random sample of n_samples rows of X. A
+        neighbour tied with the exact k-th distance counts as found.
+        """
+        rng = np.random.default_rng(random_state)
+        rows = rng.choice(X.shape[0], size=min(n_samples, X.shape[0]), replace=False)
+        X = X.tocsr()[rows] if sp.issparse(X) else np.asarray(X, dtype=np.float64)[rows]
+        approx, _ = self.kneighbors(X)
+        exact, _ = NearestNeighbors(n_neighbors=approx.shape[1], p=self.p,
+                                    algorithm='brute').fit(self._X).kneighbors(X)
+        return float(np.mean(approx <= exact[:, -1:] * (1 + 1e-9) + 1e-12))
@@ -0,0 +1,286 @@
+"""Regularization paths for the Ridge / Lasso logistic regressions.
+
+search_ridge / search_lasso used to fit every sampled C from scratch
+(saga, max_iter=5000). logistic_path fits one fold's whole C grid from
+strong to weak regularization instead, each fit warm-started from the
+previous coefficients. saga gains little from a warm start (its gradient
+memory restarts with every fit), so the path solves the same objective
+with solvers that do: proximal Newton (IRLS + coordinate descent) for L1
+and lbfgs for L2. Most points of the path then take one to three Newton
+steps, and the whole curve costs about as much as two cold saga fits.
+
+For the L1 model the sequential strong rule also shrinks every fit:
+with lambda = 1 / C (sklearn minimizes ||w||_1 + C * sum of log losses)
+and g = X^T (sample_weight * (y - p)) at the previous solution, a
+feature is left out of the next fit when
+
+    |g_j| < 2 * lambda_next - lambda_prev
+
+and after the fit the KKT condition |g_j| <= lambda_next is checked on
+the left-out features; any violators are added back and the fit is
+repeated. Lasso solutions at small C use a handful of columns, so most
+of the path is fitted on a small fraction of the design matrix.
+
+    search = LogisticPathCV(lasso_pipe, Cs=np.logspace(-4, 4, 20),
+                            class_weights=[None, 'balanced'], cv=5, scoring='roc_auc')
+    search.fit(X_train, y_train)
+    search.best_params_, search.best_score_, search.best_estimator_
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone, is_classifier
+from sklearn.linear_model import Lasso
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import check_cv
+from sklearn.pipeline import Pipeline
+from sklearn.utils.class_weight import compute_sample_weight
+
+from sba.search import FoldCache, ParallelSearchCV
+
+
+def is_l1(clf):
+    """True for an L1-penalized LogisticRegression (penalty='l1' or l1_ratio=1)."""
+    params = clf.get_params()
+    if params.get('penalty') == 'l1':
+        return True
+    return params.get('penalty') in ('elasticnet', 'deprecated', None) and params.get('l1_ratio') == 1
+
+
+def is_l2(clf):
+    """True for an L2-penalized LogisticRegression (penalty='l2' or l1_ratio=0)."""
+    params = clf.get_params()
+    if params.get('penalty') == 'l2':
+        return True
+    return params.get('penalty') in ('elasticnet', 'deprecated') and params.get('l1_ratio') == 0
+
+
+def _fitted_copy(clf, C, classes, coef, intercept, n_iter):
+    """A LogisticRegression with the given solution, usable like a fitted one."""
+    model = clone(clf).set_params(C=C, class_weight=None, warm_start=False)
+    model.classes_ = classes
+    model.coef_ = coef.reshape(1, -1).copy()
+    model.intercept_ = np.array([intercept])
+    model.n_features_in_ = len(coef)
+    model.n_iter_ = np.array([n_iter])
+    return model
+
+
+def _gradient(X, y, weights, coef, intercept):
+    """X^T (w * (y - p)): the log-loss gradient, up to sign, at (coef, intercept)."""
+    p = 1.0 / (1.0 + np.exp(-(X @ coef + intercept)))
+    return np.asarray(X.T @ (weights * (y - p))).ravel()
+
+
+def _l1_objective(X, y, weights, lam, coef, intercept):
+    z = X @ coef + intercept
+    return lam * np.abs(coef).sum() + weights @ (np.logaddexp(0, z) - y * z)
+
+
+def _fit_l1(X, y, weights, lam, coef, intercept, tol, max_iter=100):
+    """
+    Proximal Newton for lam * ||w||_1 + sum of weighted log losses: each
+    step solves the weighted least-squares (IRLS) approximation of the loss
+    with a warm-started Lasso (coordinate descent), then backtracks until
+    the objective decreases. Stops when it decreases by less than tol
+    (relative). Returns (coef, intercept, n_steps).
+    """
+    f = _l1_objective(X, y, weights, lam, coef, intercept)
+    for n_steps in range(1, max_iter + 1):
+        eta = X @ coef + intercept
+        p = 1.0 / (1.0 + np.exp(-eta))
+        v = np.maximum(p * (1 - p), 1e-6)
+        w = weights * v
+        # Lasso scales sample weights to sum to n_samples: alpha = lam / sum(w)
+        lasso = Lasso(alpha=lam / w.sum(), warm_start=True, tol=1e-4, max_iter=10_000)
+        lasso.coef_ = coef.copy()
+        lasso.fit(X, eta + (y - p) / v, sample_weight=w)
+        step = 1.0
+        while step >= 1e-3:
+            new_coef = coef + step * (lasso.coef_ - coef)
+            new_intercept = intercept + step * (lasso.intercept_ - intercept)
+            new_f = _l1_objective(X, y, weights, lam, new_coef, new_intercept)
+            if new_f <= f:
+                break
+            step /= 2
+        else:
+            break   # no descent along the Newton direction: at the optimum
+        coef, intercept = new_coef, float(new_intercept)
+        converged = f - new_f <= tol * abs(new_f)
+        f = new_f
+        if converged:
+            break
+    return coef, intercept, n_steps
+
+
+def logistic_path(clf, X, y, Cs, sample_weight=None, screen=True, max_step=1.5,
+                  dense_fraction=0.5, tol=1e-6):
+    """
+    Fit the LogisticRegression clf at every C (binary y), from the smallest
+    C up, warm-starting each fit from the previous solution.
+
+    The fits minimize clf's objective, but with solvers that actually gain
+    from a warm start (saga restarts its gradient memory every fit): L1
+    uses proximal Newton (IRLS steps solved by coordinate descent), L2
+    uses lbfgs, both to a relative tolerance tol. Other penalties fall
+    back to clf's own solver.
+
+    With L1 and screen=True, features are screened with the sequential
+    strong rule. The rule only discards anything when lambda_next >
+    lambda_prev / 2, so until a fit keeps more than dense_fraction of the
+    features the path adds intermediate values of C, at most max_step
+    apart, solved to the looser tolerance 100 * tol; once screening stops
+    pruning it goes straight to the requested values.
+
+    Returns (fits, active): fitted LogisticRegression copies, one per C in
+    the order given, and the number of features each fit used.
+    """
+    classes = np.unique(y)
+    if len(classes) != 2:
+        raise ValueError('logistic_path supports binary targets only')
+    y01 = (np.asarray(y) == classes[1]).astype(np.float64)
+    n, d = X.shape
+    weights = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    l1, l2 = is_l1(clf), is_l2(clf)
+    screen = screen and l1
+    X_cols = X.tocsc() if l1 and sp.issparse(X) else X   # fast column subsets
+
+    coef = np.zeros(d)
+    p0 = np.clip(weights @ y01 / weights.sum(), 1e-12, 1 - 1e-12)
+    intercept = np.log(p0 / (1 - p0))
+    lam_max = np.abs(_gradient(X, y01, weights, coef, intercept)).max()
+    # path state: lambda of the last fit, and whether screening still prunes
+    state = {'lam': lam_max, 'dense': not screen}
+
+    def solve(X_fit, C, start, intercept, tol):
+        if l1:
+            return _fit_l1(X_fit, y01, weights, 1.0 / C, start, intercept, tol)
+        params = {'solver': 'lbfgs', 'tol': tol} if l2 else {}
+        model = clone(clf).set_params(C=C, class_weight=None, warm_start=True, **params)
+        model.coef_ = start.reshape(1, -1)
+        model.intercept_ = np.array([intercept])
+        model.fit(X_fit, y01, sample_weight=weights)
+        return model.coef_.ravel(), float(model.intercept_[0]), int(np.max(model.n_iter_))
+
+    def step(C, tol):
+        nonlocal coef, intercept
+        lam = 1.0 / C
+        n_iter = 0
+        if screen:
+            grad = _gradient(X, y01, weights, coef, intercept)
+            keep = (np.abs(grad) >= 2 * lam - state['lam']) | (coef != 0)
+        else:
+            keep = np.ones(d, dtype=bool)
+        while not (l1 and lam >= lam_max):   # above lambda_max all L1 coefficients are zero
+            cols = np.flatnonzero(keep)
+            if len(cols):
+                if len(cols) == d:
+                    X_fit = X_cols if l1 else X
+                else:
+                    X_fit = X_cols[:, cols]
+                sub_coef, intercept, it = solve(X_fit, C, coef[cols], intercept, tol)
+                coef = np.zeros(d)
+                coef[cols] = sub_coef
+                n_iter += it
+            if not screen or keep.all():
+                break
+            # KKT check on the screened-out features
+            grad = _gradient(X, y01, weights, coef, intercept)
+            violators = ~keep & (np.abs(grad) > lam)
+            if not violators.any():
+                break
+            keep |= violators
+        state['lam'] = min(lam, lam_max)
+        state['dense'] = state['dense'] or keep.sum() > dense_fraction * d
+        return n_iter, int(keep.sum())
+
+    Cs = np.asarray(Cs, dtype=np.float64)
+    fits, active = [None] * len(Cs), [0] * len(Cs)
+    for C in np.unique(Cs):
+        while not state['dense'] and C * state['lam'] > max_step:
+            step(max_step / state['lam'], 100 * tol)
+        n_iter, n_active = step(C, tol)
+        for i in np.flatnonzero(Cs == C):
+            fits[i] = _fitted_copy(clf, C, classes, coef, intercept, n_iter)
+            active[i] = n_active
+    return fits, active
+
+
+class LogisticPathCV(ParallelSearchCV):
+    """
+    Cross-validated grid over C x class_weight for a LogisticRegression
+    (or a Pipeline ending in one), computed as one warm-started
+    regularization path per fold and class weight.
+
+    The preprocessing steps of a Pipeline are fitted once per fold
+    (shared through fold_cache like ParallelSearchCV); the (fold, class
+    weight) paths run on n_jobs threads (coordinate descent and the
+    sparse products release the GIL). The fitted attributes are those of
+    ParallelSearchCV, with candidates '<step>__C' and
+    '<step>__class_weight'; best_estimator_ is refitted on all of X at
+    the best pair.
+    """
+
+    def __init__(self, estimator, Cs=np.logspace(-4, 4, 20), class_weights=(None,), scoring=None,
+                 cv=5, n_jobs=None, refit=True, screen=True, fold_cache=None, verbose=0):
+        self.step = estimator.steps[-1][0] + '__' if isinstance(estimator, Pipeline) else ''
+        super().__init__(estimator,
+                         param_grid={self.step + 'C': list(Cs),
+                                     self.step + 'class_weight': list(class_weights)},
+                         scoring=scoring, cv=cv, n_jobs=n_jobs, refit=refit,
+                         fold_cache=fold_cache, verbose=verbose)
+        self.Cs = Cs
+        self.class_weights = class_weights
+        self.screen = screen
+
+    def fit(self, X, y):
+        y = y.to_numpy() if hasattr(y, 'to_numpy') else np.asarray(y)
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        folds = list(cv.split(X, y))
+        if isinstance(self.estimator, Pipeline):
+            clf = self.estimator.steps[-1][1]
+            fold_cache = self.fold_cache if self.fold_cache is not None else FoldCache()
+            matrices = fold_cache.transformed(self.estimator[:-1], X, y, folds)
+        else:
+            clf = self.estimator
+            matrices = [(X[train], X[test]) for train, test in folds]
+        scorer = check_scoring(clf, scoring=self.scoring)
+        Cs = np.asarray(self.Cs, dtype=np.float64)
+        candidates = self._candidates()
+        tasks = [(f, w) for f in range(len(folds)) for w in range(len(self.class_weights))]
+        if self.verbose:
+            print(f'Fitting {len(tasks)} regularization paths of {len(Cs)} values of C '
+                  f'({len(folds)} folds x {len(self.class_weights)} class weights)')
+
+        def run(task):
+            f, w = task
+            (train, test), (X_train, X_test) = folds[f], matrices[f]
+            weights = compute_sample_weight(self.class_weights[w], y[train])
+            start = time.perf_counter()
+            fits, active = logistic_path(clf, X_train, y[train], Cs, weights, self.screen)
+            per_fit = (time.perf_counter() - start) / len(Cs)
+            if self.verbose > 1:
+                print(f'[path fold {f}, class_weight={self.class_weights[w]}] '
+                      f'active features: {active}')
+            return [(float(scorer(model, X_test, y[test])), per_fit, None) for model in fits]
+
+        n_jobs = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+        with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(tasks)))) as pool:
+            paths = dict(zip(tasks, pool.map(run, tasks)))
+
+        # candidate index of every (C, class weight) pair
+        results = {}
+        for c, params in enumerate(candidates):
+            i = int(np.flatnonzero(Cs == params[self.step + 'C'])[0])
+            w = self.class_weights.index(params[self.step + 'class_weight'])
+            for f in range(len(folds)):
+                results[c, f] = paths[f, w][i]
+        self._collect(candidates, len(folds), results)
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y)
+        return self
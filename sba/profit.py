@@ -0,0 +1,215 @@
+"""Profit of a set of lending decisions under a cost matrix.
+
+Every loan falls into one cell of
+
+                      Paid in Full (0)    Default (1)
+    Grant (pred 0)    grant_pif           grant_default
+    Deny  (pred 1)    deny_pif            deny_default
+
+and earns (cell rate) * DisbursementGross. The project's cost matrix
+(see README) is +5% for a repaid loan, -25% for a default and -5%
+opportunity cost for a denied loan that would have been repaid.
+
+The totals are one np.bincount over the cell index, so a call over
+hundreds of thousands of loans costs a few milliseconds. profit_curve /
+optimal_threshold sweep the cutoff exactly with one sort, and
+cost_sensitivity repeats that for a whole grid of cost matrices.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import ConvexHull, QhullError
+
+
+class CostMatrix:
+    """Profit per dollar disbursed for each (decision, outcome) cell."""
+
+    def __init__(self, grant_pif=0.05, grant_default=-0.25, deny_pif=-0.05, deny_default=0.0):
+        self.grant_pif = grant_pif
+        self.grant_default = grant_default
+        self.deny_pif = deny_pif
+        self.deny_default = deny_default
+
+    def __repr__(self):
+        return (f'CostMatrix(grant_pif={self.grant_pif}, grant_default={self.grant_default}, '
+                f'deny_pif={self.deny_pif}, deny_default={self.deny_default})')
+
+    def rates(self):
+        """Rates in cell order: grant/PIF, grant/default, deny/PIF, deny/default."""
+        return np.array([self.grant_pif, self.grant_default, self.deny_pif, self.deny_default])
+
+
+DEFAULT_COSTS = CostMatrix()
+
+CELLS = ['grant_pif', 'grant_default', 'deny_pif', 'deny_default']
+
+
+def _cells(y_true, y_pred, disbursement):
+    """Cell index (2 * pred + truth) and disbursement as flat arrays."""
+    y_true = np.asarray(y_true).astype(np.int64, copy=False).ravel()
+    y_pred = np.asarray(y_pred).astype(np.int64, copy=False).ravel()
+    disbursement = np.asarray(disbursement, dtype=np.float64).ravel()
+    if not len(y_true) == len(y_pred) == len(disbursement):
+        raise ValueError(f'length mismatch: y_true {len(y_true)}, y_pred {len(y_pred)}, '
+                         f'disbursement {len(disbursement)}')
+    return 2 * y_pred + y_true, disbursement
+
+
+def cell_totals(y_true, y_pred, disbursement):
+    """(loan counts, disbursement totals) per cell, both length 4 in CELLS order."""
+    cell, disbursement = _cells(y_true, y_pred, disbursement)
+    counts = np.bincount(cell, minlength=4)
+    amounts = np.bincount(cell, weights=disbursement, minlength=4)
+    return counts, amounts
+
+
+def net_profit(y_true, y_pred, disbursement, costs=DEFAULT_COSTS):
+    """
+    Total profit in USD.
+    - y_true[i]: 0 = PIF, 1 = Default
+    - y_pred[i]: 0 = Grant loan, 1 = Deny loan
+    - disbursement[i]: DisbursementGross
+    """
+    _, amounts = cell_totals(y_true, y_pred, disbursement)
+    return float(amounts @ costs.rates())
+
+
+def rate_of_return(profit, y_pred, disbursement):
+    """profit / disbursement of the granted loans (NaN if nothing is granted)."""
+    granted = np.asarray(disbursement, dtype=np.float64)[np.asarray(y_pred) == 0].sum()
+    return profit / granted if granted > 0 else np.nan
+
+
+def loan_values(y_true, disbursement, costs=DEFAULT_COSTS):
+    """Per-loan profit if granted and if denied, as two float64 arrays."""
+    # with every loan granted, the cell index is just the outcome
+    truth, disbursement = _cells(y_true, np.zeros(len(disbursement), dtype=np.int64), disbursement)
+    rates = costs.rates()
+    return rates[truth] * disbursement, rates[2 + truth] * disbursement
+
+
+def profit_breakdown(y_true, y_pred, disbursement, costs=DEFAULT_COSTS):
+    """
+    Profit, ROI and per-cell totals as a dict:
+      profit, granted_disbursement, roi, and for every cell in CELLS
+      '<cell>_count', '<cell>_disbursement', '<cell>_profit'
+    """
+    counts, amounts = cell_totals(y_true, y_pred, disbursement)
+    cell_profit = amounts * costs.rates()
+    profit = float(cell_profit.sum())
+    granted = float(amounts[:2].sum())
+
+    out = {'profit': profit,
+           'granted_disbursement': granted,
+           'roi': profit / granted if granted > 0 else np.nan}
+    for i, cell in enumerate(CELLS):
+        out[f'{cell}_count'] = int(counts[i])
+        out[f'{cell}_disbursement'] = float(amounts[i])
+        out[f'{cell}_profit'] = float(cell_profit[i])
+    return out
+
+
+def profit_curve(y_true, prob_default, disbursement, costs=DEFAULT_COSTS):
+    """
+    Exact profit of the rule "deny when prob_default >= t" for every t
+    that changes a decision.
+
+    Returns (thresholds, profits): thresholds are the distinct scores in
+    increasing order followed by one value just above the largest score
+    (grant everything); profits[k] is net_profit at thresholds[k]. Any t
+    between two consecutive thresholds gives the profit of the upper one.
+
+    Scores are sorted once and the per-loan difference between granting
+    and denying is cumulatively summed, so the whole curve is O(n log n).
+    """
+    grant, deny = loan_values(y_true, disbursement, costs)
+    scores = np.asarray(prob_default, dtype=np.float64).ravel()
+    if len(scores) != len(grant):
+        raise ValueError(f'length mismatch: prob_default {len(scores)}, y_true {len(grant)}')
+    if len(scores) == 0:
+        raise ValueError('profit_curve needs at least one loan')
+
+    order = np.argsort(scores)
+    scores = scores[order]
+    gain = np.concatenate([[0.0], np.cumsum((grant - deny)[order])])
+
+    # first position of each distinct score: everything before it is granted
+    starts = np.flatnonzero(np.concatenate([[True], scores[1:] != scores[:-1]]))
+    thresholds = np.append(scores[starts], np.nextafter(scores[-1], np.inf))
+    profits = deny.sum() + gain[np.append(starts, len(scores))]
+    return thresholds, profits
+
+
+def optimal_threshold(y_true, prob_default, disbursement, costs=DEFAULT_COSTS):
+    """(threshold, max_profit) from profit_curve; the lowest threshold wins ties."""
+    thresholds, profits = profit_curve(y_true, prob_default, disbursement, costs)
+    best = np.argmax(profits)
+    return thresholds[best], profits[best]
+
+
+def cost_sensitivity(y_true, prob_default, disbursement, grant_pif=0.05, grant_default=-0.25,
+                     deny_pif=-0.05, deny_default=0.0):
+    """
+    Optimal threshold for every combination of cost-matrix rates.
+
+    Each rate may be a scalar or a list / array of values to sweep; the
+    full grid is evaluated. Returns one row per combination with the
+    rates, threshold, profit, approval_rate and roi.
+
+    With the k least risky loans granted, profit is linear in the rates:
+        deny_pif * PIF_total + deny_default * DEF_total
+          + (grant_pif - deny_pif) * PIF_granted[k]
+          + (grant_default - deny_default) * DEF_granted[k]
+    where PIF_granted / DEF_granted are cumulative disbursement of repaid
+    / defaulted loans in score order. The maximum of a linear function
+    over the points (PIF_granted[k], DEF_granted[k]) is always at a
+    vertex of their convex hull, so the scores are sorted once, the hull
+    is built once, and each combination only scans the hull vertices.
+    """
+    rates = np.meshgrid(*[np.atleast_1d(np.asarray(r, dtype=np.float64))
+                          for r in (grant_pif, grant_default, deny_pif, deny_default)],
+                        indexing='ij')
+    gp, gd, dp, dd = [r.ravel() for r in rates]
+
+    truth, disbursement = _cells(y_true, np.zeros(len(disbursement), dtype=np.int64), disbursement)
+    scores = np.asarray(prob_default, dtype=np.float64).ravel()
+    if len(scores) != len(truth):
+        raise ValueError(f'length mismatch: prob_default {len(scores)}, y_true {len(truth)}')
+    n = len(scores)
+    if n == 0:
+        raise ValueError('cost_sensitivity needs at least one loan')
+    order = np.argsort(scores)
+    scores = scores[order]
+    disb_sorted = disbursement[order]
+    is_default = truth[order] == 1
+    cum_pif = np.concatenate([[0.0], np.cumsum(np.where(is_default, 0.0, disb_sorted))])
+    cum_def = np.concatenate([[0.0], np.cumsum(np.where(is_default, disb_sorted, 0.0))])
+    total_pif, total_def = cum_pif[-1], cum_def[-1]
+
+    # candidate cutoffs: number of loans granted, at every distinct score or all of them
+    starts = np.flatnonzero(np.concatenate([[True], scores[1:] != scores[:-1]]))
+    granted = np.append(starts, n)
+    x = cum_pif[granted] / (total_pif or 1.0)
+    y = cum_def[granted] / (total_def or 1.0)
+    try:
+        candidates = np.sort(ConvexHull(np.column_stack([x, y])).vertices)
+    except (QhullError, ValueError):   # fewer than 3 points or all collinear
+        candidates = np.arange(len(granted))
+
+    # profit of every (hull vertex, rate combination); lowest cutoff wins ties
+    profits = ((dp * total_pif + dd * total_def)[None, :]
+               + np.outer(x[candidates], (gp - dp) * (total_pif or 1.0))
+               + np.outer(y[candidates], (gd - dd) * (total_def or 1.0)))
+    best = np.argmax(profits, axis=0)
+    k = granted[candidates[best]]
+    best_profit = profits[best, np.arange(len(best))]
+    granted_disb = cum_pif[k] + cum_def[k]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({
+            'grant_pif': gp, 'grant_default': gd, 'deny_pif': dp, 'deny_default': dd,
+            'threshold': np.where(k < n, scores[np.minimum(k, n - 1)], np.nextafter(scores[-1], np.inf)),
+            'profit': best_profit,
+            'approval_rate': k / n,
+            'roi': np.where(granted_disb > 0, best_profit / granted_disb, np.nan),
+        })
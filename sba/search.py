@@ -0,0 +1,424 @@
+"""Hyperparameter search over shared-memory training data.
+
+GridSearchCV / RandomizedSearchCV pickle the estimator and the data for
+the worker processes; with the large sparse design matrix that is slow
+and was the source of the pickle / broken-pipe failures that pinned
+grid_knn and search_rf to n_jobs=1. ParallelSearchCV instead
+
+  * writes X, y and the CV fold indices once to memory-mapped .npy files
+    (under /dev/shm when available, so they never touch the disk); a
+    CSR matrix is stored as its data / indices / indptr arrays and a
+    DataFrame column by column,
+  * writes the estimator and the candidate parameter sets once,
+  * sends each worker only a (candidate, fold) pair of integers; the
+    worker maps the shared files read-only the first time it needs them.
+
+Candidates of a Pipeline search usually differ only in the model step,
+so the preprocessing (scaler, one-hot / target encoders) is fitted once
+per fold and the transformed fold matrices are shared by every
+candidate; a FoldCache passed to several searches shares them across
+searches too.
+
+If a worker dies (out of memory, segfault), the pool is restarted and
+the unfinished fits are resubmitted; a fit that keeps killing its worker
+is scored error_score after max_retries restarts.
+
+    search = ParallelSearchCV(pipe_knn, param_grid=param_grid_knn, cv=5,
+                              scoring='roc_auc', n_jobs=-1)
+    search.fit(X_train, y_train)
+    search.best_estimator_, search.best_params_, search.best_score_
+"""
+
+import contextlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import traceback
+import warnings
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import joblib
+from joblib.externals import loky
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid, ParameterSampler, check_cv
+from sklearn.pipeline import Pipeline
+
+try:
+    import cloudpickle
+except ImportError:  # optional: only needed for estimators defined in the calling script
+    cloudpickle = None
+
+
+# ------------------------------------------------------------------------
+# Shared arrays
+# ------------------------------------------------------------------------
+
+def _save_array(folder, name, values):
+    path = os.path.join(folder, name + '.npy')
+    np.save(path, np.ascontiguousarray(values), allow_pickle=False)
+    return path
+
+
+def share_data(X, folder, name='X'):
+    """
+    Write X to memory-mappable files under folder and return a small,
+    picklable descriptor for attach_data. Handles ndarrays, scipy sparse
+    matrices (stored as CSR) and DataFrames (numeric columns mapped,
+    other columns pickled).
+    """
+    if sp.issparse(X):
+        X = sp.csr_matrix(X)
+        return {'kind': 'csr', 'shape': X.shape,
+                'data': _save_array(folder, name + '_data', X.data),
+                'indices': _save_array(folder, name + '_indices', X.indices),
+                'indptr': _save_array(folder, name + '_indptr', X.indptr)}
+    if isinstance(X, pd.DataFrame):
+        columns = []
+        for j, col in enumerate(X.columns):
+            values = X[col]
+            if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+                columns.append((col, 'npy', _save_array(folder, f'{name}_col{j}', values.to_numpy())))
+            else:
+                path = os.path.join(folder, f'{name}_col{j}.pkl')
+                values.reset_index(drop=True).to_pickle(path)
+                columns.append((col, 'pkl', path))
+        return {'kind': 'frame', 'columns': columns}
+    if isinstance(X, pd.Series):
+        X = X.to_numpy()
+    return {'kind': 'array', 'path': _save_array(folder, name, np.asarray(X))}
+
+
+def attach_data(descriptor):
+    """Rebuild the object described by share_data, backed by read-only memory maps."""
+    kind = descriptor['kind']
+    if kind == 'csr':
+        arrays = [np.load(descriptor[k], mmap_mode='r') for k in ('data', 'indices', 'indptr')]
+        return sp.csr_matrix(tuple(arrays), shape=descriptor['shape'], copy=False)
+    if kind == 'frame':
+        data = {}
+        for col, how, path in descriptor['columns']:
+            data[col] = np.load(path, mmap_mode='r') if how == 'npy' else pd.read_pickle(path)
+        return pd.DataFrame(data, copy=False)
+    return np.load(descriptor['path'], mmap_mode='r')
+
+
+def _take_rows(X, rows):
+    if isinstance(X, pd.DataFrame):
+        return X.iloc[rows]
+    return X[rows]
+
+
+# ------------------------------------------------------------------------
+# Worker side
+# ------------------------------------------------------------------------
+
+# Per-process cache of attached jobs: {job file: loaded job}
+_JOBS = {}
+
+
+def _load_job(job_path):
+    job = _JOBS.get(job_path)
+    if job is None:
+        with open(job_path, 'rb') as f:
+            job = pickle.load(f)
+        if 'Xt' in job:
+            job['Xt'] = [(attach_data(tr), attach_data(te)) for tr, te in job['Xt']]
+        else:
+            job['X'] = attach_data(job['X'])
+        job['y'] = attach_data(job['y'])
+        job['folds'] = [(np.load(tr, mmap_mode='r'), np.load(te, mmap_mode='r'))
+                        for tr, te in job['folds']]
+        _JOBS.clear()   # one search at a time per worker
+        _JOBS[job_path] = job
+    return job
+
+
+def _fit_and_score(job, candidate, fold):
+    """(score, fit_time, error message or None) for one candidate on one fold."""
+    train, test = job['folds'][fold]
+    y = job['y']
+    if 'Xt' in job:   # preprocessing already fitted on this fold
+        X_train, X_test = job['Xt'][fold]
+    else:
+        X_train, X_test = _take_rows(job['X'], train), _take_rows(job['X'], test)
+    start = time.perf_counter()
+    try:
+        estimator = clone(job['estimator']).set_params(**job['candidates'][candidate])
+        estimator.fit(X_train, y[train])
+        fit_time = time.perf_counter() - start
+        score = job['scorer'](estimator, X_test, y[test])
+        return float(score), fit_time, None
+    except Exception:
+        return job['error_score'], time.perf_counter() - start, traceback.format_exc()
+
+
+def _started_marker(job_path, candidate, fold):
+    return os.path.join(os.path.dirname(job_path), f'started_{candidate}_{fold}')
+
+
+def _run_task(job_path, candidate, fold):
+    # the marker tells the parent which fits were running if this worker dies
+    open(_started_marker(job_path, candidate, fold), 'w').close()
+    return _fit_and_score(_load_job(job_path), candidate, fold)
+
+
+# ------------------------------------------------------------------------
+# Search
+# ------------------------------------------------------------------------
+
+def _split_pipeline(estimator, candidates):
+    """
+    (preprocessing steps, last step, candidates with the step prefix
+    removed) when estimator is a Pipeline whose searched parameters all
+    belong to the last step; None otherwise.
+    """
+    if not isinstance(estimator, Pipeline) or len(estimator.steps) < 2:
+        return None
+    name = estimator.steps[-1][0]
+    prefix = name + '__'
+    if not all(key.startswith(prefix) for params in candidates for key in params):
+        return None
+    stripped = [{key[len(prefix):]: value for key, value in params.items()} for params in candidates]
+    return estimator[:-1], estimator.steps[-1][1], stripped
+
+
+class FoldCache:
+    """
+    Transformed CV folds, keyed by the preprocessing pipeline's
+    parameters, the data and the fold indices. In memory by default; with
+    folder the matrices are written there with joblib and read back as
+    memory maps, so they also survive between runs of a script.
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self._folds = {}
+
+    def _key(self, preprocessing, X, y, folds):
+        return joblib.hash((clone(preprocessing).get_params(deep=True), X, y,
+                            [(tr, te) for tr, te in folds]))
+
+    def transformed(self, preprocessing, X, y, folds):
+        """[(transformed train rows, transformed test rows)] for every fold."""
+        key = self._key(preprocessing, X, y, folds)
+        if key in self._folds:
+            return self._folds[key]
+        path = os.path.join(self.folder, key + '.joblib') if self.folder else None
+        if path and os.path.exists(path):
+            self._folds[key] = joblib.load(path, mmap_mode='r')
+            return self._folds[key]
+
+        out = []
+        for train, test in folds:
+            fitted = clone(preprocessing)
+            X_train = fitted.fit_transform(_take_rows(X, train), y[train])
+            out.append((X_train, fitted.transform(_take_rows(X, test))))
+        if path:
+            os.makedirs(self.folder, exist_ok=True)
+            joblib.dump(out, path)
+            out = joblib.load(path, mmap_mode='r')
+        self._folds[key] = out
+        return out
+
+
+def _shared_folder(temp_folder):
+    if temp_folder is None and os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        temp_folder = '/dev/shm'
+    return tempfile.mkdtemp(prefix='sba_search_', dir=temp_folder)
+
+
+class ParallelSearchCV:
+    """
+    Grid (param_grid) or randomized (param_distributions + n_iter) search
+    with cross-validation, run in a process pool over shared-memory data.
+    Attributes after fit follow GridSearchCV: cv_results_, best_index_,
+    best_params_, best_score_, best_estimator_ (refit on all of X), and
+    predict / predict_proba / score delegate to best_estimator_.
+
+    n_jobs: worker processes (None / -1 = all CPUs, 1 = run in this
+    process). error_score: score of fits that raise or keep crashing
+    their worker. temp_folder: where the shared files go (default
+    /dev/shm, else the system temp dir); they are removed after fit.
+
+    When the estimator is a Pipeline and the candidates only set
+    parameters of its last step, the earlier steps (scaler, encoders) are
+    fitted once per fold and the transformed fold matrices are shared by
+    all candidates (cache_preprocessing=False turns this off). Pass the
+    same FoldCache as fold_cache to several searches over the same data
+    and folds (e.g. Ridge and Lasso) to reuse the matrices across them.
+    """
+
+    def __init__(self, estimator, param_grid=None, param_distributions=None, n_iter=10,
+                 scoring=None, cv=5, n_jobs=None, refit=True, random_state=None,
+                 error_score=np.nan, max_retries=2, temp_folder=None, cache_preprocessing=True,
+                 fold_cache=None, verbose=0):
+        if (param_grid is None) == (param_distributions is None):
+            raise ValueError('pass exactly one of param_grid, param_distributions')
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.param_distributions = param_distributions
+        self.n_iter = n_iter
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.refit = refit
+        self.random_state = random_state
+        self.error_score = error_score
+        self.max_retries = max_retries
+        self.temp_folder = temp_folder
+        self.cache_preprocessing = cache_preprocessing
+        self.fold_cache = fold_cache
+        self.verbose = verbose
+
+    def _candidates(self):
+        if self.param_grid is not None:
+            return list(ParameterGrid(self.param_grid))
+        return list(ParameterSampler(self.param_distributions, self.n_iter,
+                                     random_state=self.random_state))
+
+    def fit(self, X, y):
+        y = y.to_numpy() if isinstance(y, pd.Series) else np.asarray(y)
+        candidates = self._candidates()
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        folds = list(cv.split(X, y))
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+        tasks = [(c, f) for c in range(len(candidates)) for f in range(len(folds))]
+        n_jobs = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+        if self.verbose:
+            print(f'Fitting {len(folds)} folds for each of {len(candidates)} candidates, '
+                  f'totalling {len(tasks)} fits on {min(n_jobs, len(tasks))} worker(s)')
+
+        job = {'estimator': self.estimator, 'candidates': candidates, 'scorer': scorer,
+               'error_score': self.error_score}
+        split = _split_pipeline(self.estimator, candidates) if self.cache_preprocessing else None
+        if split is not None:
+            # candidates only differ in the last step: fit the preprocessing
+            # once per fold and let every candidate reuse the matrices
+            preprocessing, final, final_candidates = split
+            fold_cache = self.fold_cache if self.fold_cache is not None else FoldCache()
+            job.update(estimator=final, candidates=final_candidates,
+                       Xt=fold_cache.transformed(preprocessing, X, y, folds))
+        if n_jobs == 1:
+            job.update(X=X, y=y, folds=folds)
+            results = {t: _fit_and_score(job, *t) for t in tasks}
+        else:
+            results = self._run_pool(job, X, y, folds, tasks, n_jobs)
+
+        self._collect(candidates, len(folds), results)
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y)
+        return self
+
+    def _run_pool(self, job, X, y, folds, tasks, n_jobs):
+        folder = _shared_folder(self.temp_folder)
+        try:
+            job = dict(job, y=share_data(y, folder, 'y'))
+            if 'Xt' in job:
+                job['Xt'] = [(share_data(tr, folder, f'Xt{i}_train'), share_data(te, folder, f'Xt{i}_test'))
+                             for i, (tr, te) in enumerate(job['Xt'])]
+            else:
+                job['X'] = share_data(X, folder, 'X')
+            job['folds'] = [(_save_array(folder, f'train{i}', tr), _save_array(folder, f'test{i}', te))
+                            for i, (tr, te) in enumerate(folds)]
+            # cloudpickle: estimators defined in the calling script travel by value
+            job_path = os.path.join(folder, 'job.pkl')
+            with open(job_path, 'wb') as f:
+                (cloudpickle or pickle).dump(job, f)
+
+            results = {}
+            pending = list(tasks)
+            while pending:
+                crashed = self._submit(job_path, pending, min(n_jobs, len(pending)), results)
+                if not crashed:
+                    break
+                # only the fits that had started can have killed the worker;
+                # rerun each of them alone, then the rest in parallel again
+                suspects = [t for t in pending
+                            if t not in results and os.path.exists(_started_marker(job_path, *t))]
+                if not suspects:
+                    raise RuntimeError('worker processes died before starting any fit')
+                warnings.warn(f'worker process died; retrying {len(suspects)} fits one at a time')
+                for t in suspects:
+                    for _ in range(self.max_retries):
+                        with contextlib.suppress(FileNotFoundError):   # worker may die before writing it
+                            os.remove(_started_marker(job_path, *t))
+                        if not self._submit(job_path, [t], 1, results):
+                            break
+                    if t not in results:
+                        results[t] = (self.error_score, np.nan, f'fit {t} killed its worker process')
+                pending = [t for t in pending if t not in results]
+            return results
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _submit(self, job_path, tasks, n_workers, results):
+        """Run tasks in a fresh pool, filling results; True if a worker died."""
+        # loky workers start clean (no fork of this process's BLAS / OpenMP
+        # threads) and do not re-run the calling script's top-level code
+        with loky.ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {pool.submit(_run_task, job_path, *t): t for t in tasks}
+            crashed = False
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except BrokenProcessPool:
+                    crashed = True
+                    continue
+                if self.verbose > 1:
+                    c, f = futures[future]
+                    print(f'[CV fold {f}] candidate {c}: score={results[futures[future]][0]:.4f}')
+        return crashed
+
+    def _collect(self, candidates, n_folds, results):
+        scores = np.array([[results[c, f][0] for f in range(n_folds)]
+                           for c in range(len(candidates))], dtype=np.float64)
+        fit_times = np.array([[results[c, f][1] for f in range(n_folds)]
+                              for c in range(len(candidates))], dtype=np.float64)
+        errors = [msg for _, _, msg in results.values() if msg is not None]
+        if errors:
+            warnings.warn(f'{len(errors)} of {len(results)} fits failed; first error:\n{errors[0]}')
+
+        mean = scores.mean(axis=1)
+        ranked = np.where(np.isnan(mean), -np.inf, mean)
+        rank = np.empty(len(mean), dtype=np.int32)
+        rank[np.argsort(-ranked, kind='stable')] = np.arange(1, len(mean) + 1)
+        self.cv_results_ = {
+            'params': candidates,
+            'mean_fit_time': fit_times.mean(axis=1),
+            'mean_test_score': mean,
+            'std_test_score': scores.std(axis=1),
+            'rank_test_score': rank,
+        }
+        for f in range(n_folds):
+            self.cv_results_[f'split{f}_test_score'] = scores[:, f]
+        for key in sorted({k for p in candidates for k in p}):
+            values = np.empty(len(candidates), dtype=object)   # keeps tuples as single values
+            for i, p in enumerate(candidates):
+                values[i] = p.get(key)
+            self.cv_results_[f'param_{key}'] = np.ma.masked_array(
+                values, mask=[key not in p for p in candidates])
+        self.best_index_ = int(np.argmax(ranked))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = float(mean[self.best_index_])
+        self.n_splits_ = n_folds
+
+    @property
+    def classes_(self):
+        return self.best_estimator_.classes_
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+    def score(self, X, y):
+        return check_scoring(self.best_estimator_, scoring=self.scoring)(self.best_estimator_, X, y)
@@ -0,0 +1,150 @@
+"""Profit-optimal thresholds per segment (State, NAICS2, RealEstate, ...).
+
+One global cutoff treats a Florida restaurant and a Texas manufacturer
+alike. segment_thresholds finds the cutoff that maximizes net profit
+separately inside every segment:
+
+    by = df_model.loc[idx_test, ['State', 'NAICS2']]
+    table = segment_thresholds(by, y_test.values, probs_rf_default, disb_test, min_loans=500)
+    y_pred_seg = apply_segment_thresholds(by, probs_rf_default, table)
+
+All segments are handled together: one sort by (segment, score), one
+cumulative sum of grant-minus-deny profit that is re-based at every
+segment start, and a per-segment argmax over the candidate cutoffs, so
+the cost does not depend on the number of segments.
+"""
+
+import numpy as np
+import pandas as pd
+
+from sba.profit import DEFAULT_COSTS, loan_values, optimal_threshold
+
+
+def segment_codes(by):
+    """
+    Series / array / DataFrame of segment labels -> (int codes, labels
+    Index). Each column is factorized on its own and the column codes are
+    combined arithmetically, so a DataFrame never goes through tuples.
+    """
+    columns = [by[c] for c in by.columns] if isinstance(by, pd.DataFrame) else [np.asarray(by)]
+    combined = np.zeros(len(columns[0]), dtype=np.int64)
+    uniques = []
+    for col in columns:
+        codes, levels = pd.factorize(col)
+        if (codes < 0).any():
+            raise ValueError('segment labels contain missing values')
+        combined = combined * len(levels) + codes
+        uniques.append(levels)
+    codes, seen = pd.factorize(combined)
+
+    # split the combined code of every segment back into its column levels
+    level_codes = []
+    for levels in reversed(uniques):
+        seen, rest = np.divmod(seen, len(levels))
+        level_codes.append(rest)
+    level_codes.reverse()
+    if isinstance(by, pd.DataFrame):
+        labels = pd.MultiIndex.from_arrays([levels[c] for levels, c in zip(uniques, level_codes)],
+                                           names=list(by.columns))
+    else:
+        labels = pd.Index(uniques[0][level_codes[0]], name=getattr(by, 'name', None))
+    return codes, labels
+
+
+def segment_thresholds(by, y_true, prob_default, disbursement, min_loans=100, costs=DEFAULT_COSTS):
+    """
+    Optimal cutoff (deny when P(Default) >= threshold) for every segment.
+
+    Segments with fewer than min_loans loans are too small to trust their
+    own optimum and fall back to the global optimal threshold (marked in
+    the uses_global column).
+
+    Returns one row per segment: loans, defaults, threshold,
+    uses_global, profit (at the threshold used), global_profit (at the
+    global threshold), uplift and approval_rate.
+    """
+    codes, labels = segment_codes(by)
+    scores = np.asarray(prob_default, dtype=np.float64).ravel()
+    truth = np.asarray(y_true).astype(np.int64, copy=False).ravel()
+    grant, deny = loan_values(truth, disbursement, costs)
+    if not len(codes) == len(scores) == len(grant):
+        raise ValueError(f'length mismatch: by {len(codes)}, prob_default {len(scores)}, '
+                         f'y_true {len(grant)}')
+    n, n_seg = len(scores), len(labels)
+
+    # by score, then stably by segment: loans grouped by segment, each
+    # group in increasing score order
+    order = np.argsort(scores)
+    order = order[np.argsort(codes[order], kind='stable')]
+    seg, sc = codes[order], scores[order]
+    cum = np.concatenate([[0.0], np.cumsum((grant - deny)[order])])
+
+    loans = np.bincount(codes, minlength=n_seg)
+    seg_end = np.cumsum(loans)
+    seg_start = seg_end - loans
+    seg_deny = np.bincount(codes, weights=deny, minlength=n_seg)
+
+    # candidate cutoffs: first loan of each distinct score within a segment,
+    # plus one past the segment's last loan (grant the whole segment)
+    new_seg = np.concatenate([[True], seg[1:] != seg[:-1]])
+    brk = new_seg | np.concatenate([[True], sc[1:] != sc[:-1]])
+    cand_pos = np.concatenate([np.flatnonzero(brk), seg_end[loans > 0]])
+    cand_seg = np.concatenate([seg[brk], np.flatnonzero(loans > 0)])
+    ordering = np.lexsort((cand_pos, cand_seg))
+    cand_pos, cand_seg = cand_pos[ordering], cand_seg[ordering]
+
+    profit = seg_deny[cand_seg] + cum[cand_pos] - cum[seg_start[cand_seg]]
+
+    # per-segment argmax (lowest cutoff on ties): max per segment, then the
+    # first candidate reaching it
+    first = np.flatnonzero(np.concatenate([[True], cand_seg[1:] != cand_seg[:-1]]))
+    seg_max = np.maximum.reduceat(profit, first)
+    hits = np.flatnonzero(profit == seg_max[np.searchsorted(cand_seg[first], cand_seg)])
+    _, best_idx = np.unique(cand_seg[hits], return_index=True)
+    best = hits[best_idx]
+    best_seg, best_pos = cand_seg[best], cand_pos[best]
+
+    own_threshold = np.full(n_seg, np.nan)
+    own_profit = np.full(n_seg, np.nan)
+    inside = best_pos < seg_end[best_seg]
+    own_threshold[best_seg] = np.where(inside, sc[np.minimum(best_pos, n - 1)],
+                                       np.nextafter(sc[best_pos - 1], np.inf))
+    own_profit[best_seg] = profit[best]
+    own_granted = np.zeros(n_seg, dtype=np.int64)
+    own_granted[best_seg] = best_pos - seg_start[best_seg]
+
+    # global cutoff and what it earns inside each segment
+    global_threshold, _ = optimal_threshold(truth, scores, disbursement, costs)
+    granted = scores < global_threshold
+    global_profit = np.bincount(codes, weights=np.where(granted, grant, deny), minlength=n_seg)
+    global_granted = np.bincount(codes, weights=granted, minlength=n_seg)
+
+    uses_global = loans < min_loans
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = pd.DataFrame({
+            'loans': loans,
+            'defaults': np.bincount(codes, weights=truth, minlength=n_seg).astype(np.int64),
+            'threshold': np.where(uses_global, global_threshold, own_threshold),
+            'uses_global': uses_global,
+            'profit': np.where(uses_global, global_profit, own_profit),
+            'global_profit': global_profit,
+            'approval_rate': np.where(uses_global, global_granted, own_granted) / loans,
+        }, index=labels)
+    table['uplift'] = table['profit'] - table['global_profit']
+    return table.sort_index()
+
+
+def apply_segment_thresholds(by, prob_default, table, default_threshold=None):
+    """
+    Decisions (1 = deny, 0 = grant) using each loan's segment threshold
+    from segment_thresholds. Segments missing from the table (e.g. a
+    State seen only in new data) use default_threshold; without one they
+    raise ValueError.
+    """
+    codes, labels = segment_codes(by)
+    thresholds = table['threshold'].reindex(labels).to_numpy(dtype=np.float64)
+    if np.isnan(thresholds).any():
+        if default_threshold is None:
+            raise ValueError('segments without a threshold; pass default_threshold')
+        thresholds = np.where(np.isnan(thresholds), default_threshold, thresholds)
+    return (np.asarray(prob_default, dtype=np.float64).ravel() >= thresholds[codes]).astype(int)
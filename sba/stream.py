@@ -0,0 +1,137 @@
+"""Chunked processing of SBAnational-format files larger than memory.
+
+The file is read `chunksize` rows at a time; every chunk is decoded,
+cleaned, joined with the macro series and encoded on its own, so memory
+stays bounded by the chunk size rather than by the file size.
+
+    encoder = fit_encoder('SBAnational.csv')              # pass 1: levels only
+    write_shards('SBAnational.csv', 'shards/', encoder)    # pass 2: encoded shards
+    probs_default, y, disb, index = score_shards(best_rf, 'shards/')
+
+With a HashingEncoder the layout is fixed up front, so the first pass is
+skipped and files with new franchise codes can be scored by the same model:
+
+    write_shards('SBAnational.csv', 'shards/', HashingEncoder(CATEGORICAL_COLS))
+
+Each shard holds the sparse design matrix (sba.encoding.design_matrix,
+saved with scipy.sparse.save_npz) plus y, DisbursementGross and the row
+index as .npy files, so scoring never materializes the dense dummies.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from sba.clean import CATEGORICAL_COLS, NUMERIC_COLS, TARGET, clean_loans, model_frame
+from sba.encoding import DummyEncoder, design_matrix
+from sba.loader import SCHEMA, decode_frame
+
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def iter_raw_chunks(path, chunksize=DEFAULT_CHUNKSIZE, usecols=None):
+    """Typed, decoded chunks of the raw file (what load_sba returns, in pieces)."""
+    usecols = list(SCHEMA) if usecols is None else list(usecols)
+    reader = pd.read_csv(path, usecols=usecols, dtype={c: SCHEMA[c] for c in usecols},
+                         chunksize=chunksize, low_memory=False)
+    for raw in reader:
+        yield decode_frame(raw)
+
+
+def iter_clean_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Chunks of df_cleaned; the index keeps the row position in the file."""
+    for raw in iter_raw_chunks(path, chunksize):
+        yield clean_loans(raw)
+
+
+def iter_model_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Chunks of df_model (FEATURES + TARGET, NA rows dropped)."""
+    for chunk in iter_clean_chunks(path, chunksize):
+        yield model_frame(chunk)
+
+
+def fit_encoder(path, chunksize=DEFAULT_CHUNKSIZE, encoder=None):
+    """Collect the categorical vocabulary over the whole file."""
+    encoder = DummyEncoder(CATEGORICAL_COLS) if encoder is None else encoder
+    for chunk in iter_model_chunks(path, chunksize):
+        encoder.partial_fit(chunk)
+    return encoder
+
+
+def group_default_rates(path, by, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streaming version of
+        df_cleaned.groupby(by)['MIS_Status_Binary'].agg(loan_count='size', default_rate='mean')
+    """
+    parts = []
+    for chunk in iter_clean_chunks(path, chunksize):
+        g = chunk.groupby(by, observed=True)[TARGET]
+        parts.append(pd.DataFrame({'loan_count': g.size(), 'n': g.count(), 'defaults': g.sum()}))
+    totals = pd.concat(parts).groupby(level=list(range(len(parts[0].index.names)))).sum()
+    totals.index.names = parts[0].index.names
+    totals['default_rate'] = totals['defaults'] / totals['n'].where(totals['n'] > 0)
+    return totals[['loan_count', 'default_rate']].reset_index()
+
+
+def write_shards(path, out_dir, encoder=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode the file chunk by chunk into out_dir/part-NNNNN/ shards.
+
+    Fits a DummyEncoder first (an extra pass) when no encoder is given; a
+    HashingEncoder needs no fitting. Returns the list of shard directories.
+    """
+    if encoder is None:
+        encoder = fit_encoder(path, chunksize)
+    os.makedirs(out_dir, exist_ok=True)
+
+    shards = []
+    for i, chunk in enumerate(iter_model_chunks(path, chunksize)):
+        name = f'part-{i:05d}'
+        shard = os.path.join(out_dir, name)
+        os.makedirs(shard, exist_ok=True)
+        X, _ = design_matrix(chunk, encoder, NUMERIC_COLS)
+        sp.save_npz(os.path.join(shard, 'X.npz'), X, compressed=False)
+        np.save(os.path.join(shard, 'y.npy'), chunk[TARGET].to_numpy(dtype='int8'))
+        np.save(os.path.join(shard, 'disb.npy'), chunk['DisbursementGross'].to_numpy(dtype='float64'))
+        np.save(os.path.join(shard, 'index.npy'), chunk.index.to_numpy())
+        shards.append({'name': name, 'nrows': len(chunk)})
+
+    manifest = {'feature_names': list(NUMERIC_COLS) + encoder.feature_names_, 'shards': shards}
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    return [os.path.join(out_dir, s['name']) for s in shards]
+
+
+def iter_shards(out_dir):
+    """
+    Yield (X, y, disbursement, index) per shard; X is the CSR design matrix
+    (numeric columns first, same layout as the scripts' X_train / X_test).
+    """
+    with open(os.path.join(out_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    for s in manifest['shards']:
+        shard = os.path.join(out_dir, s['name'])
+        yield (sp.load_npz(os.path.join(shard, 'X.npz')),
+               np.load(os.path.join(shard, 'y.npy')),
+               np.load(os.path.join(shard, 'disb.npy'), mmap_mode='r'),
+               np.load(os.path.join(shard, 'index.npy')))
+
+
+def score_shards(model, out_dir):
+    """
+    predict_proba over every shard.
+
+    Returns (probs_default, y_true, disbursement, index) as flat arrays,
+    ready for net_profit / tune_threshold.
+    """
+    probs, ys, disb, index = [], [], [], []
+    for X, y, d, idx in iter_shards(out_dir):
+        probs.append(model.predict_proba(X)[:, 1])
+        ys.append(y)
+        disb.append(d)
+        index.append(idx)
+    return np.concatenate(probs), np.concatenate(ys), np.concatenate(disb), np.concatenate(index)
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from sba.encoding import HashingEncoder
+
+
+def test_hashing_ignores_int_vs_float_levels():
+    # the same loan, once from a chunk where ApprovalFY parsed as int64 and
+    # once from one where it parsed as float64 (str-cast '1997' vs '1997.0')
+    as_int = pd.DataFrame({'ApprovalFY': np.array([1997], dtype=np.int64),
+                           'UrbanRural_Numeric': np.array([1], dtype=np.int64)})
+    as_float = as_int.astype(np.float64)
+    encoder = HashingEncoder(['ApprovalFY', 'UrbanRural_Numeric'])
+
+    X_int = encoder.transform_sparse(as_int)
+    X_float = encoder.transform_sparse(as_float)
+
+    assert (X_int != X_float).nnz == 0
+    assert X_int.nnz == 2
@@ -0,0 +1,40 @@
+import csv
+
+from sba.clean import CATEGORICAL_COLS, clean_loans, model_frame
+from sba.encoding import DummyEncoder
+from sba.loader import load_sba
+from sba.stream import fit_encoder
+
+
+HEADER = ['LoanNr_ChkDgt', 'Name', 'City', 'State', 'Zip', 'Bank', 'BankState', 'NAICS',
+          'ApprovalDate', 'ApprovalFY', 'Term', 'NoEmp', 'NewExist', 'CreateJob',
+          'RetainedJob', 'FranchiseCode', 'UrbanRural', 'RevLineCr', 'LowDoc', 'ChgOffDate',
+          'DisbursementDate', 'DisbursementGross', 'BalanceGross', 'MIS_Status',
+          'ChgOffPrinGr', 'GrAppv', 'SBA_Appv']
+
+
+def loan(i, fy):
+    year = fy.rstrip('A')
+    return [1000000000 + i, 'ACME, INC.', 'X', ['NY', 'OH', 'CA'][i % 3], 12345, 'BANK', 'CA',
+            [811111, 445291, 0][i % 3], f'06-Apr-{year[2:]}', fy, [60, 84, 240][i % 3],
+            5, ['1.0', '2.0', ''][i % 3], 0, 2, [1, 0, 2008][i % 3], i % 3,
+            ['Y', 'N', '0'][i % 3], ['N', 'Y', 'N'][i % 3], '', f'19-May-{year[2:]}',
+            '$50,000.00 ', '$0.00 ', ['P I F', 'CHGOFF'][i % 2], '$0.00 ',
+            '$50,000.00 ', '$25,000.00 ']
+
+
+def test_chunked_vocabulary_matches_whole_file(tmp_path):
+    # the first chunk has only plain years (read as int64 on its own), the
+    # second one a '1976A' that makes its ApprovalFY float64
+    years = ['1997', '2007', '2008', '1999', '1976A', '1997', '2007', '2001']
+    path = tmp_path / 'loans.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(loan(i, fy) for i, fy in enumerate(years))
+
+    whole = DummyEncoder(CATEGORICAL_COLS).fit(model_frame(clean_loans(load_sba(path))))
+    chunked = fit_encoder(path, chunksize=4)
+
+    assert chunked.feature_names_ == whole.feature_names_
+    assert '1997.0' in whole.levels_['ApprovalFY']